@@ -0,0 +1,333 @@
+"""Fake Freebox OS server to exercise the integration without real hardware.
+
+Serves the part of the Freebox OS API used by freebox_home: application
+registration and login, system config, home nodes, home endpoints and the
+/ws/event websocket. Synthetic nodes are generated for each category and
+every response can be delayed by a fixed latency plus a random jitter.
+
+The server speaks plain HTTP. Run it on its own so it does not share the
+CPU and event loop of the process being measured:
+
+    python bench/fake_freebox.py --port 8888 --pir 10 --shutter 5 --latency 0.05 --jitter 0.02
+
+GET /bench/stats returns the request counters, POST /bench/reset clears them.
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from aiohttp import WSMsgType, web
+
+API_PREFIX  = "/api/{version}/"
+CATEGORIES  = ["pir", "dws", "shutter", "basic_shutter", "opener", "alarm", "camera", "kfb"]
+
+
+def _endpoint(ep_id: int, ep_type: str, name: str, value: Any = None, value_type: str = "bool") -> Dict[str, Any]:
+    return {
+        "id": ep_id,
+        "ep_type": ep_type,
+        "name": name,
+        "label": name.replace("_", " ").capitalize(),
+        "value": value,
+        "value_type": value_type,
+        "visibility": "normal",
+        "ui": {"access": "r" if ep_type == "signal" else "w", "display": "text"},
+    }
+
+
+def _sensor_endpoints() -> List[Dict[str, Any]]:
+    return [
+        _endpoint(0, "signal", "trigger", True),
+        _endpoint(1, "signal", "battery", 100, "int"),
+        _endpoint(2, "signal", "cover", False),
+    ]
+
+
+def _shutter_endpoints() -> List[Dict[str, Any]]:
+    return [
+        _endpoint(0, "slot", "position_set", 0, "int"),
+        _endpoint(1, "slot", "stop", None, "void"),
+        _endpoint(2, "slot", "toggle", None, "void"),
+        _endpoint(4, "signal", "position_set", 0, "int"),
+        _endpoint(5, "signal", "state", "stopped", "string"),
+    ]
+
+
+def _basic_shutter_endpoints() -> List[Dict[str, Any]]:
+    return [
+        _endpoint(0, "slot", "up", None, "void"),
+        _endpoint(1, "slot", "stop", None, "void"),
+        _endpoint(2, "slot", "down", None, "void"),
+        _endpoint(3, "signal", "state", False),
+    ]
+
+
+def _alarm_endpoints() -> List[Dict[str, Any]]:
+    names = ["trigger", "alarm1", "alarm2", "skip", "off", "pin", "sound", "volume", "timeout1", "timeout2", "timeout3"]
+    endpoints = [_endpoint(index, "slot", name, None, "void") for index, name in enumerate(names)]
+    signals = [("state", "idle", "string"), ("alarm2", True, "bool"), ("pin", "0000", "string"), ("sound", 2, "int"),
+               ("volume", 100, "int"), ("timeout1", 15, "int"), ("timeout2", 15, "int"), ("timeout3", 60, "int"),
+               ("battery", 100, "int")]
+    for index, (name, value, value_type) in enumerate(signals, start=len(names)):
+        endpoints.append(_endpoint(index, "signal", name, value, value_type))
+    return endpoints
+
+
+def _camera_endpoints() -> List[Dict[str, Any]]:
+    endpoints = [_endpoint(0, "slot", "flip", False), _endpoint(1, "slot", "detection", False)]
+    signals = [("detection", False), ("activation", True), ("quality", True), ("sensitivity", 3), ("threshold", 2),
+               ("flip", False), ("timestamp", True), ("volume", 80), ("sound_detection", False), ("sound_trigger", 50),
+               ("rtsp", True), ("disk", "")]
+    for index, (name, value) in enumerate(signals, start=2):
+        endpoints.append(_endpoint(index, "signal", name, value))
+    return endpoints
+
+
+def _kfb_endpoints() -> List[Dict[str, Any]]:
+    return [_endpoint(0, "signal", "pushed", None, "int"), _endpoint(1, "signal", "battery", 100, "int")]
+
+
+ENDPOINTS = {
+    "pir": _sensor_endpoints,
+    "dws": _sensor_endpoints,
+    "shutter": _shutter_endpoints,
+    "opener": _shutter_endpoints,
+    "basic_shutter": _basic_shutter_endpoints,
+    "alarm": _alarm_endpoints,
+    "camera": _camera_endpoints,
+    "kfb": _kfb_endpoints,
+}
+
+INHERIT = {"shutter": "node::ios", "opener": "node::ios", "basic_shutter": "node::rts"}
+
+
+def make_node(node_id: int, category: str) -> Dict[str, Any]:
+    """Return a node shaped like an item of the home/nodes answer."""
+    endpoints = ENDPOINTS[category]()
+    props: Dict[str, Any] = {"FwVersion": "1.0.0"}
+    if category == "camera":
+        props["Stream"] = f"rtsp://127.0.0.1/fake/{node_id}"
+    return {
+        "id": node_id,
+        "label": f"{category} {node_id}",
+        "name": f"node_{node_id}",
+        "category": category,
+        "status": "active",
+        "props": props,
+        "show_endpoints": endpoints,
+        "signal_links": [],
+        "slot_links": [],
+        "type": {
+            "inherit": INHERIT.get(category, f"node::domus::{category}"),
+            "endpoints": [{k: v for k, v in endpoint.items() if k not in ("value", "ui")} for endpoint in endpoints],
+        },
+    }
+
+
+class FakeFreebox:
+    """In-memory Freebox with synthetic nodes and simulated activity."""
+
+    def __init__(self, counts: Dict[str, int], latency: float = 0.0, jitter: float = 0.0,
+                 motion_rate: float = 0.05, seed: Optional[int] = None) -> None:
+        self._random = random.Random(seed)
+        self.latency = latency
+        self.jitter = jitter
+        self.motion_rate = motion_rate
+        self.nodes: Dict[int, Dict[str, Any]] = {}
+        self.requests: Counter = Counter()
+        self.started = time.monotonic()
+        self._sockets: List[web.WebSocketResponse] = []
+
+        node_id = 1
+        for category in CATEGORIES:
+            for _ in range(counts.get(category, 0)):
+                self.nodes[node_id] = make_node(node_id, category)
+                node_id += 1
+
+    def app(self) -> web.Application:
+        app = web.Application(middlewares=[self._middleware])
+        prefix = API_PREFIX.format(version="{version}")
+        app.router.add_get("/api_version", self.api_version)
+        app.router.add_post(prefix + "login/authorize/", self.authorize)
+        app.router.add_get(prefix + "login/authorize/{track_id}", self.authorize_status)
+        app.router.add_get(prefix + "login", self.challenge)
+        app.router.add_get(prefix + "login/", self.challenge)
+        app.router.add_post(prefix + "login/session/", self.session)
+        app.router.add_post(prefix + "login/logout", self.ok)
+        app.router.add_post(prefix + "login/logout/", self.ok)
+        app.router.add_get(prefix + "system/", self.system)
+        app.router.add_get(prefix + "home/nodes", self.home_nodes)
+        app.router.add_get(prefix + "home/endpoints/{node_id}/{endpoint_id}", self.get_endpoint)
+        app.router.add_put(prefix + "home/endpoints/{node_id}/{endpoint_id}", self.set_endpoint)
+        app.router.add_post(prefix + "home/endpoints/get", self.get_endpoints)
+        app.router.add_get(prefix + "ws/event", self.websocket)
+        app.router.add_get("/bench/stats", self.stats)
+        app.router.add_post("/bench/reset", self.reset)
+        app.on_startup.append(self._start_activity)
+        return app
+
+    @web.middleware
+    async def _middleware(self, request: web.Request, handler):
+        if not request.path.startswith("/bench/"):
+            self.requests[request.method + " " + (request.match_info.route.resource.canonical
+                                                  if request.match_info.route.resource else request.path)] += 1
+            delay = self.latency + self._random.uniform(-self.jitter, self.jitter)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        return await handler(request)
+
+    @staticmethod
+    def _result(result: Any = None) -> web.Response:
+        return web.json_response({"success": True, "result": result})
+
+    async def api_version(self, request: web.Request) -> web.Response:
+        return web.json_response({"api_version": "8.0", "api_base_url": "/api/", "device_type": "FreeboxServer7,1"})
+
+    async def authorize(self, request: web.Request) -> web.Response:
+        return self._result({"app_token": "fake-app-token", "track_id": 1})
+
+    async def authorize_status(self, request: web.Request) -> web.Response:
+        return self._result({"status": "granted", "challenge": "fake"})
+
+    async def challenge(self, request: web.Request) -> web.Response:
+        return self._result({"logged_in": False, "challenge": "fake-challenge"})
+
+    async def session(self, request: web.Request) -> web.Response:
+        return self._result({"session_token": "fake-session", "permissions": {"home": True, "camera": True}})
+
+    async def ok(self, request: web.Request) -> web.Response:
+        return self._result()
+
+    async def system(self, request: web.Request) -> web.Response:
+        return self._result({"mac": "00:24:D4:00:00:01", "model_info": {"name": "fbxgw7-r1/full"}})
+
+    async def home_nodes(self, request: web.Request) -> web.Response:
+        return self._result(list(self.nodes.values()))
+
+    def _find(self, request: web.Request) -> Optional[Dict[str, Any]]:
+        node = self.nodes.get(int(request.match_info["node_id"]))
+        if node is None:
+            return None
+        endpoint_id = int(request.match_info["endpoint_id"])
+        return next((endpoint for endpoint in node["show_endpoints"] if endpoint["id"] == endpoint_id), None)
+
+    async def get_endpoint(self, request: web.Request) -> web.Response:
+        endpoint = self._find(request)
+        if endpoint is None:
+            return web.json_response({"success": False, "error_code": "invalid_request"})
+        return self._result({"value": endpoint["value"], "value_type": endpoint["value_type"], "refresh": 2000})
+
+    async def get_endpoints(self, request: web.Request) -> web.Response:
+        values = []
+        for item in await request.json():
+            node = self.nodes.get(item["node_id"])
+            endpoint = next((endpoint for endpoint in node["show_endpoints"] if endpoint["id"] == item["ep_id"]), None) if node else None
+            if endpoint is None:
+                return web.json_response({"success": False, "error_code": "invalid_request"})
+            values.append({"node_id": item["node_id"], "ep_id": item["ep_id"], "value": endpoint["value"]})
+        return self._result(values)
+
+    async def set_endpoint(self, request: web.Request) -> web.Response:
+        node = self.nodes.get(int(request.match_info["node_id"]))
+        endpoint = self._find(request)
+        if node is None or endpoint is None:
+            return web.json_response({"success": False, "error_code": "invalid_request"})
+        value = (await request.json()).get("value")
+        if endpoint["name"] == "position_set":
+            self._set_value(node, "position_set", value)
+        elif endpoint["name"] in ("alarm1", "alarm2"):
+            self._set_value(node, "state", endpoint["name"] + "_armed")
+        elif endpoint["name"] == "off":
+            self._set_value(node, "state", "idle")
+        elif endpoint["name"] in ("up", "down"):
+            self._set_value(node, "state", endpoint["name"] == "down")
+        return self._result()
+
+    def _set_value(self, node: Dict[str, Any], name: str, value: Any) -> None:
+        for endpoint in node["show_endpoints"]:
+            if endpoint["name"] == name and endpoint["ep_type"] == "signal":
+                endpoint["value"] = value
+                self._broadcast(node["id"], endpoint["id"], value)
+
+    def _broadcast(self, node_id: int, endpoint_id: int, value: Any) -> None:
+        message = {"action": "notification", "success": True, "source": "home", "event": "node_endpoint_value",
+                   "result": {"node_id": node_id, "ep_id": endpoint_id, "value": value}}
+        for ws in list(self._sockets):
+            asyncio.ensure_future(ws.send_json(message))
+
+    async def websocket(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self._sockets.append(ws)
+        try:
+            async for msg in ws:
+                if msg.type == WSMsgType.TEXT and msg.json().get("action") == "register":
+                    await ws.send_json({"action": "register", "success": True})
+        finally:
+            self._sockets.remove(ws)
+        return ws
+
+    async def _start_activity(self, app: web.Application) -> None:
+        app["activity"] = asyncio.ensure_future(self._activity())
+
+    async def _activity(self) -> None:
+        """Each second, trigger some motion/door sensors for two seconds."""
+        sensors = [node for node in self.nodes.values() if node["category"] in ("pir", "dws")]
+        while True:
+            await asyncio.sleep(1)
+            for node in sensors:
+                if self._random.random() < self.motion_rate:
+                    self._set_value(node, "trigger", False)
+                    asyncio.get_running_loop().call_later(2, self._set_value, node, "trigger", True)
+
+    async def stats(self, request: web.Request) -> web.Response:
+        elapsed = time.monotonic() - self.started
+        total = sum(self.requests.values())
+        return web.json_response({
+            "elapsed": elapsed,
+            "total": total,
+            "per_second": total / elapsed if elapsed else 0,
+            "requests": dict(self.requests),
+            "nodes": len(self.nodes),
+        })
+
+    async def reset(self, request: web.Request) -> web.Response:
+        self.requests.clear()
+        self.started = time.monotonic()
+        return self._result()
+
+
+def counts_for(devices: int) -> Dict[str, int]:
+    """Spread a number of devices over the categories, with a single alarm."""
+    counts = {category: 0 for category in CATEGORIES}
+    counts["alarm"] = 1
+    others = [category for category in CATEGORIES if category != "alarm"]
+    for index in range(max(devices - 1, 0)):
+        counts[others[index % len(others)]] += 1
+    return counts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8888)
+    parser.add_argument("--devices", type=int, help="spread this many devices over all the categories")
+    for category in CATEGORIES:
+        parser.add_argument("--" + category, type=int, default=0, help=f"number of {category} nodes")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to each answer")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random +/- seconds added to the latency")
+    parser.add_argument("--motion-rate", type=float, default=0.05, help="probability per second for a sensor to trigger")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    counts = counts_for(args.devices) if args.devices else {category: getattr(args, category) for category in CATEGORIES}
+    fake = FakeFreebox(counts, args.latency, args.jitter, args.motion_rate, args.seed)
+    web.run_app(fake.app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""Load benchmark of the integration against the fake Freebox.
+
+For each device count, a fake Freebox (fake_freebox.py) is started in its
+own process, then a Home Assistant instance is booted in another process
+with the integration set up through its config flow. After a warm-up the
+run is measured and the following figures are reported:
+
+- requests per second received by the fake Freebox
+- event loop lag of Home Assistant (mean, p95 and max)
+- CPU time used by Home Assistant per second of run
+- resident memory of Home Assistant and number of entities
+
+Usage (Home Assistant and the integration requirements must be installed):
+
+    python bench/run_benchmark.py --devices 10 50 200 --duration 60 --latency 0.02 --jitter 0.01
+
+The fake Freebox speaks plain HTTP, so Freepybox is pointed at it with an
+http:// base URL instead of the https:// one it uses for a real box.
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from pathlib import Path
+from typing import Any, Dict, List
+
+BENCH_DIR       = Path(__file__).resolve().parent
+COMPONENT_DIR   = BENCH_DIR.parent / "custom_components" / "freebox_home"
+LAG_INTERVAL    = 0.1
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for_port(port: int, timeout: float = 10) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"The fake Freebox did not start on port {port}")
+
+
+def _rss_mb() -> float:
+    """Current resident memory, falls back to the peak one outside Linux."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def _probe_loop_lag(samples: List[float]) -> None:
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(LAG_INTERVAL)
+        samples.append(loop.time() - start - LAG_INTERVAL)
+
+
+async def _fake_stats(session, port: int, action: str = "stats") -> Dict[str, Any]:
+    url = f"http://127.0.0.1:{port}/bench/{action}"
+    method = session.get if action == "stats" else session.post
+    async with method(url) as resp:
+        return await resp.json()
+
+
+async def async_measure(args: argparse.Namespace) -> Dict[str, Any]:
+    """Boot Home Assistant with the integration and measure one run."""
+    import aiohttp
+    from freebox_api import Freepybox
+    from homeassistant import bootstrap, config_entries, runner
+    from homeassistant.const import CONF_HOST, CONF_PORT
+
+    sys.path.insert(0, str(COMPONENT_DIR.parent.parent))
+    from custom_components.freebox_home.const import CONF_USE_PUSH, DOMAIN
+
+    Freepybox._get_base_url = lambda self, host, port, api_version: f"http://{host}:{port}/api/{api_version}/"
+
+    config_dir = Path(tempfile.mkdtemp(prefix="freebox_home_bench_"))
+    (config_dir / "custom_components").mkdir()
+    (config_dir / "custom_components" / "freebox_home").symlink_to(COMPONENT_DIR)
+    (config_dir / "configuration.yaml").write_text("homeassistant:\n  name: bench\nlogger:\n  default: warning\n")
+
+    hass = await bootstrap.async_setup_hass(runner.RuntimeConfig(config_dir=str(config_dir), skip_pip=True))
+    await hass.async_start()
+
+    started = time.perf_counter()
+    flow = hass.config_entries.flow
+    result = await flow.async_init(DOMAIN, context={"source": config_entries.SOURCE_USER},
+                                   data={CONF_HOST: "127.0.0.1", CONF_PORT: args.port})
+    result = await flow.async_configure(result["flow_id"], {})
+    result = await flow.async_configure(result["flow_id"], {})
+    entry = result["result"]
+    await hass.async_block_till_done()
+    if args.push:
+        hass.config_entries.async_update_entry(entry, options={**entry.options, CONF_USE_PUSH: True})
+        await hass.async_block_till_done()
+    setup_time = time.perf_counter() - started
+
+    await asyncio.sleep(args.warmup)
+
+    lag: List[float] = []
+    async with aiohttp.ClientSession() as session:
+        await _fake_stats(session, args.port, "reset")
+        probe = asyncio.ensure_future(_probe_loop_lag(lag))
+        cpu = time.process_time()
+        await asyncio.sleep(args.duration)
+        cpu = time.process_time() - cpu
+        probe.cancel()
+        fake = await _fake_stats(session, args.port)
+
+    router = hass.data[DOMAIN][entry.unique_id]
+    lag.sort()
+    measure = {
+        "devices":          fake["nodes"],
+        "entities":         len(hass.states.async_all()),
+        "setup_s":          setup_time,
+        "requests_per_s":   fake["per_second"],
+        "requests":         fake["requests"],
+        "lag_mean_ms":      statistics.fmean(lag) * 1000 if lag else 0,
+        "lag_p95_ms":       lag[int(len(lag) * 0.95)] * 1000 if lag else 0,
+        "lag_max_ms":       lag[-1] * 1000 if lag else 0,
+        "cpu_per_s":        cpu / args.duration,
+        "rss_mb":           _rss_mb(),
+        "executor":         router.executor.stats,
+    }
+    await hass.async_stop()
+    return measure
+
+
+def _run_child(args: argparse.Namespace) -> None:
+    measure = asyncio.run(async_measure(args))
+    print(json.dumps(measure))
+
+
+def _run_one(devices: int, args: argparse.Namespace) -> Dict[str, Any]:
+    port = _free_port()
+    fake = subprocess.Popen([
+        sys.executable, str(BENCH_DIR / "fake_freebox.py"), "--port", str(port), "--devices", str(devices),
+        "--latency", str(args.latency), "--jitter", str(args.jitter), "--seed", "1",
+    ])
+    try:
+        _wait_for_port(port)
+        command = [sys.executable, __file__, "--child", "--port", str(port),
+                   "--duration", str(args.duration), "--warmup", str(args.warmup)]
+        if args.push:
+            command.append("--push")
+        child = subprocess.run(command, check=True, stdout=subprocess.PIPE, text=True)
+        return json.loads(child.stdout.strip().splitlines()[-1])
+    finally:
+        fake.terminate()
+        fake.wait()
+
+
+def _print_table(measures: List[Dict[str, Any]]) -> None:
+    columns = [
+        ("devices", "devices", "{:d}"),
+        ("entities", "entities", "{:d}"),
+        ("setup_s", "setup s", "{:.2f}"),
+        ("requests_per_s", "req/s", "{:.2f}"),
+        ("lag_mean_ms", "lag ms", "{:.2f}"),
+        ("lag_p95_ms", "p95 ms", "{:.2f}"),
+        ("lag_max_ms", "max ms", "{:.2f}"),
+        ("cpu_per_s", "cpu s/s", "{:.3f}"),
+        ("rss_mb", "rss MB", "{:.1f}"),
+    ]
+    print("  ".join(f"{title:>9}" for _, title, _ in columns))
+    for measure in measures:
+        print("  ".join(f"{fmt.format(measure[key]):>9}" for key, _, fmt in columns))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--duration", type=float, default=60, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=10, help="seconds to wait after the setup")
+    parser.add_argument("--latency", type=float, default=0.02, help="latency of the fake Freebox")
+    parser.add_argument("--jitter", type=float, default=0.01, help="jitter of the fake Freebox")
+    parser.add_argument("--push", action="store_true", help="enable the event websocket option")
+    parser.add_argument("--json", help="also write the raw measures to this file")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _run_child(args)
+        return
+
+    measures = [_run_one(devices, args) for devices in args.devices]
+    _print_table(measures)
+    if args.json:
+        Path(args.json).write_text(json.dumps(measures, indent=2))
+
+
+if __name__ == "__main__":
+    main()
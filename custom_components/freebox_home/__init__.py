@@ -1,21 +1,26 @@
 """Support for Freebox devices (Freebox v6 and Freebox mini 4K)."""
 import asyncio
 import logging
+import time
 import voluptuous as vol
 
 from homeassistant.config_entries import SOURCE_DISCOVERY, ConfigEntry
 from homeassistant.const import CONF_HOST, CONF_PORT, EVENT_HOMEASSISTANT_STOP
 from homeassistant.helpers import config_validation as cv, discovery
 from homeassistant.core import HomeAssistant
+from homeassistant.exceptions import ConfigEntryAuthFailed, ConfigEntryNotReady
 
-from freebox_api.exceptions import AuthorizationError, HttpRequestError
+from freebox_api.exceptions import AuthorizationError, HttpRequestError, InsufficientPermissionsError
 
-from .const import DOMAIN, PLATFORMS
+from .const import DOMAIN, PLATFORMS, CONF_USE_PUSH, DEFAULT_USE_PUSH
+from .nodes_cache import FreeboxNodesCache
 from .router import (FreeboxRouter, get_api, remove_config)
+from .services import async_setup_services
 
 _LOGGER = logging.getLogger(__name__)
 
 async def async_setup(hass, config):
+    await async_setup_services(hass)
     return True
 
 
@@ -23,20 +28,55 @@ async def async_setup(hass, config):
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry):
     """Set up Freebox component."""
 
+    start = phase_start = time.monotonic()
+
+    def log_phase(phase):
+        nonlocal phase_start
+        now = time.monotonic()
+        _LOGGER.debug("Startup: %s took %.3fs", phase, now - phase_start)
+        phase_start = now
+
+    # With the nodes of the previous run, the entities do not wait for the Freebox
+    nodes_cache = FreeboxNodesCache(hass, entry)
+    await nodes_cache.async_load()
+    cached = len(nodes_cache.nodes) > 0
+    log_phase("nodes cache")
+
     try:
-        api         = await get_api(hass, entry.data[CONF_HOST], entry.data[CONF_PORT])
-        fbx_config  = await api.system.get_config()
+        api         = await get_api(hass, entry.data[CONF_HOST], entry.data[CONF_PORT], login=not cached)
+    except (AuthorizationError, InsufficientPermissionsError) as e:
+        # Retrying does not help, the user has to authorize the application again
+        raise ConfigEntryAuthFailed(f"The Freebox refused the application: {e!r}") from e
     except Exception as e:
-        _LOGGER.error("Unable to connect to the Freebox: %s", repr(e))
-        return False
+        # Home Assistant retries later, with its own backoff
+        raise ConfigEntryNotReady(f"Unable to connect to the Freebox: {e!r}") from e
+    log_phase("connection and login")
 
-    router = FreeboxRouter(hass, entry, api, fbx_config)
-    await router.update_all()
+    router = FreeboxRouter(hass, entry, api, nodes_cache)
+    try:
+        await router.async_setup(cached)
+    except (AuthorizationError, InsufficientPermissionsError) as e:
+        await router.close()
+        raise ConfigEntryAuthFailed(f"The Freebox refused the application: {e!r}") from e
+    except Exception:
+        await router.close()
+        raise
+    log_phase("configuration and first snapshot")
 
     hass.data.setdefault(DOMAIN, {})
     hass.data[DOMAIN][entry.unique_id] = router
 
     await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
+    log_phase("platforms")
+    if cached:
+        router.async_reconcile()
+
+    if entry.options.get(CONF_USE_PUSH, DEFAULT_USE_PUSH):
+        await router.async_start_push()
+        log_phase("event stream")
+    _LOGGER.debug("Startup: done in %.3fs with %d nodes", time.monotonic() - start, len(router.nodes))
+
+    entry.async_on_unload(entry.add_update_listener(async_reload_entry))
 
     async def async_close_connection(event):
         """Close Freebox connection on HA Stop."""
@@ -47,6 +87,11 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry):
     return True
 
 
+async def async_reload_entry(hass: HomeAssistant, entry: ConfigEntry):
+    """Reload the entry when its options changed."""
+    await hass.config_entries.async_reload(entry.entry_id)
+
+
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry):
     """Unload a config entry."""
     unload_ok = all(
@@ -4,16 +4,16 @@ import json
 import time
 import async_timeout
 
-from typing import Dict, Optional
+from typing import Optional
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.core import callback
-from homeassistant.helpers.event import async_track_time_interval
 from homeassistant.helpers.dispatcher import async_dispatcher_connect
 from homeassistant.components.alarm_control_panel import AlarmControlPanelEntity
-from datetime import datetime, timedelta
+from homeassistant.util import dt as dt_util
 
-from .base_class import FreeboxBaseClass
-from .const import DOMAIN, VALUE_NOT_SET
+from .base_class import FreeboxBaseClass, async_track_nodes
+from .const import DOMAIN, VALUE_NOT_SET, ALARM_WATCH_INTERVAL, ALARM_POLL_INTERVAL, ALARM_TRANSITION_TIMEOUT, ALARM_IDLE_GRACE
+from .model import FreeboxNode
 from .router import FreeboxRouter
 
 
@@ -25,40 +25,58 @@ from homeassistant.components.alarm_control_panel.const import (
 
 _LOGGER = logging.getLogger(__name__)
 
+# Freebox alarm states ending an arm/disarm transition
+TERMINAL_STATES = {
+    "alarm1": {"alarm1_armed"},
+    "alarm2": {"alarm2_armed"},
+    "off":    {"idle"},
+}
+
+# States showing an arm command was taken into account. The first reads after
+# the command usually still return "idle", so "idle" only ends an arm
+# transition (cancelled) after one of them, or after ALARM_IDLE_GRACE (refused).
+PROGRESS_STATES = {
+    "alarm1": {"alarm1_arming", "alarm1_armed"},
+    "alarm2": {"alarm2_arming", "alarm2_armed"},
+    "off":    set(),
+}
+
 async def async_setup_entry(hass, entry: ConfigEntry, async_add_entities):
     router = hass.data[DOMAIN][entry.unique_id]
-    entities = []
 
-    for nodeId, node in router.nodes.items():
-        if node["category"]=="alarm":
-            entities.append(FreeboxAlarm(hass, router, node))
+    def build(node):
+        if node.category=="alarm":
+            return [FreeboxAlarm(hass, router, node)]
+        return []
 
-    async_add_entities(entities, True)
+    async_track_nodes(hass, entry, router, async_add_entities, build)
 
 
 class FreeboxAlarm(FreeboxBaseClass, AlarmControlPanelEntity):
 
-    def __init__(self, hass, router: FreeboxRouter, node: Dict[str, any]) -> None:
+    def __init__(self, hass, router: FreeboxRouter, node: FreeboxNode) -> None:
         """Initialize an Alarm"""
         super().__init__(hass, router, node)
 
-        self._command_trigger   = self.get_command_id(node['type']['endpoints'], "slot", "trigger") # Trigger
-        self._command_alarm1    = self.get_command_id(node['type']['endpoints'], "slot", "alarm1") # Alarme principale
-        self._command_alarm2    = self.get_command_id(node['type']['endpoints'], "slot", "alarm2") # Alarme secondaire
-        self._command_skip      = self.get_command_id(node['type']['endpoints'], "slot", "skip") # Passer le délai
-        self._command_off       = self.get_command_id(node['type']['endpoints'], "slot", "off") # Désactiver l'alarme
-        self._command_pin       = self.get_command_id(node['type']['endpoints'], "slot", "pin") # Code PIN
-        self._command_sound     = self.get_command_id(node['type']['endpoints'], "slot", "sound") # Puissance des bips
-        self._command_volume    = self.get_command_id(node['type']['endpoints'], "slot", "volume") # Puissance de la sirène
-        self._command_timeout1  = self.get_command_id(node['type']['endpoints'], "slot", "timeout1") # Délai avant armement
-        self._command_timeout2  = self.get_command_id(node['type']['endpoints'], "slot", "timeout2") # Délai avant sirène
-        self._command_timeout3  = self.get_command_id(node['type']['endpoints'], "slot", "timeout3") # Durée de la sirène
-        self._command_state     = self.get_command_id(node['type']['endpoints'], "signal", "state" )
+        self._command_trigger   = self.get_command_id("slot", "trigger") # Trigger
+        self._command_alarm1    = self.get_command_id("slot", "alarm1") # Alarme principale
+        self._command_alarm2    = self.get_command_id("slot", "alarm2") # Alarme secondaire
+        self._command_skip      = self.get_command_id("slot", "skip") # Passer le délai
+        self._command_off       = self.get_command_id("slot", "off") # Désactiver l'alarme
+        self._command_pin       = self.get_command_id("slot", "pin") # Code PIN
+        self._command_sound     = self.get_command_id("slot", "sound") # Puissance des bips
+        self._command_volume    = self.get_command_id("slot", "volume") # Puissance de la sirène
+        self._command_timeout1  = self.get_command_id("slot", "timeout1") # Délai avant armement
+        self._command_timeout2  = self.get_command_id("slot", "timeout2") # Délai avant sirène
+        self._command_timeout3  = self.get_command_id("slot", "timeout3") # Durée de la sirène
+        self._command_state     = self.get_command_id("signal", "state" )
 
         #self.set_state("idle")
         self._freebox_alarm_state = "idle"
         self._unsub_watcher = None
-        self._supported_features = AlarmControlPanelEntityFeature.ARM_AWAY
+        self._transition: Optional[ArmingTransition] = None
+        self._last_transition: Optional[ArmingTransition] = None
+        self._supported_features = self.get_supported_features()
         self.update_parameters(node)
 
     #@property
@@ -70,17 +88,33 @@ class FreeboxAlarm(FreeboxBaseClass, AlarmControlPanelEntity):
         """Return the list of supported features."""
         return self._supported_features
 
+    def get_supported_features(self) -> int:
+        if( self._router.has_alarm2 ):
+            return AlarmControlPanelEntityFeature.ARM_AWAY | AlarmControlPanelEntityFeature.ARM_NIGHT | AlarmControlPanelEntityFeature.ARM_HOME
+        return AlarmControlPanelEntityFeature.ARM_AWAY
+
+    async def async_added_to_hass(self):
+        """Follow the alarm2 capability of the router and poll the state, the snapshot may be minutes away."""
+        await super().async_added_to_hass()
+        self.async_on_remove(async_dispatcher_connect(self.hass, self._router.signal_capabilities, self.async_capabilities_changed))
+        if( self._command_state != VALUE_NOT_SET ):
+            self.async_on_remove(self._router.scheduler.register(self._id, self._command_state, ALARM_POLL_INTERVAL, self.async_state_received,
+                                                                 max_interval=self._router.poll_ceiling, follow_alarm=True))
+
+    @callback
+    def async_capabilities_changed(self) -> None:
+        self._supported_features = self.get_supported_features()
+        self.async_write_ha_state()
+
     async def async_alarm_disarm(self, code=None) -> None:
         """Send disarm command."""
         if( await self.set_home_endpoint_value(self._command_off, {"value": None})):
-            time.sleep(1)
-            self.schedule_update_ha_state(True)
+            self.start_transition("off")
 
     async def async_alarm_arm_away(self, code=None) -> None:
         """Send arm away command."""
         if( await self.set_home_endpoint_value(self._command_alarm1, {"value": None})):
-            time.sleep(1)
-            self._unsub_watcher = async_track_time_interval(self.hass, self.sync_update_during_arming, timedelta(seconds=1))
+            self.start_transition("alarm1")
 
     async def async_alarm_arm_home(self, code=None) -> None:
         await self.async_alarm_arm_night(code)
@@ -88,54 +122,92 @@ class FreeboxAlarm(FreeboxBaseClass, AlarmControlPanelEntity):
     async def async_alarm_arm_night(self, code=None) -> None:
         """Send arm night command."""
         if( await self.set_home_endpoint_value(self._command_alarm2, {"value": None})):
-            time.sleep(1)
-            self._unsub_watcher = async_track_time_interval(self.hass, self.sync_update_during_arming, timedelta(seconds=1))
+            self.start_transition("alarm2")
+
+    def start_transition(self, target):
+        """Watch the state endpoint until the alarm reaches a terminal state for the command."""
+        self.stop_watcher()
+        self._transition = ArmingTransition(target)
+        if( self._command_state != VALUE_NOT_SET ):
+            self._unsub_watcher = self._router.scheduler.register(self._id, self._command_state, ALARM_WATCH_INTERVAL, self.async_state_received)
+        self.async_write_ha_state()
 
-    async def sync_update_during_arming(self, now: Optional[datetime] = None) -> None:
-        #self.set_state(await self.get_home_endpoint_value( self._command_state))
-        self._freebox_alarm_state = await self.get_home_endpoint_value( self._command_state)
+    @callback
+    def async_state_received(self, state) -> None:
+        """Called by the router with each state read or pushed."""
+        if( state == self._freebox_alarm_state and self._transition is None ):
+            return
+        self._freebox_alarm_state = state
+        self.check_transition()
         self.async_write_ha_state()
 
-    async def async_update(self):
-        """Get the state & name and update it."""
-        self._freebox_alarm_state = await self.get_home_endpoint_value( self._command_state)
-        if( self._freebox_alarm_state == "idle" and self._unsub_watcher != None):
+    def check_transition(self):
+        if( self._transition is None ):
+            return
+        target = self._transition.target
+        if( self._freebox_alarm_state in PROGRESS_STATES[target] ):
+            self._transition.progressed = True
+        if( self._freebox_alarm_state in TERMINAL_STATES[target] ):
+            self._transition.finish(self._freebox_alarm_state)
+        elif( self._freebox_alarm_state == "idle" and
+              (self._transition.progressed or self._transition.elapsed() > ALARM_IDLE_GRACE.total_seconds()) ):
+            self._transition.finish(self._freebox_alarm_state)
+        elif( self._transition.elapsed() > ALARM_TRANSITION_TIMEOUT.total_seconds() ):
+            _LOGGER.warning("Alarm did not reach a final state %s seconds after the %s command", ALARM_TRANSITION_TIMEOUT.total_seconds(), self._transition.target)
+            self._transition.finish(None)
+        else:
+            return
+        self._last_transition = self._transition
+        self._transition = None
+        self.stop_watcher()
+
+    def stop_watcher(self):
+        if( self._unsub_watcher != None ):
             self._unsub_watcher()
-        self.update_parameters(self._router.nodes[self._id])
+            self._unsub_watcher = None
+
+    async def async_will_remove_from_hass(self):
+        """When entity will be removed from hass."""
+        self.stop_watcher()
+        await super().async_will_remove_from_hass()
+
+    @property
+    def extra_state_attributes(self):
+        """Return the timing of the current or last arm/disarm transition."""
+        transition = self._transition or self._last_transition
+        if( transition is None ):
+            return None
+        return {
+            "transition_target":    transition.target,
+            "transition_started":   transition.started.isoformat(),
+            "transition_duration":  round(transition.elapsed(), 1),
+            "transition_result":    transition.result,
+        }
 
     def update_parameters(self, node):
         #Update name
-        self._name = node["label"].strip()
-
-        #Search if Alarm2
-        has_alarm2 = False
-        for nodeId, local_node in self._router.nodes.items():
-            alarm2 = next(filter(lambda x: (x["name"]=="alarm2" and x["ep_type"]=="signal"), local_node['show_endpoints']), None)
-            if( alarm2 != None and alarm2["value"] == True):
-                has_alarm2 = True
-                break
-
-        if( has_alarm2 ):
-            self._supported_features = AlarmControlPanelEntityFeature.ARM_AWAY | AlarmControlPanelEntityFeature.ARM_NIGHT | AlarmControlPanelEntityFeature.ARM_HOME
-        else:
-            self._supported_features = AlarmControlPanelEntityFeature.ARM_AWAY
+        self._name = node.label.strip()
 
         # Parse all endpoints values
-        for endpoint in filter(lambda x:(x["ep_type"] == "signal"), node['show_endpoints']):
-            if( endpoint["name"] == "pin" ):
-                self._pin = endpoint["value"]
-            elif( endpoint["name"] == "sound" ):
-                self._sound = endpoint["value"]
-            elif( endpoint["name"] == "volume" ):
-                self._high_volume = endpoint["value"]
-            elif( endpoint["name"] == "timeout1" ):
-                self._timeout1 = endpoint["value"]
-            elif( endpoint["name"] == "timeout3" ):
-                self._timeout2 = endpoint["value"]
-            elif( endpoint["name"] == "timeout3" ):
-                self._timeout3 = endpoint["value"]
-            elif( endpoint["name"] == "battery" ):
-                self._battery = endpoint["value"]
+        for endpoint in filter(lambda x:(x.ep_type == "signal"), self._router.nodes[self._id].endpoints.shown()):
+            if( endpoint.name == "pin" ):
+                self._pin = endpoint.value
+            elif( endpoint.name == "sound" ):
+                self._sound = endpoint.value
+            elif( endpoint.name == "volume" ):
+                self._high_volume = endpoint.value
+            elif( endpoint.name == "timeout1" ):
+                self._timeout1 = endpoint.value
+            elif( endpoint.name == "timeout3" ):
+                self._timeout2 = endpoint.value
+            elif( endpoint.name == "timeout3" ):
+                self._timeout3 = endpoint.value
+            elif( endpoint.name == "battery" ):
+                self._battery = endpoint.value
+            elif( endpoint.name == "state" ):
+                self._freebox_alarm_state = endpoint.value
+        if( self._transition is not None ):
+            self.check_transition()
 
 #    def set_state(self, state):
 #        if( state == "alarm1_arming"):
@@ -163,7 +235,7 @@ class FreeboxAlarm(FreeboxBaseClass, AlarmControlPanelEntity):
         if( self._freebox_alarm_state == "alarm1_arming"):
             return AlarmControlPanelState.ARMING
         elif( self._freebox_alarm_state == "alarm2_arming"):
-            return SAlarmControlPanelState.ARMING
+            return AlarmControlPanelState.ARMING
         elif( self._freebox_alarm_state == "alarm1_armed"):
             return AlarmControlPanelState.ARMED_AWAY
         elif( self._freebox_alarm_state == "alarm2_armed"):
@@ -171,8 +243,28 @@ class FreeboxAlarm(FreeboxBaseClass, AlarmControlPanelEntity):
         elif( self._freebox_alarm_state == "alarm1_alert_timer"):
             return AlarmControlPanelState.TRIGGERED
         elif( self._freebox_alarm_state == "alarm2_alert_timer"):
-            returnAlarmControlPanelState.TRIGGERED
+            return AlarmControlPanelState.TRIGGERED
         elif( self._freebox_alarm_state == "alert"):
             return AlarmControlPanelState.TRIGGERED
         return AlarmControlPanelState.DISARMED
 
+
+class ArmingTransition:
+    """Timing of one arm/disarm command, from the command to the terminal state."""
+    __slots__ = ("target", "started", "_start", "_end", "result", "progressed")
+
+    def __init__(self, target) -> None:
+        self.target     = target
+        self.started    = dt_util.utcnow()
+        self._start     = time.monotonic()
+        self._end       = None
+        self.result     = None
+        self.progressed = False     # an arming or armed state was seen
+
+    def elapsed(self) -> float:
+        """Seconds since the command, or duration of the finished transition."""
+        return (self._end if self._end is not None else time.monotonic()) - self._start
+
+    def finish(self, result) -> None:
+        self._end   = time.monotonic()
+        self.result = result
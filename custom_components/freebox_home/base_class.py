@@ -1,52 +1,119 @@
 """Support for detectors covers."""
 import logging
 
-from typing import Dict, Optional
+from typing import Callable, List
 from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import callback
+from homeassistant.helpers import entity_registry as er
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
 from homeassistant.helpers.entity import Entity
 from .const import DOMAIN, VALUE_NOT_SET
+from .model import FreeboxNode
 from .router import FreeboxRouter
 
 _LOGGER = logging.getLogger(__name__)
 
+
+@callback
+def async_track_nodes(hass, entry: ConfigEntry, router: FreeboxRouter, async_add_entities,
+                      build: Callable[[FreeboxNode], List[Entity]]) -> None:
+    """Add the entities built for each node, now and whenever new nodes are paired."""
+    tracked = set()
+
+    @callback
+    def add_entities(node_ids=None) -> None:
+        entities = []
+        for node_id, node in router.nodes.items():
+            if( node_id in tracked ):
+                continue
+            tracked.add(node_id)
+            entities.extend(build(node))
+        if entities:
+            async_add_entities(entities, True)
+
+    @callback
+    def forget_node(node_id) -> None:
+        # Its entities remove themselves, a node paired again gets new ones
+        tracked.discard(node_id)
+
+    entry.async_on_unload(async_dispatcher_connect(hass, router.signal_node_new, add_entities))
+    entry.async_on_unload(async_dispatcher_connect(hass, router.signal_node_removed, forget_node))
+    add_entities()
+
 class FreeboxBaseClass(Entity):
-    def __init__(self, hass, router: FreeboxRouter, node: Dict[str, any], sub_node = None) -> None:
+    def __init__(self, hass, router: FreeboxRouter, node: FreeboxNode, sub_node = None) -> None:
         _LOGGER.debug(node)
         self._hass = hass
         self._router = router
-        self._id    = node["id"]
-        self._name  = node["label"].strip()
-        self._device_name = node["label"].strip()
+        self._id    = node.id
+        self._name  = node.label.strip()
+        self._device_name = node.label.strip()
         self._unique_id = f"{self._router.mac}-node_{self._id}"
         self._is_device = True
 
         if(sub_node != None):
-            self._name = sub_node["label"].strip()
-            self._unique_id += "-" + sub_node["name"].strip()
+            self._name = sub_node.label.strip()
+            self._unique_id += "-" + sub_node.name.strip()
             #self._is_device = False
 
         self._available = True
-        self._firmware  = node['props'].get('FwVersion', None)
+        self._firmware  = node.props.get('FwVersion', None)
         self._manufacturer = "Free SAS"
         self._model     = ""
-        if( node["category"]=="pir" ):
+        if( node.category=="pir" ):
             self._model     = "F-HAPIR01A"
-        elif( node["category"]=="camera" ):
+        elif( node.category=="camera" ):
             self._model     = "F-HACAM01A"
-        elif( node["category"]=="dws" ):
+        elif( node.category=="dws" ):
             self._model     = "F-HADWS01A"
-        elif( node["category"]=="kfb" ):
+        elif( node.category=="kfb" ):
             self._model     = "F-HAKFB01A"
             self._is_device = True
-        elif( node["category"]=="alarm" ):
+        elif( node.category=="alarm" ):
             self._model     = "F-MSEC07A"
-        elif( node["type"].get("inherit", None)=="node::rts"):
+        elif( node.inherit=="node::rts"):
             self._manufacturer  = "Somfy"
             self._model         = "RTS"
-        elif( node["type"].get("inherit", None)=="node::ios"):
+        elif( node.inherit=="node::ios"):
             self._manufacturer  = "Somfy"
             self._model         = "IOcontrol"
 
+    async def async_added_to_hass(self):
+        """Listen to the change sets of the node."""
+        await super().async_added_to_hass()
+        self.async_on_remove(async_dispatcher_connect(self.hass, self._router.signal_node_update(self._id), self._router.profiler.wrap(self._async_node_updated)))
+        self.async_on_remove(async_dispatcher_connect(self.hass, self._router.signal_node_removed, self._async_node_removed))
+        self.async_on_remove(async_dispatcher_connect(self.hass, self._router.signal_connection, self.async_write_ha_state))
+
+    @callback
+    def _async_node_removed(self, node_id) -> None:
+        """The node is gone from the Freebox, retire the entity with its registry entry."""
+        if( node_id != self._id ):
+            return
+        registry = er.async_get(self.hass)
+        if( registry.async_get(self.entity_id) is not None ):
+            # The registry removal takes the entity out of Home Assistant
+            registry.async_remove(self.entity_id)
+        else:
+            self.hass.async_create_task(self.async_remove(force_remove=True))
+
+    @callback
+    def _async_node_updated(self, changes) -> None:
+        """Only called when something changed on the node."""
+        node = self._router.nodes.get(self._id)
+        if( node is None ):
+            return
+        self.update_parameters(node)
+        self.async_write_ha_state()
+
+    def update_parameters(self, node):
+        """Refresh the cached values from the node, override in platforms."""
+
+    @property
+    def should_poll(self):
+        """Return True if entity has to be polled for state."""
+        return False
+
     @property
     def unique_id(self) -> str:
         return self._unique_id
@@ -58,7 +125,7 @@ class FreeboxBaseClass(Entity):
     @property
     def available(self):
         """Return True if entity is available."""
-        return self._available
+        return self._available and self._router.available
 
     @property
     def device_info(self):
@@ -77,26 +144,28 @@ class FreeboxBaseClass(Entity):
         if( command_id == VALUE_NOT_SET ):
             _LOGGER.error("Unable to SET a value through the API. Command is VALUE_NOT_SET")
             return False
-        await self._router._api.home.set_home_endpoint_value(self._id, command_id, value)
+        await self._router.async_set_home_endpoint_value(self._id, command_id, value)
         return True
 
     async def get_home_endpoint_value(self, command_id):
         if( command_id == VALUE_NOT_SET ):
             _LOGGER.error("Unable to GET a value through the API. Command is VALUE_NOT_SET")
             return VALUE_NOT_SET
-        node = await self._router._api.home.get_home_endpoint_value(self._id, command_id)
-        return node.get("value", VALUE_NOT_SET)
+        return await self._router.async_get_home_endpoint_value(self._id, command_id)
         
-    def get_command_id(self, nodes, ep_type, name ):
-        node = next(filter(lambda x: (x["name"]==name and x["ep_type"]==ep_type), nodes), None)
-        if( node == None):
-            _LOGGER.warning("The Freebox Home device has no value for: " + ep_type + "/" + name)
+    def get_endpoint(self, ep_type, name):
+        return self._router.nodes[self._id].endpoints.get(ep_type, name)
+
+    def get_command_id(self, ep_type, name ):
+        endpoint = self.get_endpoint(ep_type, name)
+        if( endpoint == None):
+            self._router.throttled_log.warning(_LOGGER, "The Freebox Home device %s has no value for: %s/%s", self._id, ep_type, name)
             return VALUE_NOT_SET
-        return node["id"]
+        return endpoint.id
 
-    def get_node_value(self, nodes, ep_type, name ):
-        node = next(filter(lambda x: (x["name"]==name and x["ep_type"]==ep_type), nodes), None)
-        if( node == None):
-            _LOGGER.warning("The Freebox Home device has no value for: " + ep_type + "/" + name)
+    def get_node_value(self, ep_type, name ):
+        endpoint = self.get_endpoint(ep_type, name)
+        if( endpoint == None):
+            self._router.throttled_log.warning(_LOGGER, "The Freebox Home device %s has no value for: %s/%s", self._id, ep_type, name)
             return VALUE_NOT_SET
-        return node.get("value", VALUE_NOT_SET)
\ No newline at end of file
+        return endpoint.value
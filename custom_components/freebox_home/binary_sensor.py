@@ -1,13 +1,12 @@
 """Support for motion detector, door opener detector and check for sensor plastic cover """
 import logging
 
-from typing import Dict, Optional
 from homeassistant.components.binary_sensor import BinarySensorEntity, BinarySensorDeviceClass
-from homeassistant.helpers.event import async_track_time_interval
-from datetime import datetime, timedelta
+from homeassistant.core import callback
 
-from .base_class import FreeboxBaseClass
-from .const import DOMAIN, VALUE_NOT_SET
+from .base_class import FreeboxBaseClass, async_track_nodes
+from .const import DOMAIN, VALUE_NOT_SET, SENSOR_POLL_INTERVAL, TAMPER_POLL_INTERVAL, TAMPER_POLL_CEILING
+from .model import FreeboxNode
 from .router import FreeboxRouter
 
 
@@ -15,26 +14,27 @@ _LOGGER = logging.getLogger(__name__)
 
 async def async_setup_entry(hass, config_entry, async_add_entities):
     router = hass.data[DOMAIN][config_entry.unique_id]
-    entities = []
 
-    for nodeId, node in router.nodes.items():
-        if node["category"]=="pir":
+    def build(node):
+        entities = []
+        if node.category=="pir":
             entities.append(FreeboxPir(hass, router, node))
-        elif node["category"]=="dws":
+        elif node.category=="dws":
             entities.append(FreeboxDws(hass, router, node))
-        #elif node["category"]=="basic_shutter":
+        #elif node.category=="basic_shutter":
         #    entities.append(FreeboxCoverInverter(hass, router, node))
-        #elif node["category"]=="shutter":
+        #elif node.category=="shutter":
         #    entities.append(FreeboxCoverInverter(hass, router, node))
-        #elif node["category"]=="opener":
+        #elif node.category=="opener":
         #    entities.append(FreeboxCoverInverter(hass, router, node))
         
 
-        cover_node = next(filter(lambda x: (x["name"]=="cover" and x["ep_type"]=="signal"), node["show_endpoints"]), None)
-        if( cover_node != None and cover_node.get("value", None) != None):
+        cover_node = node.endpoints.get("signal", "cover")
+        if( cover_node != None and cover_node.value not in (None, VALUE_NOT_SET) ):
             entities.append(FreeboxSensorCover(hass, router, node))
+        return entities
 
-    async_add_entities(entities, True)
+    async_track_nodes(hass, config_entry, router, async_add_entities, build)
 
 
 
@@ -42,17 +42,25 @@ async def async_setup_entry(hass, config_entry, async_add_entities):
 ''' Freebox motion detector sensor '''
 class FreeboxPir(FreeboxBaseClass, BinarySensorEntity):
 
-    def __init__(self, hass, router: FreeboxRouter, node: Dict[str, any]) -> None:
+    def __init__(self, hass, router: FreeboxRouter, node: FreeboxNode) -> None:
         """Initialize a Pir"""
         super().__init__(hass, router, node)
-        self._command_trigger = self.get_command_id(node['type']['endpoints'], "signal", "trigger")
+        self._command_trigger = self.get_command_id("signal", "trigger")
         self._detection = False
-        self._unsub_watcher = async_track_time_interval(self._hass, self.async_update_pir, timedelta(seconds=1))
 
-    async def async_update_pir(self, now: Optional[datetime] = None) -> None:
-        detection = await self.get_home_endpoint_value(self._command_trigger)
+    async def async_added_to_hass(self):
+        """Register the trigger endpoint with the router poll scheduler, fast only while something happens."""
+        await super().async_added_to_hass()
+        if( self._command_trigger != VALUE_NOT_SET ):
+            self.async_on_remove(self._router.scheduler.register(self._id, self._command_trigger, SENSOR_POLL_INTERVAL, self.async_update_pir,
+                                                                 max_interval=self._router.poll_ceiling, follow_alarm=True))
+
+    @callback
+    def async_update_pir(self, detection) -> None:
         if( self._detection == detection ):
             self._detection = not detection
+            if( self._detection ):
+                self._router.fire_motion(self._id)
             self.async_write_ha_state()
 
     @property
@@ -69,16 +77,11 @@ class FreeboxPir(FreeboxBaseClass, BinarySensorEntity):
     def device_class(self):
         """Return the class of this device, from component DEVICE_CLASSES."""
         return BinarySensorDeviceClass.MOTION
-    
-    async def async_will_remove_from_hass(self):
-        """When entity will be removed from hass."""
-        self._unsub_watcher()
-        await super().async_will_remove_from_hass()
 
 
 ''' Freebox door opener sensor '''
 class FreeboxDws(FreeboxPir):
-    def __init__(self, hass, router: FreeboxRouter, node: Dict[str, any]) -> None:
+    def __init__(self, hass, router: FreeboxRouter, node: FreeboxNode) -> None:
         super().__init__(hass, router, node)
 
     @property
@@ -88,10 +91,10 @@ class FreeboxDws(FreeboxPir):
 
 '''
 class FreeboxDws(FreeboxBaseClass, BinarySensorEntity):
-    def __init__(self, hass, router: FreeboxRouter, node: Dict[str, any]) -> None:
+    def __init__(self, hass, router: FreeboxRouter, node: FreeboxNode) -> None:
         """Initialize a Dws"""
         super().__init__(hass, router, node)
-        self._command_trigger = self.get_command_id(node['type']['endpoints'], "signal", "trigger")
+        self._command_trigger = self.get_command_id("signal", "trigger")
 
         self._detection = False
         self._unsub_watcher = async_track_time_interval(self._hass, self.async_update_pir, timedelta(seconds=1))
@@ -125,17 +128,24 @@ class FreeboxDws(FreeboxBaseClass, BinarySensorEntity):
 
 ''' Freebox cover check for some sensors (motion detector, door opener detector...) '''
 class FreeboxSensorCover(FreeboxBaseClass, BinarySensorEntity):
-    def __init__(self, hass, router: FreeboxRouter, node: Dict[str, any]) -> None:
+    def __init__(self, hass, router: FreeboxRouter, node: FreeboxNode) -> None:
         """Initialize a Cover for anothe Device"""
         # Get cover node
-        cover_node = next(filter(lambda x: (x["name"]=="cover" and x["ep_type"]=="signal"), node['type']['endpoints']), None)
+        cover_node = node.endpoints.get("signal", "cover")
         super().__init__(hass, router, node, cover_node)
-        self._command_cover = self.get_command_id(node['show_endpoints'], "signal", "cover")
+        self._command_cover = self.get_command_id("signal", "cover")
         self._open = False
-        self._unsub_watcher = async_track_time_interval(self._hass, self.async_update_pir, timedelta(seconds=3))
 
-    async def async_update_pir(self, now: Optional[datetime] = None) -> None:
-        self._open = await self.get_home_endpoint_value(self._command_cover)
+    async def async_added_to_hass(self):
+        """Register the cover endpoint with the router poll scheduler, a tamper is rare so it is read slowly."""
+        await super().async_added_to_hass()
+        if( self._command_cover != VALUE_NOT_SET ):
+            self.async_on_remove(self._router.scheduler.register(self._id, self._command_cover, TAMPER_POLL_INTERVAL, self.async_update_pir,
+                                                                 max_interval=TAMPER_POLL_CEILING))
+
+    @callback
+    def async_update_pir(self, value) -> None:
+        self._open = value
         self.async_write_ha_state()
 
     @property
@@ -151,9 +161,4 @@ class FreeboxSensorCover(FreeboxBaseClass, BinarySensorEntity):
     @property
     def device_class(self):
         """Return the class of this device, from component DEVICE_CLASSES."""
-        return BinarySensorDeviceClass.SAFETY
-    
-    async def async_will_remove_from_hass(self):
-        """When entity will be removed from hass."""
-        self._unsub_watcher()
-        await super().async_will_remove_from_hass()
\ No newline at end of file
+        return BinarySensorDeviceClass.SAFETY
\ No newline at end of file
@@ -1,16 +1,22 @@
 import logging
 import json
+import time
 import asyncio
 import aiohttp
 import async_timeout
 import collections
+import os
 
 from typing import Dict
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.core import callback
 from homeassistant.helpers.dispatcher import async_dispatcher_connect
+from homeassistant.helpers.event import async_call_later, async_track_time_interval
+from homeassistant.util import slugify, dt as dt_util
+from datetime import timedelta
 from homeassistant.helpers import config_validation as cv, entity_platform, service
 
+from homeassistant.components.ffmpeg import get_ffmpeg_manager
 from homeassistant.components.ffmpeg.camera import (
     FFmpegCamera,
     CONF_INPUT,
@@ -42,53 +48,26 @@ from homeassistant.components.generic.camera import (
     CONF_FRAMERATE
 )
 
-from .base_class import FreeboxBaseClass
-from .const import DOMAIN, VALUE_NOT_SET
+from .base_class import FreeboxBaseClass, async_track_nodes
+from .camera_worker import FfmpegFrameWorker
+from .const import (DOMAIN, VALUE_NOT_SET, CAMERA_WORKER_FPS, CAMERA_WORKER_IDLE_TIMEOUT, CAMERA_WORKER_START_TIMEOUT,
+    FRAME_EXPORT_POST_EVENT, FRAME_EXPORT_DIR, FRAME_EXPORT_MIN_INTERVAL, EVENT_FRAMES_EXPORTED)
+from .frame_buffer import FrameRingBuffer, export_frames, prune_exports
 from .router import FreeboxRouter
+from .snapshot import SnapshotCache
 
 
 _LOGGER = logging.getLogger(__name__)
 
-'''
-async def async_setup_entry(hass, entry: ConfigEntry, async_add_entities) -> None:
-    router = hass.data[DOMAIN][entry.unique_id]
-    tracked = set()
-
-    @callback
-    def update_router():
-        add_entities(hass, router, async_add_entities, tracked)
-
-    router.listeners.append(async_dispatcher_connect(hass, router.signal_device_new, update_router))
-    update_router()
-
-    platform = entity_platform.current_platform.get()
-    platform.async_register_entity_service("flip",{},"async_flip",)
-
-
-@callback
-def add_entities(hass, router, async_add_entities, tracked):
-    """Add new cover from the router."""
-    new_tracked = []
-    #_LOGGER.warning(router.nodes)
-    for nodeId, node in router.nodes.items():
-        if (node["category"]!="camera") or (node["id"] in tracked):
-            continue
-        new_tracked.append(FreeboxCamera(hass, router, node))
-        tracked.add(node["id"] )
-
-    if new_tracked:
-        async_add_entities(new_tracked, True)
-'''
-
 async def async_setup_entry(hass, entry, async_add_entities):
     router = hass.data[DOMAIN][entry.unique_id]
-    entities = []
 
-    for nodeId, node in router.nodes.items():
-        if node["category"]=="camera":
-            entities.append(FreeboxCamera(hass, router, node))
+    def build(node):
+        if node.category=="camera":
+            return [FreeboxCamera(hass, router, node)]
+        return []
 
-    async_add_entities(entities, True)
+    async_track_nodes(hass, entry, router, async_add_entities, build)
     platform = entity_platform.current_platform.get()
     platform.async_register_entity_service("flip",{},"async_flip",)
 
@@ -99,18 +78,106 @@ class FreeboxCamera(FreeboxBaseClass, FFmpegCamera):
         """Initialize a camera."""
         super().__init__(hass, router, node)
 
-        device_info = {CONF_NAME: node["label"].strip(),CONF_INPUT: node["props"]["Stream"],CONF_EXTRA_ARGUMENTS: DEFAULT_ARGUMENTS }
+        device_info = {CONF_NAME: node.label.strip(),CONF_INPUT: node.props["Stream"],CONF_EXTRA_ARGUMENTS: DEFAULT_ARGUMENTS }
         FFmpegCamera.__init__(self, hass, device_info)
+        self._worker = None
+        self._frames = None
+        self._export_pending = False
+        self._last_export = None
+        self._last_event_time = 0.0
+        if( router.camera_worker or router.frame_buffer_depth > 0 ):
+            self._worker = FfmpegFrameWorker(get_ffmpeg_manager(hass).binary, node.props["Stream"], CAMERA_WORKER_FPS,
+                                             CAMERA_WORKER_IDLE_TIMEOUT, CAMERA_WORKER_START_TIMEOUT)
+        if( router.frame_buffer_depth > 0 ):
+            # The worker feeds the buffer and is kept running
+            self._frames = FrameRingBuffer(router.frame_buffer_depth, router.frame_buffer_size)
+            self._worker.add_listener(self._frames.append)
+        self._snapshots = SnapshotCache(hass, self.async_take_image, router.snapshot_max_age, router.snapshot_refresh)
         
         #self._supported_features = CameraEntityFeature.STREAM
         self.update_parameters(node)
         
-        self._command_flip              = self.get_command_id(node['show_endpoints'], "slot", "flip")
-        self._command_motion_detection  = self.get_command_id(node['type']['endpoints'], "slot", "detection")
+        self._command_flip              = self.get_command_id("slot", "flip")
+        self._command_motion_detection  = self.get_command_id("slot", "detection")
 
     async def async_flip(entity):
         entity._flip = not entity._flip
         await entity.set_home_endpoint_value(entity._command_flip, {"value": entity._flip})
+        entity.async_write_ha_state()
+
+    async def async_added_to_hass(self):
+        """Keep the frame buffer filled and export it on motion and alarm events."""
+        await super().async_added_to_hass()
+        if( self._frames is None ):
+            return
+        self._worker.touch()
+        self.async_on_remove(async_track_time_interval(self.hass, self._async_keep_worker, timedelta(seconds=CAMERA_WORKER_IDLE_TIMEOUT / 2)))
+        self.async_on_remove(async_dispatcher_connect(self.hass, self._router.signal_motion, self._router.profiler.wrap(self.async_motion_detected)))
+
+    @callback
+    def _async_keep_worker(self, now=None) -> None:
+        """Postpone the idle stop of the worker, from the event loop."""
+        self._worker.touch()
+
+    @callback
+    def async_motion_detected(self, node_id) -> None:
+        """Freeze the frames before the event, export them with the following ones.
+
+        Only the nodes linked to the camera in the options trigger an export,
+        at most one every FRAME_EXPORT_MIN_INTERVAL seconds.
+        """
+        if( node_id not in self._router.camera_links.get(self._id, ()) ):
+            return
+        event_time = time.time()
+        if( self._export_pending or event_time - self._last_event_time < FRAME_EXPORT_MIN_INTERVAL ):
+            return
+        self._export_pending = True
+        self._last_event_time = event_time
+        event_name = dt_util.now().strftime("%Y%m%d_%H%M%S")
+        before = self._frames.freeze()
+
+        def export(frames, camera_directory, directory):
+            count = export_frames(frames, directory)
+            prune_exports(camera_directory, self._router.frame_export_keep)
+            return count
+
+        async def async_export(now=None):
+            frames = before + self._frames.freeze(before[-1][0] if before else event_time)
+            camera_directory = os.path.join(
+                self.hass.config.media_dirs.get("local", self.hass.config.path("media")),
+                FRAME_EXPORT_DIR, slugify(self._name),
+            )
+            directory = os.path.join(camera_directory, event_name)
+            try:
+                count = await self.hass.async_add_executor_job(export, frames, camera_directory, directory)
+                self._last_export = directory
+                self.hass.bus.async_fire(EVENT_FRAMES_EXPORTED, {"entity_id": self.entity_id, "node_id": node_id, "directory": directory, "frames": count})
+                self.async_write_ha_state()
+            except OSError as error:
+                _LOGGER.error("Unable to export the camera frames to %s: %s", directory, error)
+            finally:
+                self._export_pending = False
+
+        async_call_later(self.hass, FRAME_EXPORT_POST_EVENT, async_export)
+
+    async def async_camera_image(self, width=None, height=None):
+        """Return a still image, shared by the concurrent requests."""
+        return await self._snapshots.async_get()
+
+    async def async_take_image(self):
+        """Latest frame of the worker, or a new ffmpeg snapshot without worker."""
+        if( self._worker is not None ):
+            frame = await self._worker.async_get_frame()
+            if( frame is not None ):
+                return frame
+        return await FFmpegCamera.async_camera_image(self)
+
+    async def async_will_remove_from_hass(self):
+        """When entity will be removed from hass."""
+        self._snapshots.stop()
+        if( self._worker is not None ):
+            await self._worker.async_stop()
+        await super().async_will_remove_from_hass()
 
     @property
     def state_attributes(self):
@@ -128,6 +195,9 @@ class FreeboxCamera(FreeboxBaseClass, FFmpegCamera):
         attr["sound_trigger"]       = self._sound_trigger
         attr["rtsp"]                = self._rtsp
         attr["disk"]                = self._disk
+        if( self._frames is not None ):
+            attr["buffered_frames"]     = len(self._frames)
+            attr["last_export"]         = self._last_export
         return attr
 
     @property
@@ -139,31 +209,24 @@ class FreeboxCamera(FreeboxBaseClass, FFmpegCamera):
         """Enable motion detection in the camera."""
         await self.set_home_endpoint_value(self._command_motion_detection, {"value": True})
         self._motion_detection_enabled = True
+        self.async_write_ha_state()
 
     async def async_disable_motion_detection(self):
         """Disable motion detection in camera."""
         await self.set_home_endpoint_value(self._command_motion_detection, {"value": False})
         self._motion_detection_enabled = False
+        self.async_write_ha_state()
 
     @property
     def supported_features(self):
         """Flag supported features."""
         return CameraEntityFeature.STREAM #self._supported_features
 
-    async def async_update(self):
-        """Get the state & name and update it."""
-        self.update_parameters(self._router.nodes[self._id]);
-
-    @property
-    def should_poll(self):
-        """Return True if entity has to be polled for state."""
-        return True
-
     def update_parameters(self, node):
-        self._name = node["label"].strip()
+        self._name = node.label.strip()
 
         # Get status
-        #if( node["status"] == "active"):
+        #if( node.status == "active"):
         #    self.is_streaming = True
         #else:
         #    self.is_streaming = False
@@ -171,28 +234,28 @@ class FreeboxCamera(FreeboxBaseClass, FFmpegCamera):
         #self.is_recording?
 
         # Parse all endpoints values & needed commands
-        for endpoint in filter(lambda x:(x["ep_type"] == "signal"), node['show_endpoints']):
-            if( endpoint["name"] == "detection" ):
-                self._motion_detection_enabled = endpoint["value"]
-            elif( endpoint["name"] == "activation" ):
-                self._activation_with_alarm = endpoint["value"]
-            elif( endpoint["name"] == "quality" ):
-                self._high_quality_video = endpoint["value"]
-            elif( endpoint["name"] == "sensitivity" ):
-                self._motion_sensitivity = endpoint["value"]
-            elif( endpoint["name"] == "threshold" ):
-                self._motion_threshold = endpoint["value"]
-            elif( endpoint["name"] == "flip" ):
-                self._flip = endpoint["value"]
-            elif( endpoint["name"] == "timestamp" ):
-                self._timestamp = endpoint["value"]
-            elif( endpoint["name"] == "volume" ):
-                self._volume_micro = endpoint["value"]
-            elif( endpoint["name"] == "sound_detection" ):
-                self._sound_detection = endpoint["value"]
-            elif( endpoint["name"] == "sound_trigger" ):
-                self._sound_trigger = endpoint["value"]
-            elif( endpoint["name"] == "rtsp" ):
-                self._rtsp = endpoint["value"]
-            elif( endpoint["name"] == "disk" ):
-                self._disk = endpoint["value"]
+        for endpoint in filter(lambda x:(x.ep_type == "signal"), self._router.nodes[self._id].endpoints.shown()):
+            if( endpoint.name == "detection" ):
+                self._motion_detection_enabled = endpoint.value
+            elif( endpoint.name == "activation" ):
+                self._activation_with_alarm = endpoint.value
+            elif( endpoint.name == "quality" ):
+                self._high_quality_video = endpoint.value
+            elif( endpoint.name == "sensitivity" ):
+                self._motion_sensitivity = endpoint.value
+            elif( endpoint.name == "threshold" ):
+                self._motion_threshold = endpoint.value
+            elif( endpoint.name == "flip" ):
+                self._flip = endpoint.value
+            elif( endpoint.name == "timestamp" ):
+                self._timestamp = endpoint.value
+            elif( endpoint.name == "volume" ):
+                self._volume_micro = endpoint.value
+            elif( endpoint.name == "sound_detection" ):
+                self._sound_detection = endpoint.value
+            elif( endpoint.name == "sound_trigger" ):
+                self._sound_trigger = endpoint.value
+            elif( endpoint.name == "rtsp" ):
+                self._rtsp = endpoint.value
+            elif( endpoint.name == "disk" ):
+                self._disk = endpoint.value
@@ -0,0 +1,176 @@
+"""Long-lived ffmpeg decoder keeping the latest frame of a camera stream.
+
+The module does not depend on Home Assistant so it can be run against a
+local RTSP server or a video file:
+
+    python camera_worker.py rtsp://127.0.0.1:8554/test
+    python camera_worker.py sample.mp4 --ffmpeg /usr/bin/ffmpeg
+"""
+import asyncio
+import logging
+
+from typing import Callable, List, Optional
+
+_LOGGER = logging.getLogger(__name__)
+
+JPEG_START  = b"\xff\xd8"
+JPEG_END    = b"\xff\xd9"
+READ_SIZE   = 65536
+
+
+def split_jpegs(buffer: bytearray) -> List[bytes]:
+    """Remove the complete JPEG images from the start of buffer and return them.
+
+    Bytes before the first start marker are dropped, an incomplete image is
+    left in the buffer for the next read.
+    """
+    frames = []
+    while True:
+        start = buffer.find(JPEG_START)
+        if start < 0:
+            # Keep a trailing 0xff, it may be the first half of a start marker
+            del buffer[:max(len(buffer) - 1, 0)]
+            return frames
+        end = buffer.find(JPEG_END, start + 2)
+        if end < 0:
+            del buffer[:start]
+            return frames
+        frames.append(bytes(buffer[start:end + 2]))
+        del buffer[:end + 2]
+
+
+class FfmpegFrameWorker:
+    """One ffmpeg process decoding a stream to JPEG frames, kept while used.
+
+    The process is started by the first frame request and keeps the stream
+    session open, each request then returns the latest frame right away.
+    It is stopped once no frame was requested for `idle_timeout` seconds,
+    or when the stream stalls, and started again by the next request.
+    """
+
+    def __init__(
+        self,
+        binary: str,
+        source: str,
+        fps: float = 1,
+        idle_timeout: float = 60,
+        start_timeout: float = 10,
+        input_args: Optional[List[str]] = None,
+    ) -> None:
+        self._binary = binary
+        self._source = source
+        self._fps = fps
+        self.idle_timeout = idle_timeout
+        self._start_timeout = start_timeout
+        if input_args is None:
+            # A file is read at its native rate and looped, like a live stream
+            input_args = ["-rtsp_transport", "tcp"] if source.startswith("rtsp") else ["-re", "-stream_loop", "-1"]
+        self._input_args = input_args
+        self._task: Optional[asyncio.Task] = None
+        self._frame: Optional[bytes] = None
+        self._frame_event = asyncio.Event()
+        self._last_request = 0.0
+        self._listeners: List[Callable[[bytes], None]] = []
+
+        self.starts = 0
+        self.frames = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def add_listener(self, listener: Callable[[bytes], None]) -> Callable[[], None]:
+        """Call listener with every decoded frame, return the function removing it."""
+        self._listeners.append(listener)
+        return lambda: self._listeners.remove(listener) if listener in self._listeners else None
+
+    def touch(self) -> None:
+        """Start the worker if needed and postpone its idle stop."""
+        self._last_request = asyncio.get_running_loop().time()
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._async_run())
+
+    async def async_get_frame(self) -> Optional[bytes]:
+        """Return the latest frame, waiting for the first one after a start."""
+        self.touch()
+        if self._frame is None:
+            try:
+                await asyncio.wait_for(self._frame_event.wait(), self._start_timeout)
+            except asyncio.TimeoutError:
+                _LOGGER.debug("No frame from %s after %ss", self._source, self._start_timeout)
+                return None
+        return self._frame
+
+    async def async_stop(self) -> None:
+        """Stop the ffmpeg process."""
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def _async_run(self) -> None:
+        args = [
+            self._binary, "-hide_banner", "-loglevel", "error",
+            *self._input_args, "-i", self._source,
+            "-an", "-f", "image2pipe", "-vcodec", "mjpeg", "-q:v", "5", "-r", str(self._fps), "-",
+        ]
+        loop = asyncio.get_running_loop()
+        self.starts += 1
+        process = await asyncio.create_subprocess_exec(
+            *args, stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
+        )
+        _LOGGER.debug("Decoder started for %s", self._source)
+        buffer = bytearray()
+        try:
+            while loop.time() - self._last_request < self.idle_timeout:
+                try:
+                    chunk = await asyncio.wait_for(process.stdout.read(READ_SIZE), self._start_timeout)
+                except asyncio.TimeoutError:
+                    _LOGGER.debug("Stream %s stalled", self._source)
+                    break
+                if not chunk:
+                    break
+                buffer.extend(chunk)
+                for frame in split_jpegs(buffer):
+                    self._set_frame(frame)
+        finally:
+            if process.returncode is None:
+                process.kill()
+            await process.wait()
+            self._frame = None
+            self._frame_event.clear()
+            if self._task is asyncio.current_task():
+                self._task = None
+            _LOGGER.debug("Decoder stopped for %s", self._source)
+
+    def _set_frame(self, frame: bytes) -> None:
+        self.frames += 1
+        self._frame = frame
+        self._frame_event.set()
+        for listener in list(self._listeners):
+            listener(frame)
+
+
+async def _async_check(source: str, binary: str, count: int) -> None:
+    worker = FfmpegFrameWorker(binary, source, idle_timeout=5)
+    loop = asyncio.get_running_loop()
+    for _ in range(count):
+        start = loop.time()
+        frame = await worker.async_get_frame()
+        print(f"{len(frame) if frame else 0} bytes in {(loop.time() - start) * 1000:.1f} ms")
+        await asyncio.sleep(1)
+    await worker.async_stop()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Request frames from a stream and print the time taken.")
+    parser.add_argument("source", help="RTSP URL or video file")
+    parser.add_argument("--ffmpeg", default="ffmpeg", help="ffmpeg binary")
+    parser.add_argument("--count", type=int, default=5)
+    arguments = parser.parse_args()
+    asyncio.run(_async_check(arguments.source, arguments.ffmpeg, arguments.count))
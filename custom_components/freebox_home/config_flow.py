@@ -6,9 +6,15 @@ import voluptuous as vol
 
 from homeassistant import config_entries
 from homeassistant.const import CONF_HOST, CONF_PORT
+from homeassistant.core import callback
 from homeassistant.data_entry_flow import AbortFlow
+from homeassistant.helpers import config_validation as cv
 
-from .const import DOMAIN
+from .const import (DOMAIN, CONF_USE_PUSH, DEFAULT_USE_PUSH, CONF_CACHE_TTL, DEFAULT_CACHE_TTL, CONF_POLL_CEILING, DEFAULT_POLL_CEILING,
+    CONF_SCAN_CEILING, DEFAULT_SCAN_CEILING,
+    CONF_SNAPSHOT_MAX_AGE, DEFAULT_SNAPSHOT_MAX_AGE, CONF_SNAPSHOT_REFRESH, DEFAULT_SNAPSHOT_REFRESH,
+    CONF_CAMERA_WORKER, DEFAULT_CAMERA_WORKER, CONF_FRAME_BUFFER_DEPTH, DEFAULT_FRAME_BUFFER_DEPTH, CONF_FRAME_BUFFER_SIZE,
+    DEFAULT_FRAME_BUFFER_SIZE, CONF_PROFILE, DEFAULT_PROFILE, CONF_FRAME_EXPORT_KEEP, DEFAULT_FRAME_EXPORT_KEEP, CONF_CAMERA_LINKS)
 from .router import get_api
 
 _LOGGER = logging.getLogger(__name__)
@@ -18,6 +24,12 @@ class FreeboxFlowHandler(config_entries.ConfigFlow, domain=DOMAIN):
     VERSION = 1
     CONNECTION_CLASS = config_entries.CONN_CLASS_LOCAL_POLL
 
+    @staticmethod
+    @callback
+    def async_get_options_flow(config_entry):
+        """Get the options flow for this handler."""
+        return FreeboxOptionsFlowHandler()
+
     def __init__(self):
         """Initialize Freebox config flow."""
         self._host = None
@@ -74,7 +86,6 @@ class FreeboxFlowHandler(config_entries.ConfigFlow, domain=DOMAIN):
             fbx = await get_api(self.hass, self._host, self._port)
             
             # Wait
-            await fbx.system.get_config()
             await self.hass.async_block_till_done()
 
             # Close connection
@@ -128,6 +139,50 @@ class FreeboxFlowHandler(config_entries.ConfigFlow, domain=DOMAIN):
         return self.async_show_form(step_id="permission", errors=errors)
 
 
+    async def async_step_reauth(self, entry_data):
+        """The Freebox refused the application token or its home permission."""
+        self._host = entry_data[CONF_HOST]
+        self._port = entry_data[CONF_PORT]
+        return await self.async_step_reauth_confirm()
+
+
+    async def async_step_reauth_confirm(self, user_input=None):
+        """Authorize the application again, then check the home permission."""
+        if user_input is None:
+            return self.async_show_form(step_id="reauth_confirm")
+
+        errors = {}
+        fbx = None
+        try:
+            fbx = await get_api(self.hass, self._host, self._port)
+            await fbx.home.get_home_nodes()
+
+            entry = self.hass.config_entries.async_get_entry(self.context["entry_id"])
+            self.hass.async_create_task(self.hass.config_entries.async_reload(entry.entry_id))
+            return self.async_abort(reason="reauth_successful")
+
+        except AuthorizationError as error:
+            _LOGGER.error("AuthorizationError: %s", error)
+            errors["base"] = "register_failed"
+
+        except InsufficientPermissionsError as error:
+            _LOGGER.error(error)
+            errors["base"] = "unknown"
+
+        except HttpRequestError:
+            _LOGGER.error("Error connecting to the Freebox router at %s", self._host)
+            errors["base"] = "cannot_connect"
+
+        except Exception:  # pylint: disable=broad-except
+            _LOGGER.exception("Unknown error connecting with Freebox router at %s", self._host)
+            errors["base"] = "unknown"
+        finally:
+            if fbx is not None:
+                await fbx.close()
+
+        return self.async_show_form(step_id="reauth_confirm", errors=errors)
+
+
     async def async_step_import(self, user_input=None):
         """Import a config entry."""
         return await self.async_step_user(user_input)
@@ -144,3 +199,71 @@ class FreeboxFlowHandler(config_entries.ConfigFlow, domain=DOMAIN):
         if(self._host == None or self._port == None):
             raise AbortFlow("Invalid discovery info (missing domain or port)")
         return await self.async_step_user({CONF_HOST: self._host, CONF_PORT: self._port})
+
+
+class FreeboxOptionsFlowHandler(config_entries.OptionsFlow):
+    """Handle Freebox Home options."""
+
+    def __init__(self):
+        self._options = {}
+
+    async def async_step_init(self, user_input=None):
+        """Manage the options."""
+        if user_input is not None:
+            self._options.update(user_input)
+            self._options[CONF_CAMERA_LINKS] = self.config_entry.options.get(CONF_CAMERA_LINKS, {})
+            if( user_input[CONF_FRAME_BUFFER_DEPTH] > 0 and self._cameras() ):
+                return await self.async_step_cameras()
+            return self.async_create_entry(title="", data=self._options)
+
+        options = self.config_entry.options
+        return self.async_show_form(
+            step_id="init",
+            data_schema=vol.Schema(
+                {
+                    vol.Required(CONF_USE_PUSH, default=options.get(CONF_USE_PUSH, DEFAULT_USE_PUSH)): bool,
+                    vol.Required(CONF_CACHE_TTL, default=options.get(CONF_CACHE_TTL, DEFAULT_CACHE_TTL)): vol.All(vol.Coerce(float), vol.Range(min=0, max=10)),
+                    vol.Required(CONF_POLL_CEILING, default=options.get(CONF_POLL_CEILING, DEFAULT_POLL_CEILING)): vol.All(vol.Coerce(int), vol.Range(min=1, max=300)),
+                    vol.Required(CONF_SCAN_CEILING, default=options.get(CONF_SCAN_CEILING, DEFAULT_SCAN_CEILING)): vol.All(vol.Coerce(int), vol.Range(min=30, max=3600)),
+                    vol.Required(CONF_SNAPSHOT_MAX_AGE, default=options.get(CONF_SNAPSHOT_MAX_AGE, DEFAULT_SNAPSHOT_MAX_AGE)): vol.All(vol.Coerce(float), vol.Range(min=0, max=300)),
+                    vol.Required(CONF_SNAPSHOT_REFRESH, default=options.get(CONF_SNAPSHOT_REFRESH, DEFAULT_SNAPSHOT_REFRESH)): bool,
+                    vol.Required(CONF_CAMERA_WORKER, default=options.get(CONF_CAMERA_WORKER, DEFAULT_CAMERA_WORKER)): bool,
+                    vol.Required(CONF_FRAME_BUFFER_DEPTH, default=options.get(CONF_FRAME_BUFFER_DEPTH, DEFAULT_FRAME_BUFFER_DEPTH)): vol.All(vol.Coerce(int), vol.Range(min=0, max=120)),
+                    vol.Required(CONF_FRAME_BUFFER_SIZE, default=options.get(CONF_FRAME_BUFFER_SIZE, DEFAULT_FRAME_BUFFER_SIZE)): vol.All(vol.Coerce(int), vol.Range(min=1, max=128)),
+                    vol.Required(CONF_FRAME_EXPORT_KEEP, default=options.get(CONF_FRAME_EXPORT_KEEP, DEFAULT_FRAME_EXPORT_KEEP)): vol.All(vol.Coerce(int), vol.Range(min=1, max=1000)),
+                    vol.Required(CONF_PROFILE, default=options.get(CONF_PROFILE, DEFAULT_PROFILE)): bool,
+                }
+            ),
+        )
+
+    def _nodes(self, categories):
+        router = self.hass.data.get(DOMAIN, {}).get(self.config_entry.unique_id)
+        if( router is None ):
+            return []
+        return [node for node in router.nodes.values() if node.category in categories]
+
+    def _cameras(self):
+        return self._nodes(("camera",))
+
+    async def async_step_cameras(self, user_input=None):
+        """Pick, for each camera, the sensors whose events export its frames."""
+        cameras = self._cameras()
+        if user_input is not None:
+            self._options[CONF_CAMERA_LINKS] = {
+                str(camera.id): [int(node_id) for node_id in user_input.get(str(camera.id), [])] for camera in cameras
+            }
+            return self.async_create_entry(title="", data=self._options)
+
+        sensors = {str(node.id): node.label for node in self._nodes(("pir", "dws", "alarm"))}
+        links = self._options[CONF_CAMERA_LINKS]
+        return self.async_show_form(
+            step_id="cameras",
+            data_schema=vol.Schema(
+                {
+                    vol.Optional(str(camera.id), default=[str(node_id) for node_id in links.get(str(camera.id), []) if str(node_id) in sensors]): cv.multi_select(sensors)
+                    for camera in cameras
+                }
+            ),
+            # Fields are keyed by node id, labels may be shared by several cameras
+            description_placeholders={"cameras": "\n".join(f"- {camera.id}: {camera.label}" for camera in cameras)},
+        )
@@ -0,0 +1,137 @@
+"""Track whether the Freebox answers and reconnect to it when it does not."""
+import asyncio
+import logging
+import random
+
+from typing import Any, Callable, Dict, Optional
+
+import aiohttp
+
+from freebox_api.exceptions import AuthorizationError, HttpRequestError
+
+from .const import CONNECTION_FAILURE_THRESHOLD, CONNECTION_RETRY_MIN, CONNECTION_RETRY_MAX
+
+_LOGGER = logging.getLogger(__name__)
+
+# Errors meaning the Freebox did not answer, an API error means it is up
+CONNECTION_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError, OSError)
+
+
+class FreeboxUnavailableError(HttpRequestError):
+    """The request was not sent, the Freebox is unreachable."""
+
+
+class FreeboxConnection:
+    """Circuit breaker in front of the requests to the Freebox.
+
+    After CONNECTION_FAILURE_THRESHOLD requests in a row failed to reach the
+    Freebox the circuit opens: requests fail at once with
+    FreeboxUnavailableError and a single probe logs in again after a
+    jittered exponential delay, from CONNECTION_RETRY_MIN up to
+    CONNECTION_RETRY_MAX seconds. The probe reuses the stored app token, a
+    new application is never registered. `on_change` is called with the new
+    availability when the circuit opens or closes.
+    """
+
+    def __init__(
+        self,
+        api,
+        on_change: Callable[[bool], None],
+        failure_threshold: int = CONNECTION_FAILURE_THRESHOLD,
+        retry_min: float = CONNECTION_RETRY_MIN,
+        retry_max: float = CONNECTION_RETRY_MAX,
+    ) -> None:
+        self._api = api
+        self._on_change = on_change
+        self._failure_threshold = failure_threshold
+        self._retry_min = retry_min
+        self._retry_max = retry_max
+        self._probe_task: Optional[asyncio.Task] = None
+        self._stopped = False
+
+        self.available = True
+        self.failures = 0       # in a row
+        self.trips = 0
+        self.probes = 0
+        self.last_error: Optional[str] = None
+
+    def check(self) -> None:
+        """Raise FreeboxUnavailableError instead of sending a request while the circuit is open."""
+        if not self.available:
+            raise FreeboxUnavailableError("The Freebox is unreachable, waiting for it to come back")
+
+    def record_success(self) -> None:
+        self.failures = 0
+
+    def record_failure(self, error: Exception) -> None:
+        """Count a request which did not reach the Freebox, open the circuit after too many."""
+        self.failures += 1
+        self.last_error = repr(error)
+        if self.available and self.failures >= self._failure_threshold:
+            self._open()
+
+    def _open(self) -> None:
+        self.available = False
+        self.trips += 1
+        _LOGGER.warning("The Freebox does not answer (%s), requests paused until it is back", self.last_error)
+        self._probe_task = asyncio.get_running_loop().create_task(self._async_reconnect())
+        self._on_change(False)
+
+    def _close(self) -> None:
+        self.available = True
+        self.failures = 0
+        self._probe_task = None
+        _LOGGER.warning("The Freebox is back after %d attempts", self.probes)
+        self._on_change(True)
+
+    def _delay(self, attempt: int) -> float:
+        """Exponential delay with jitter, so the integrations do not all retry at once."""
+        delay = min(self._retry_max, self._retry_min * 2 ** attempt)
+        return random.uniform(delay / 2, delay)
+
+    async def _async_reconnect(self) -> None:
+        attempt = 0
+        self.probes = 0
+        while not self._stopped:
+            await asyncio.sleep(self._delay(attempt))
+            attempt += 1
+            self.probes += 1
+            try:
+                await self._async_probe()
+            except AuthorizationError as error:
+                # The Freebox answers but refuses the token, no need to retry fast
+                self.last_error = repr(error)
+                _LOGGER.error("The Freebox refused the application token: %s", error)
+                attempt = max(attempt, 16)
+                continue
+            except Exception as error:
+                # Also the odd answers of a Freebox still starting
+                self.last_error = repr(error)
+                _LOGGER.debug("The Freebox is still unreachable: %s", repr(error))
+                continue
+            self._close()
+            return
+
+    async def _async_probe(self) -> None:
+        """Open a new session with the app token, the previous one is lost if the Freebox restarted."""
+        access = self._api._access
+        access.session_token = None
+        access.session_permissions = None
+        await access._refresh_session_token()
+
+    async def async_stop(self) -> None:
+        """Stop reconnecting."""
+        self._stopped = True
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            self._probe_task = None
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "available":    self.available,
+            "failures":     self.failures,
+            "trips":        self.trips,
+            "probes":       self.probes,
+            "last_error":   self.last_error,
+        }
@@ -1,5 +1,6 @@
 """Freebox Home component constants."""
 import socket
+from datetime import timedelta
 
 DOMAIN      = "freebox_home"
 API_VERSION = "v8"
@@ -13,14 +14,127 @@ APP_DESC = {
     "device_name": socket.gethostname(),
 }
 
+# options
+CONF_USE_PUSH       = "use_push"
+DEFAULT_USE_PUSH    = False
+CONF_CACHE_TTL      = "cache_ttl"
+DEFAULT_CACHE_TTL   = 0.5   # seconds an endpoint value read is reused
+CONF_POLL_CEILING   = "poll_ceiling"
+DEFAULT_POLL_CEILING = 10   # seconds between two sensor reads when nothing happens
+CONF_SCAN_CEILING   = "scan_ceiling"
+DEFAULT_SCAN_CEILING = 120  # seconds between two snapshots when they stop changing
+CONF_SNAPSHOT_MAX_AGE       = "snapshot_max_age"
+DEFAULT_SNAPSHOT_MAX_AGE    = 5     # seconds a camera snapshot is reused
+CONF_SNAPSHOT_REFRESH       = "snapshot_refresh"
+DEFAULT_SNAPSHOT_REFRESH    = False
+CONF_CAMERA_WORKER          = "camera_worker"
+DEFAULT_CAMERA_WORKER       = False
+CONF_FRAME_BUFFER_DEPTH     = "frame_buffer_depth"
+DEFAULT_FRAME_BUFFER_DEPTH  = 0     # frames kept before an event, 0 disables the buffer
+CONF_FRAME_BUFFER_SIZE      = "frame_buffer_size"
+DEFAULT_FRAME_BUFFER_SIZE   = 8     # MB per camera
+CONF_FRAME_EXPORT_KEEP      = "frame_export_keep"
+DEFAULT_FRAME_EXPORT_KEEP   = 20    # exports kept per camera, the oldest are deleted
+CONF_CAMERA_LINKS           = "camera_links"   # camera node id -> ids of the nodes triggering its exports
+CONF_PROFILE                = "profile"
+DEFAULT_PROFILE             = False
+
+# signals
+SIGNAL_NODE_UPDATE  = DOMAIN + "_node_update_{}_{}"
+SIGNAL_CAPABILITIES = DOMAIN + "_capabilities_{}"
+SIGNAL_MOTION       = DOMAIN + "_motion_{}"
+SIGNAL_NODE_NEW     = DOMAIN + "_node_new_{}"
+SIGNAL_NODE_REMOVED = DOMAIN + "_node_removed_{}"
+SIGNAL_CONNECTION   = DOMAIN + "_connection_{}"
+
+# events
+EVENT_FRAMES_EXPORTED = DOMAIN + "_frames_exported"
+
 # to store the cookie
 STORAGE_KEY = DOMAIN
 STORAGE_VERSION = 1
 
+#camera
+SNAPSHOT_VIEWER_LEASE       = timedelta(seconds=30)    # background refresh kept after the last snapshot request
+CAMERA_WORKER_FPS           = 1     # frames decoded per second by the camera worker
+CAMERA_WORKER_IDLE_TIMEOUT  = 60    # seconds without request before the worker stops
+CAMERA_WORKER_START_TIMEOUT = 10    # seconds to wait for the first frame or a stalled stream
+FRAME_EXPORT_POST_EVENT     = 5     # seconds of frames after the event added to an export
+FRAME_EXPORT_DIR            = "freebox_home"   # in the local media directory
+FRAME_EXPORT_MIN_INTERVAL   = 60    # seconds between two exports of a camera
+
+#shutter invert flags
+INVERT_SAVE_DELAY = 1   # seconds after the last change
+NODES_SAVE_DELAY  = 30  # seconds after the last snapshot changing something
+
 #cover
 ATTR_MODEL = "model"
 
 #default Value
 VALUE_NOT_SET = -1
 
+#alarm
+ALARM_WATCH_INTERVAL        = timedelta(seconds=1)     # state reads while arming/disarming
+ALARM_POLL_INTERVAL         = timedelta(seconds=2)     # state reads while it changes or the alarm is on
+ALARM_TRANSITION_TIMEOUT    = timedelta(minutes=5)     # stop watching if no terminal state by then
+ALARM_IDLE_GRACE            = timedelta(seconds=15)    # "idle" read this long after an arm command means it was refused
+
+#request executor
+REQUEST_MAX_IN_FLIGHT       = 6     # requests sent to the Freebox at the same time
+REQUEST_KEEPALIVE_TIMEOUT   = 60    # seconds an idle connection is kept open
+
+#metrics
+METRICS_WINDOW      = 300   # seconds of requests used for the rates and percentiles
+METRICS_SAMPLES     = 2048  # latencies kept per operation
+
+#poll scheduler
+POLL_TICK           = 1     # seconds between two scheduler ticks
+POLL_MAX_CONCURRENT = 4     # endpoint reads running at the same time
+POLL_MAX_READS      = 8     # single endpoint reads per tick when the Freebox cannot read them in one request
+POLL_BACKOFF        = 2     # interval multiplier after a read returning the same value
+POLL_BOOST_DURATION = 30    # seconds an endpoint stays at its fastest interval after a change or a command
+SENSOR_POLL_INTERVAL        = timedelta(seconds=1)     # motion and door sensors, while something happens
+TAMPER_POLL_INTERVAL        = timedelta(seconds=60)    # sensor plastic cover
+TAMPER_POLL_CEILING         = timedelta(minutes=10)
+
+#batch commands
+BATCH_MAX_CONCURRENT        = 6     # writes of a batch sent at the same time
+BATCH_RETRIES               = 2     # new attempts for a failed write
+BATCH_RETRY_DELAY           = 0.5   # seconds, multiplied by the attempt number
+
+#services
+SERVICE_BATCH_SET           = "batch_set"
+SERVICE_MOVE_COVERS         = "move_covers"
+SERVICE_PROFILE             = "profile"
+
+#profiler
+DATA_PROFILER               = DOMAIN + "_profiler"
+PROFILE_SLOW_THRESHOLD      = 0.05  # seconds a step can block the event loop before being logged
+PROFILE_SAMPLE_INTERVAL     = 0.005 # seconds between two stack samples of a profile window
+PROFILE_DEFAULT_DURATION    = 30    # seconds
+
+#cover motion tracking
+COVER_TRACK_INTERVAL        = timedelta(seconds=1)     # position reads while a cover moves
+COVER_ANIMATION_INTERVAL    = timedelta(milliseconds=500)  # interpolated position updates
+COVER_TRACK_TIMEOUT         = timedelta(minutes=2)
+COVER_SETTLE_READS          = 3     # identical reads for a cover stopped before its target
+COVER_TRAVEL_TIME           = 30    # seconds for a full travel, until measured
+
+#nodes snapshot
+SCAN_INTERVAL       = timedelta(seconds=30)
+NODE_REMOVAL_SNAPSHOTS = 2  # snapshots a node must be missing from before its entities are removed
+
+#event websocket
+PUSH_EVENTS         = ["home_node_endpoint_value"]
+PUSH_HEARTBEAT      = 30    # seconds
+PUSH_RETRY_DELAY    = 10    # seconds before reconnecting a dropped socket, doubled after each failure
+PUSH_RETRY_MAX      = 300   # seconds between the attempts at most
+
+#connection to the Freebox
+CONNECTION_FAILURE_THRESHOLD = 3    # unanswered requests in a row before the Freebox is considered down
+CONNECTION_RETRY_MIN    = 2         # seconds before the first reconnection attempt, doubled after each
+CONNECTION_RETRY_MAX    = 300       # seconds between the attempts at most
 
+#repeated log messages
+LOG_SUMMARY_INTERVAL = 3600     # seconds between the counts of the messages not logged again
+LOG_SUMMARY_TOP     = 5         # messages detailed in each summary
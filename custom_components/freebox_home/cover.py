@@ -1,13 +1,18 @@
 """Support for Freebox covers."""
 import logging
 import json
+import time
+
+from abc import ABC, abstractmethod
+from typing import Optional
 from homeassistant.util import slugify
 from homeassistant.core import callback
 from homeassistant.helpers.dispatcher import async_dispatcher_connect
+from homeassistant.helpers.event import async_track_time_interval
 from homeassistant.components.cover import CoverEntity, CoverDeviceClass
-from .const import DOMAIN
-from .base_class import FreeboxBaseClass
-from homeassistant.helpers.entity_registry import async_get
+from .const import (DOMAIN, VALUE_NOT_SET, COVER_TRACK_INTERVAL, COVER_ANIMATION_INTERVAL, COVER_TRACK_TIMEOUT,
+    COVER_SETTLE_READS, COVER_TRAVEL_TIME)
+from .base_class import FreeboxBaseClass, async_track_nodes
 
 from homeassistant.const import (
     STATE_CLOSED,
@@ -21,30 +26,153 @@ _LOGGER = logging.getLogger(__name__)
 
 async def async_setup_entry(hass, entry, async_add_entities):
     router = hass.data[DOMAIN][entry.unique_id]
-    entities = []
 
-    for nodeId, node in router.nodes.items():
-        if node["category"]=="basic_shutter":
-            entities.append(FreeboxBasicShutter(hass, router, node))
-        elif node["category"]=="shutter":
-            entities.append(FreeboxShutter(hass, router, node))
-        elif node["category"]=="opener":
-            entities.append(FreeboxShutter(hass, router, node))
+    def build(node):
+        if node.category=="basic_shutter":
+            return [FreeboxBasicShutter(hass, router, node)]
+        elif node.category=="shutter":
+            return [FreeboxShutter(hass, router, node)]
+        elif node.category=="opener":
+            return [FreeboxShutter(hass, router, node)]
+        return []
+
+    async_track_nodes(hass, entry, router, async_add_entities, build)
+
+
+
+class FreeboxMovingCover(FreeboxBaseClass,CoverEntity,ABC):
+    """Cover following its movements after each command.
+
+    The position endpoint is read every COVER_TRACK_INTERVAL until the cover
+    settles, in between the position is interpolated from the travel speed
+    measured on the previous movements.
+    """
+
+    def __init__(self, hass, router, node) -> None:
+        super().__init__(hass, router, node)
+        self._motion: Optional[CoverMotion] = None
+        self._unsub_motion = None
+        self._unsub_animation = None
+        self._travel_rate = 100 / COVER_TRAVEL_TIME
+
+    async def async_added_to_hass(self):
+        """Make the cover reachable by the group commands of the router."""
+        await super().async_added_to_hass()
+        self._router.covers[self.entity_id] = self
+        self.async_on_remove(lambda: self._router.covers.pop(self.entity_id, None))
+
+    @abstractmethod
+    def position_write(self, position):
+        """Return the (node_id, endpoint_id, value) write moving the cover to position (0-100)."""
+
+    def motion_target(self, position):
+        """Position the cover actually goes to when asked for position."""
+        return position
+
+    @abstractmethod
+    def position_from_value(self, value):
+        """Convert a value of the tracked endpoint to a 0-100 position."""
+
+    @abstractmethod
+    def motion_settled(self, position):
+        """Store the position the cover stopped at."""
+
+    def start_motion(self, target) -> None:
+        """Follow the cover until it reaches target (0-100)."""
+        self.stop_motion()
+        start = self.current_position()
+        self._motion = CoverMotion(start if start is not None else target, target, self._travel_rate)
+        if( self._command_state != VALUE_NOT_SET ):
+            self._unsub_motion = self._router.scheduler.register(self._id, self._command_state, COVER_TRACK_INTERVAL, self.async_motion_value)
+        self._unsub_animation = async_track_time_interval(self.hass, self._router.profiler.wrap(self._async_animate), COVER_ANIMATION_INTERVAL)
+        self._router.boost(self._id)
+        self.async_write_ha_state()
+
+    def settle_motion(self) -> None:
+        """After a stop, follow the cover from its interpolated position until the reads give where it stopped."""
+        position = self.current_position()
+        if( self._command_state == VALUE_NOT_SET or position is None ):
+            self.stop_motion()
+            self.motion_settled(position)
+            self.async_write_ha_state()
+            return
+        self.start_motion(position)
+
+    def stop_motion(self) -> None:
+        if( self._unsub_motion is not None ):
+            self._unsub_motion()
+            self._unsub_motion = None
+        if( self._unsub_animation is not None ):
+            self._unsub_animation()
+            self._unsub_animation = None
+        self._motion = None
+
+    @callback
+    def async_motion_value(self, value) -> None:
+        """Called by the router with each position read while the cover moves."""
+        motion = self._motion
+        if( motion is None ):
+            return
+        position = self.position_from_value(value)
+        if( not motion.update(position) ):
+            return
+        if( motion.timed_out() ):
+            self._motion_timed_out()
+            self.async_write_ha_state()
+            return
+        if( motion.measured_rate ):
+            self._travel_rate = (self._travel_rate + motion.measured_rate) / 2
+        self.stop_motion()
+        self.motion_settled(position if position is not None else motion.position())
+        self.async_write_ha_state()
+
+    @callback
+    def _async_animate(self, now=None) -> None:
+        if( self._motion is not None and self._motion.timed_out() ):
+            self._motion_timed_out()
+        self.async_write_ha_state()
+
+    def _motion_timed_out(self) -> None:
+        """Keep the interpolated position, by then the target unless reads showed the cover slower."""
+        position = self._motion.position()
+        _LOGGER.debug("Cover %s did not settle after %s, keeping position %s", self._id, COVER_TRACK_TIMEOUT, position)
+        self.stop_motion()
+        self.motion_settled(position)
+
+    @abstractmethod
+    def current_position(self):
+        """Known position (0-100), interpolated while the cover moves."""
+
+    @property
+    def is_opening(self):
+        return self._motion is not None and self._motion.moving() and self._motion.target > self._motion.start
 
-    async_add_entities(entities, True)
+    @property
+    def is_closing(self):
+        return self._motion is not None and self._motion.moving() and self._motion.target < self._motion.start
+
+    @property
+    def extra_state_attributes(self):
+        """Return the travel time used to interpolate the position."""
+        return {"travel_time": round(100 / self._travel_rate, 1)}
 
+    async def async_will_remove_from_hass(self):
+        """When entity will be removed from hass."""
+        self.stop_motion()
+        await super().async_will_remove_from_hass()
 
 
-class FreeboxBasicShutter(FreeboxBaseClass,CoverEntity):
+
+class FreeboxBasicShutter(FreeboxMovingCover):
 
     def __init__(self, hass, router, node) -> None:
         """Initialize a Cover"""
         super().__init__(hass, router, node)
-        self._command_up    = self.get_command_id(node['show_endpoints'], "slot", "up")
-        self._command_stop  = self.get_command_id(node['show_endpoints'], "slot", "stop")
-        self._command_down  = self.get_command_id(node['show_endpoints'], "slot", "down")
-        self._command_state = self.get_command_id(node['show_endpoints'], "signal", "state")
-        self._state         = self.get_node_value(node['show_endpoints'], "signal", "state")
+        self._command_up    = self.get_command_id("slot", "up")
+        self._command_stop  = self.get_command_id("slot", "stop")
+        self._command_down  = self.get_command_id("slot", "down")
+        self._command_state = self.get_command_id("signal", "state")
+        self.update_parameters(node)
 
     @property
     def device_class(self) -> str:
@@ -69,25 +197,52 @@ class FreeboxBasicShutter(FreeboxBaseClass,CoverEntity):
 
     async def async_open_cover(self, **kwargs):
         """Open cover."""
-        await self.set_home_endpoint_value(self._command_up, {"value": None})
-        self._state = STATE_OPEN
+        if( await self.set_home_endpoint_value(self._command_up, {"value": None}) ):
+            self.start_motion(100)
 
     async def async_close_cover(self, **kwargs):
         """Close cover."""
-        await self.set_home_endpoint_value(self._command_down, {"value": None})
-        self._state = STATE_CLOSED
+        if( await self.set_home_endpoint_value(self._command_down, {"value": None}) ):
+            self.start_motion(0)
 
     async def async_stop_cover(self, **kwargs):
         """Stop cover."""
         await self.set_home_endpoint_value(self._command_stop, {"value": None})
+        self.stop_motion()
+        self._router.boost(self._id)
         self._state = None
+        self.async_write_ha_state()
 
-    async def async_update(self):
-        """Get the state & name and update it."""
-        node = self._router.nodes[self._id];
-        self._name = node["label"].strip()
-        self._state = self.convert_state(await self.get_home_endpoint_value(self._command_state))
-        
+    def position_write(self, position):
+        return (self._id, self._command_up if position >= 50 else self._command_down, None)
+
+    def motion_target(self, position):
+        return 100 if position >= 50 else 0
+
+    def current_position(self):
+        if( self._motion is not None ):
+            return self._motion.position()
+        if( self._state == STATE_OPEN ):
+            return 100
+        if( self._state == STATE_CLOSED ):
+            return 0
+        return None
+
+    def position_from_value(self, value):
+        state = self.convert_state(value)
+        if( state == STATE_OPEN ):
+            return 100
+        if( state == STATE_CLOSED ):
+            return 0
+        return None
+
+    def motion_settled(self, position):
+        self._state = STATE_OPEN if position == 100 else STATE_CLOSED if position == 0 else None
+
+    def update_parameters(self, node):
+        """Get the state & name from the node."""
+        self._name = node.label.strip()
+        self._state = self.convert_state(self.get_node_value("signal", "state"))
 
     def convert_state(self, state):
         if( state ): 
@@ -99,35 +254,24 @@ class FreeboxBasicShutter(FreeboxBaseClass,CoverEntity):
 
         
 
-class FreeboxShutter(FreeboxBaseClass,CoverEntity):
+class FreeboxShutter(FreeboxMovingCover):
 
     def __init__(self, hass, router, node) -> None:
         """Initialize a Cover"""
         super().__init__(hass, router, node)
-        self._command_position = self.get_command_id(node['type']['endpoints'], "slot", "position_set")
-        self._command_up = self.get_command_id(node['type']['endpoints'], "slot", "position_set")
-        self._command_down = self.get_command_id(node['type']['endpoints'], "slot", "position_set")
-        self._command_stop = self.get_command_id(node['show_endpoints'], "slot", "stop")
-        self._command_toggle = self.get_command_id(node['show_endpoints'], "slot", "toggle")
-        self._command_state = self.get_command_id(node['type']['endpoints'], "signal", "position_set")
-        self._current_state = self.get_node_value(node['show_endpoints'], "signal", "state")
-        
-        # Go over all entities to find the switch
-        self._invert_entity_id = None
-        entity_registry = async_get(hass)
-        for entity in entity_registry.entities.values():
-            if (entity.unique_id == self.unique_id + "_InvertSwitch"):
-                self._invert_entity_id = entity.entity_id
+        self._command_position = self.get_command_id("slot", "position_set")
+        self._command_up = self.get_command_id("slot", "position_set")
+        self._command_down = self.get_command_id("slot", "position_set")
+        self._command_stop = self.get_command_id("slot", "stop")
+        self._command_toggle = self.get_command_id("slot", "toggle")
+        self._command_state = self.get_command_id("signal", "position_set")
+
+        self.update_parameters(node)
 
     def get_corrected_state(self, value):
-        if(self._invert_entity_id == None):
+        if( value == None or value == VALUE_NOT_SET ):
             return value
-        state = self._hass.states.get(self._invert_entity_id)
-        if( value == None ):
-            return None
-        if( state == None ):
-            return None
-        if( state.state == "on" ):
+        if( self._router.invert.get(self._id) ):
             return 100 - value
         return value
     
@@ -138,7 +282,7 @@ class FreeboxShutter(FreeboxBaseClass,CoverEntity):
 
     @property
     def current_cover_position(self):
-        return self._current_state
+        return self.current_position()
 
     @property
     def current_cover_tilt_position(self):
@@ -147,29 +291,104 @@ class FreeboxShutter(FreeboxBaseClass,CoverEntity):
     @property
     def is_closed(self):
         """Return if the cover is closed or not."""
-        if(self._current_state == 0):
+        if(self.current_position() == 0):
             return True
         return False
 
     async def async_set_cover_position(self, position, **kwargs):
         """Set cover position."""
-        await self.set_home_endpoint_value(self._command_position, {"value": self.get_corrected_state(self._current_state)})
+        await self.async_move_to(position)
 
     async def async_open_cover(self, **kwargs):
         """Open cover."""
-        await self.set_home_endpoint_value(self._command_up, {"value": self.get_corrected_state(self._current_state)})
+        await self.async_move_to(100)
 
     async def async_close_cover(self, **kwargs):
         """Close cover."""
-        await self.set_home_endpoint_value(self._command_down, {"value": self.get_corrected_state(self._current_state)})
+        await self.async_move_to(0)
+
+    async def async_move_to(self, position):
+        if( await self.set_home_endpoint_value(self._command_position, {"value": self.get_corrected_state(position)}) ):
+            self.start_motion(position)
 
     async def async_stop_cover(self, **kwargs):
         """Stop cover."""
         await self.set_home_endpoint_value(self._command_stop, {"value": None})
-        self._state = None
+        # The interpolated position is only an estimate, keep reading until the cover settles
+        self.settle_motion()
 
-    async def async_update(self):
-        """Get the state & name and update it."""
-        node = self._router.nodes[self._id];
-        self._name = node["label"].strip()
-        self._current_state = self.get_corrected_state(await self.get_home_endpoint_value(self._command_state))
+    def position_write(self, position):
+        return (self._id, self._command_position, self.get_corrected_state(position))
+
+    def current_position(self):
+        if( self._motion is not None ):
+            return self._motion.position()
+        if( self._current_state == VALUE_NOT_SET ):
+            return None
+        return self._current_state
+
+    def position_from_value(self, value):
+        return self.get_corrected_state(value)
+
+    def motion_settled(self, position):
+        self._current_state = position
+
+    def update_parameters(self, node):
+        """Get the state & name from the node."""
+        self._name = node.label.strip()
+        self._current_state = self.get_corrected_state(self.get_node_value("signal", "position_set"))
+
+
+
+class CoverMotion:
+    """One cover movement, from the command to the settled position."""
+    __slots__ = ("start", "target", "rate", "measured_rate", "_start", "_anchor", "_anchor_time", "_last_read", "_stable_reads", "_moved")
+
+    def __init__(self, start, target, rate: float) -> None:
+        self.start          = start
+        self.target         = target
+        self.rate           = rate       # position percent per second
+        self.measured_rate  = None
+        self._start         = time.monotonic()
+        self._anchor        = start
+        self._anchor_time   = self._start
+        self._last_read     = None
+        self._stable_reads  = 0
+        self._moved         = False
+
+    def position(self) -> int:
+        """Interpolated position, between the last position read and the target."""
+        travelled = self.rate * (time.monotonic() - self._anchor_time)
+        if( self.target >= self._anchor ):
+            return round(min(self._anchor + travelled, self.target))
+        return round(max(self._anchor - travelled, self.target))
+
+    def moving(self) -> bool:
+        return self.position() != self.target
+
+    def timed_out(self) -> bool:
+        return time.monotonic() - self._start > COVER_TRACK_TIMEOUT.total_seconds()
+
+    def update(self, position) -> bool:
+        """Feed a position read from the Freebox, return True once the cover settled."""
+        now = time.monotonic()
+        if( position == self._last_read ):
+            self._stable_reads += 1
+        else:
+            self._stable_reads = 0
+            self._last_read = position
+            if( position is not None and position not in (self.start, self.target) ):
+                # The cover reports intermediate positions: interpolate from the last one
+                self._moved = True
+                self._anchor = position
+                self._anchor_time = now
+            elif( position == self.target and self._moved and now > self._start ):
+                self.measured_rate = abs(self.target - self.start) / (now - self._start)
+
+        if( self.timed_out() ):
+            return True
+        if( self._moved and position != self.target ):
+            # Stopped before the target
+            return self._stable_reads >= COVER_SETTLE_READS
+        # The endpoint may only report the target, let the interpolation end first
+        return not self.moving() and (position == self.target or self._stable_reads >= COVER_SETTLE_READS)
@@ -0,0 +1,28 @@
+"""Diagnostics support for Freebox Home."""
+from collections import Counter
+from typing import Any, Dict
+
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import CONF_HOST
+from homeassistant.core import HomeAssistant
+
+from .const import DOMAIN
+
+TO_REDACT = {CONF_HOST, "mac"}
+
+
+async def async_get_config_entry_diagnostics(hass: HomeAssistant, entry: ConfigEntry) -> Dict[str, Any]:
+    """Return the request metrics and the state of the router."""
+    router = hass.data[DOMAIN][entry.unique_id]
+    return {
+        "entry": async_redact_data({"data": dict(entry.data), "options": dict(entry.options)}, TO_REDACT),
+        "nodes": dict(Counter(node.category for node in router.nodes.values())),
+        "unsupported_nodes": router.unsupported_nodes,
+        "repeated_logs": router.throttled_log.counts,
+        "push_connected": router.push_connected,
+        "connection": router.connection.stats,
+        "alarm_active": router.alarm_active,
+        "executor": router.executor.stats,
+        "metrics": router.executor.metrics.summary(),
+    }
@@ -0,0 +1,234 @@
+"""Run the requests of the integration to the Freebox through one bounded pipeline."""
+import asyncio
+import logging
+import time
+
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiohttp import ClientSession, TCPConnector
+from freebox_api.exceptions import HttpRequestError
+
+from .connection import CONNECTION_ERRORS, FreeboxConnection
+from .const import REQUEST_MAX_IN_FLIGHT, REQUEST_KEEPALIVE_TIMEOUT, VALUE_NOT_SET, DEFAULT_CACHE_TTL
+from .metrics import FreeboxMetrics
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class FreeboxReplyError(HttpRequestError):
+    """The Freebox answered, but not with the expected result."""
+
+
+async def async_open_session(api, max_in_flight: int = REQUEST_MAX_IN_FLIGHT) -> None:
+    """Replace the Freepybox session with a tuned keep-alive one.
+
+    Freepybox creates its session in open(), before any request is sent. The
+    replacement keeps `max_in_flight` connections alive so the login and all
+    the following requests reuse them instead of opening new TLS sessions.
+    """
+    old_session = api._session
+    try:
+        ssl_context = old_session.connector._ssl
+    except AttributeError:
+        _LOGGER.debug("Unable to read the Freebox SSL context, keeping the default session")
+        return
+
+    connector = TCPConnector(
+        ssl=ssl_context,
+        limit=max_in_flight,
+        limit_per_host=max_in_flight,
+        keepalive_timeout=REQUEST_KEEPALIVE_TIMEOUT,
+    )
+    session = ClientSession(connector=connector)
+    api._session = session
+    api._access.session = session
+    await old_session.close()
+
+
+class FreeboxRequestExecutor:
+    """Request executor shared by the router, the scheduler and the entities.
+
+    At most REQUEST_MAX_IN_FLIGHT requests are sent at the same time, the
+    others wait their turn. Concurrent reads of the same (node, endpoint)
+    share a single request, and its value is served from a cache for
+    `cache_ttl` seconds. Writing to a node drops the cached values of the
+    whole node since slots and signals use different ids. The session it
+    uses is the one installed by async_open_session(). The latency and the
+    errors of every request are recorded in `metrics`. With a `connection`,
+    no request is sent while the Freebox is considered down.
+    """
+
+    def __init__(self, api, max_in_flight: int = REQUEST_MAX_IN_FLIGHT, cache_ttl: float = DEFAULT_CACHE_TTL,
+                 connection: Optional[FreeboxConnection] = None) -> None:
+        self._api = api
+        self._connection = connection
+        self._max_in_flight = max_in_flight
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._reads: Dict[Tuple[int, int], asyncio.Future] = {}
+        self._cache: Dict[int, Dict[int, Tuple[float, Any]]] = {}
+        self._generations: Dict[int, int] = {}
+        self.cache_ttl = cache_ttl
+
+        self.requests       = 0
+        self.coalesced      = 0
+        self.errors         = 0
+        self.in_flight      = 0
+        self.peak_in_flight = 0
+        self.waiting        = 0
+        self.cache_hits     = 0
+        self.cache_misses   = 0
+        self.metrics        = FreeboxMetrics()
+
+    async def close(self) -> None:
+        """Log out and close the session."""
+        if self._connection is not None and not self._connection.available:
+            # No one to log out from
+            await self._api._session.close()
+            return
+        await self._api.close()
+
+    @property
+    def api(self):
+        return self._api
+
+    async def get_config(self):
+        return await self._run(self._api.system.get_config)
+
+    async def get_home_nodes(self):
+        return await self._run(self._api.home.get_home_nodes)
+
+    async def get_home_endpoint_value(self, node_id, endpoint_id):
+        """Read an endpoint, from the cache or from a request shared with concurrent readers."""
+        cached = self._cache.get(node_id, {}).get(endpoint_id)
+        if cached is not None and asyncio.get_running_loop().time() - cached[0] < self.cache_ttl:
+            self.cache_hits += 1
+            return cached[1]
+        self.cache_misses += 1
+
+        key = (node_id, endpoint_id)
+        task = self._reads.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._async_read(node_id, endpoint_id))
+            self._reads[key] = task
+            task.add_done_callback(lambda done: self._reads.pop(key) if self._reads.get(key) is done else None)
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    async def get_home_endpoint_values(self, keys: List[Tuple[int, int]]) -> Dict[Tuple[int, int], Any]:
+        """Read several endpoints with a single request, the cached values are not asked again."""
+        loop_time = asyncio.get_running_loop().time()
+        values: Dict[Tuple[int, int], Any] = {}
+        missing = []
+        for node_id, endpoint_id in keys:
+            cached = self._cache.get(node_id, {}).get(endpoint_id)
+            if cached is not None and loop_time - cached[0] < self.cache_ttl:
+                self.cache_hits += 1
+                values[(node_id, endpoint_id)] = cached[1]
+            else:
+                self.cache_misses += 1
+                missing.append((node_id, endpoint_id))
+        if not missing:
+            return values
+
+        generations = {node_id: self._generations.get(node_id, 0) for node_id, _ in missing}
+        result = await self._run(
+            self._api.home.get_home_endpoint_values,
+            [{"node_id": node_id, "ep_id": endpoint_id} for node_id, endpoint_id in missing],
+        )
+        if result is None:
+            result = []
+        elif not isinstance(result, list):
+            # A dict, or the raw response of a reply which is not JSON
+            raise FreeboxReplyError(f"Unexpected reply to the endpoints read: {type(result).__name__}")
+        loop_time = asyncio.get_running_loop().time()
+        for index, item in enumerate(result):
+            if not isinstance(item, dict):
+                continue
+            # Values come back in the order asked, with their ids on recent firmwares
+            if "node_id" in item and ("ep_id" in item or "id" in item):
+                key = (item["node_id"], item.get("ep_id", item.get("id")))
+            elif index < len(missing):
+                key = missing[index]
+            else:
+                continue
+            value = item.get("value", VALUE_NOT_SET)
+            values[key] = value
+            if self._generations.get(key[0], 0) == generations.get(key[0], 0):
+                self._cache.setdefault(key[0], {})[key[1]] = (loop_time, value)
+        return values
+
+    async def _async_read(self, node_id, endpoint_id):
+        generation = self._generations.get(node_id, 0)
+        node = await self._run(self._api.home.get_home_endpoint_value, node_id, endpoint_id)
+        value = node.get("value", VALUE_NOT_SET)
+        # Do not cache a value read while the node was written to
+        if self._generations.get(node_id, 0) == generation:
+            self._cache.setdefault(node_id, {})[endpoint_id] = (asyncio.get_running_loop().time(), value)
+        return value
+
+    async def set_home_endpoint_value(self, node_id, endpoint_id, value):
+        self.invalidate(node_id)
+        try:
+            return await self._run(self._api.home.set_home_endpoint_value, node_id, endpoint_id, value)
+        finally:
+            self.invalidate(node_id)
+
+    def store(self, node_id, endpoint_id, value) -> None:
+        """Cache a value pushed by the Freebox, the reads still in flight may be older."""
+        self._generations[node_id] = self._generations.get(node_id, 0) + 1
+        self._cache.setdefault(node_id, {})[endpoint_id] = (asyncio.get_running_loop().time(), value)
+
+    def invalidate(self, node_id) -> None:
+        """Drop the cached values of a node."""
+        self._cache.pop(node_id, None)
+        self._generations[node_id] = self._generations.get(node_id, 0) + 1
+
+    async def _run(self, method, *args) -> Any:
+        if self._connection is not None:
+            self._connection.check()
+        self.waiting += 1
+        async with self._semaphore:
+            self.waiting -= 1
+            self.requests += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            started = time.monotonic()
+            error = None
+            try:
+                result = await method(*args)
+            except Exception as err:
+                self.errors += 1
+                error = err
+                if self._connection is not None and isinstance(err, CONNECTION_ERRORS):
+                    self._connection.record_failure(err)
+                raise
+            else:
+                if self._connection is not None:
+                    self._connection.record_success()
+                return result
+            finally:
+                self.in_flight -= 1
+                self.metrics.record(method.__name__, started, time.monotonic() - started, error)
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        """Counters of the executor and of the connection pool."""
+        stats = {
+            "requests":         self.requests,
+            "coalesced":        self.coalesced,
+            "errors":           self.errors,
+            "in_flight":        self.in_flight,
+            "peak_in_flight":   self.peak_in_flight,
+            "waiting":          self.waiting,
+            "max_in_flight":    self._max_in_flight,
+            "cache_ttl":        self.cache_ttl,
+            "cache_hits":       self.cache_hits,
+            "cache_misses":     self.cache_misses,
+        }
+        connector = getattr(getattr(self._api, "_session", None), "connector", None)
+        if connector is not None:
+            stats["pool_limit"]     = connector.limit
+            stats["pool_acquired"]  = len(getattr(connector, "_acquired", ()))
+            stats["pool_idle"]      = sum(len(conns) for conns in getattr(connector, "_conns", {}).values())
+        return stats
@@ -0,0 +1,62 @@
+"""Rolling buffer of the last camera frames, exported when an event fires."""
+import logging
+import os
+import shutil
+import time
+
+from collections import deque
+from typing import Deque, List, Tuple
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class FrameRingBuffer:
+    """Last `depth` JPEG frames of a camera, using at most `max_bytes`.
+
+    Frames are stored as received (immutable bytes, no copy nor re-encoding),
+    the oldest ones are dropped first when the depth or the size is exceeded.
+    """
+
+    def __init__(self, depth: int, max_bytes: int) -> None:
+        self._frames: Deque[Tuple[float, bytes]] = deque(maxlen=depth)
+        self._max_bytes = max_bytes
+        self.size = 0
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+    def append(self, frame: bytes) -> None:
+        if len(self._frames) == self._frames.maxlen:
+            self.size -= len(self._frames[0][1])
+        self._frames.append((time.time(), frame))
+        self.size += len(frame)
+        while self.size > self._max_bytes and len(self._frames) > 1:
+            self.size -= len(self._frames.popleft()[1])
+
+    def freeze(self, since: float = 0) -> List[Tuple[float, bytes]]:
+        """Return the frames received after `since`, sharing their bytes with the buffer."""
+        return [item for item in self._frames if item[0] > since]
+
+
+def prune_exports(directory: str, keep: int) -> int:
+    """Delete the oldest export directories beyond `keep`, blocking, return how many were deleted."""
+    try:
+        # Exports are named after their date, oldest first
+        exports = sorted(entry for entry in os.listdir(directory) if os.path.isdir(os.path.join(directory, entry)))
+    except FileNotFoundError:
+        return 0
+    removed = exports[:max(len(exports) - keep, 0)]
+    for name in removed:
+        shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+    return len(removed)
+
+
+def export_frames(frames: List[Tuple[float, bytes]], directory: str) -> int:
+    """Write the frames as numbered JPEG files, blocking, run it in an executor."""
+    os.makedirs(directory, exist_ok=True)
+    for index, (timestamp, frame) in enumerate(frames):
+        name = f"{index:03d}_{time.strftime('%H%M%S', time.localtime(timestamp))}.jpg"
+        with open(os.path.join(directory, name), "wb") as file:
+            file.write(frame)
+    _LOGGER.debug("%d frames exported to %s", len(frames), directory)
+    return len(frames)
@@ -0,0 +1,63 @@
+"""Invert flags of the shutters, kept in memory and saved in a single Store file."""
+import logging
+
+from pathlib import Path
+from typing import Dict, Iterable, Tuple
+
+from homeassistant.core import callback
+from homeassistant.helpers.storage import Store
+
+from .const import STORAGE_KEY, STORAGE_VERSION, INVERT_SAVE_DELAY
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class FreeboxInvertFlags:
+    """Node id -> invert flag, for the shutters whose commands are inverted.
+
+    The flags are loaded once at startup, read from memory afterwards, and
+    saved INVERT_SAVE_DELAY seconds after the last change.
+    """
+
+    def __init__(self, hass, entry) -> None:
+        self._hass = hass
+        self._store = Store(hass, STORAGE_VERSION, f"{STORAGE_KEY}.{entry.entry_id}.invert")
+        self._flags: Dict[int, bool] = {}
+        self.loaded = False
+
+    async def async_load(self) -> None:
+        data = await self._store.async_load()
+        self.loaded = data is not None
+        if data is not None:
+            self._flags = {int(node_id): value for node_id, value in data.get("flags", {}).items()}
+
+    async def async_migrate(self, legacy_files: Iterable[Tuple[int, Path]]) -> None:
+        """Import the per-shutter .conf files written by the previous versions."""
+        if self.loaded:
+            return
+
+        def read_files() -> Dict[int, bool]:
+            flags = {}
+            for node_id, path in legacy_files:
+                try:
+                    flags[node_id] = path.read_text() == "1"
+                except OSError:
+                    continue
+            return flags
+
+        self._flags.update(await self._hass.async_add_executor_job(read_files))
+        _LOGGER.debug("Imported %d shutter invert flags", len(self._flags))
+        self.loaded = True
+        self._store.async_delay_save(self._data_to_save, INVERT_SAVE_DELAY)
+
+    def get(self, node_id) -> bool:
+        return self._flags.get(node_id, False)
+
+    @callback
+    def set(self, node_id, value: bool) -> None:
+        self._flags[node_id] = value
+        self._store.async_delay_save(self._data_to_save, INVERT_SAVE_DELAY)
+
+    @callback
+    def _data_to_save(self) -> Dict:
+        return {"flags": {str(node_id): value for node_id, value in self._flags.items()}}
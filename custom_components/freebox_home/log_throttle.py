@@ -0,0 +1,74 @@
+"""Log the repeated messages of the integration once per window, then only their counts."""
+import logging
+from typing import Any, Dict, Tuple
+
+from .const import LOG_SUMMARY_INTERVAL, LOG_SUMMARY_TOP
+
+
+class ThrottledLog:
+    """Emit each distinct message once per window, then a summary of its repeats.
+
+    A message is identified by its logger, level, template and arguments, so
+    the arguments are only formatted when the message is actually emitted.
+    The owner calls summarize() every `summary_interval` seconds: the
+    repeats are counted through the logger and at the level of the
+    suppressed messages, and a message coming back afterwards is logged again.
+    """
+
+    def __init__(self, summary_interval: float = LOG_SUMMARY_INTERVAL) -> None:
+        self._summary_interval = summary_interval
+        self._totals: Dict[Tuple[str, int, str, Tuple[Any, ...]], int] = {}
+        self._suppressed: Dict[Tuple[str, int, str, Tuple[Any, ...]], int] = {}
+        self._seen = set()     # logged during the current window
+
+    def log(self, logger: logging.Logger, level: int, msg: str, *args) -> None:
+        if( not logger.isEnabledFor(level) ):
+            return
+        key = (logger.name, level, msg, args)
+        try:
+            seen = key in self._seen
+        except TypeError:
+            # Unhashable arguments are identified by their representation
+            key = (logger.name, level, msg, tuple(arg if isinstance(arg, (str, int, float, type(None))) else repr(arg) for arg in args))
+            seen = key in self._seen
+        self._totals[key] = self._totals.get(key, 0) + 1
+        if( not seen ):
+            self._seen.add(key)
+            logger.log(level, msg, *args)
+        else:
+            self._suppressed[key] = self._suppressed.get(key, 0) + 1
+
+    def warning(self, logger: logging.Logger, msg: str, *args) -> None:
+        self.log(logger, logging.WARNING, msg, *args)
+
+    def summarize(self) -> None:
+        """Log the counts of the repeats not logged during the window, and start a new window."""
+        suppressed, self._suppressed = self._suppressed, {}
+        self._seen = set()
+        groups: Dict[Tuple[str, int], Dict[Tuple[str, int, str, Tuple[Any, ...]], int]] = {}
+        for key, count in suppressed.items():
+            groups.setdefault(key[:2], {})[key] = count
+        for (name, level), counts in groups.items():
+            top = sorted(counts.items(), key=lambda item: item[1], reverse=True)[:LOG_SUMMARY_TOP]
+            logging.getLogger(name).log(
+                level, "%d repeated messages not logged in the last %d minutes, most frequent: %s",
+                sum(counts.values()), self._summary_interval // 60,
+                "; ".join(f"{self._format(key)} (x{count})" for key, count in top),
+            )
+
+    @staticmethod
+    def _format(key: Tuple[str, int, str, Tuple[Any, ...]]) -> str:
+        _, _, msg, args = key
+        try:
+            return msg % args
+        except (TypeError, ValueError):
+            return msg
+
+    @property
+    def counts(self) -> Dict[str, int]:
+        """Number of times each message was logged or suppressed since the start."""
+        counts: Dict[str, int] = {}
+        for key, count in self._totals.items():
+            message = self._format(key)
+            counts[message] = counts.get(message, 0) + count
+        return counts
@@ -0,0 +1,103 @@
+"""Counters and latency histograms of the requests sent to the Freebox."""
+import time
+
+from collections import Counter, deque
+from typing import Any, Deque, Dict, Iterable, List, Tuple
+
+from .const import METRICS_WINDOW, METRICS_SAMPLES
+
+
+def percentile(values, fraction: float) -> float:
+    """Percentile of sorted values, nearest rank."""
+    if not values:
+        return 0.0
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def summarize(count: int, errors: Counter, requests: int, latencies: Iterable[float]) -> Dict[str, Any]:
+    """Summary of `requests` sent over the window and a sample of their latencies."""
+    latencies = sorted(latencies)
+    return {
+        "count":            count,
+        "errors":           dict(errors),
+        "rate_per_minute":  round(requests * 60 / METRICS_WINDOW, 1),
+        "p50_ms":           round(percentile(latencies, 0.50) * 1000, 1),
+        "p95_ms":           round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms":           round(percentile(latencies, 0.99) * 1000, 1),
+    }
+
+
+class OperationMetrics:
+    """Rolling latencies and counters of one kind of request.
+
+    The rate is counted in one second buckets covering METRICS_WINDOW, so it
+    does not depend on how many latencies are kept: only the last
+    METRICS_SAMPLES latencies are used for the percentiles.
+    """
+    __slots__ = ("count", "errors", "_buckets", "_samples")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.errors: Counter = Counter()
+        self._buckets: Deque[List[int]] = deque()   # [second, requests]
+        self._samples: Deque[Tuple[float, float]] = deque(maxlen=METRICS_SAMPLES)
+
+    def record(self, started: float, latency: float, error: BaseException = None) -> None:
+        self.count += 1
+        second = int(started)
+        if self._buckets and self._buckets[-1][0] == second:
+            self._buckets[-1][1] += 1
+        else:
+            self._buckets.append([second, 1])
+            while self._buckets[0][0] <= second - METRICS_WINDOW:
+                self._buckets.popleft()
+        self._samples.append((started, latency))
+        if error is not None:
+            self.errors[type(error).__name__] += 1
+
+    def requests(self, now: float) -> int:
+        """Requests started over the last METRICS_WINDOW seconds."""
+        oldest = int(now) - METRICS_WINDOW
+        return sum(requests for second, requests in self._buckets if second > oldest)
+
+    def latencies(self, now: float) -> List[float]:
+        """Kept latencies of the requests started over the last METRICS_WINDOW seconds."""
+        return [latency for started, latency in self._samples if now - started <= METRICS_WINDOW]
+
+    def summary(self, now: float) -> Dict[str, Any]:
+        """Latency percentiles (ms) and rate (per minute) over the last METRICS_WINDOW seconds."""
+        return summarize(self.count, self.errors, self.requests(now), self.latencies(now))
+
+
+class FreeboxMetrics:
+    """Metrics of the integration, by operation, plus the poll overruns."""
+
+    def __init__(self) -> None:
+        self.operations: Dict[str, OperationMetrics] = {}
+        self.poll_overruns = 0
+
+    def record(self, operation: str, started: float, latency: float, error: BaseException = None) -> None:
+        metrics = self.operations.get(operation)
+        if metrics is None:
+            metrics = self.operations[operation] = OperationMetrics()
+        metrics.record(started, latency, error)
+
+    def summary(self) -> Dict[str, Any]:
+        """All the operations merged, then each operation."""
+        now = time.monotonic()
+        errors: Counter = Counter()
+        latencies: List[float] = []
+        for metrics in self.operations.values():
+            errors.update(metrics.errors)
+            latencies.extend(metrics.latencies(now))
+        merged = summarize(
+            sum(metrics.count for metrics in self.operations.values()),
+            errors,
+            sum(metrics.requests(now) for metrics in self.operations.values()),
+            latencies,
+        )
+        return {
+            "all":              merged,
+            "operations":       {name: metrics.summary(now) for name, metrics in self.operations.items()},
+            "poll_overruns":    self.poll_overruns,
+        }
@@ -0,0 +1,142 @@
+"""Compact representation of the Freebox Home nodes.
+
+Only the fields used by the platforms are kept from the get_home_nodes()
+payload, values are updated in place when new snapshots arrive.
+"""
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .const import VALUE_NOT_SET
+
+
+class FreeboxEndpoint:
+    """One endpoint (slot or signal) of a node."""
+    __slots__ = ("id", "ep_type", "name", "label", "value")
+
+    def __init__(self, endpoint: Dict[str, Any]) -> None:
+        self.id         = endpoint["id"]
+        self.ep_type    = endpoint["ep_type"]
+        self.name       = endpoint["name"]
+        self.label      = endpoint.get("label", "")
+        self.value      = endpoint.get("value", VALUE_NOT_SET)
+
+    def as_dict(self, with_value: bool) -> Dict[str, Any]:
+        endpoint = {"id": self.id, "ep_type": self.ep_type, "name": self.name, "label": self.label}
+        if with_value:
+            endpoint["value"] = self.value
+        return endpoint
+
+
+class EndpointIndex:
+    """Endpoints of a node, indexed by (ep_type, name) and by id.
+
+    Endpoints declared by the node type are indexed first so every command id
+    can be resolved, then the shown endpoints add their current value. Only
+    the shown endpoints carry a value, the others keep VALUE_NOT_SET.
+    """
+    __slots__ = ("_by_key", "_by_id", "_shown")
+
+    def __init__(self, node: Dict[str, Any]) -> None:
+        self._by_key: Dict[Tuple[str, str], FreeboxEndpoint] = {}
+        self._by_id: Dict[int, FreeboxEndpoint] = {}
+        self._shown: List[FreeboxEndpoint] = []
+        for endpoint in node.get("type", {}).get("endpoints", []):
+            self._add(FreeboxEndpoint(endpoint))
+        self.update(node)
+
+    def _add(self, endpoint: FreeboxEndpoint) -> FreeboxEndpoint:
+        self._by_key.setdefault((endpoint.ep_type, endpoint.name), endpoint)
+        self._by_id.setdefault(endpoint.id, endpoint)
+        return endpoint
+
+    def get(self, ep_type: str, name: str) -> Optional[FreeboxEndpoint]:
+        """Return the endpoint matching the type and name."""
+        return self._by_key.get((ep_type, name))
+
+    def by_id(self, endpoint_id) -> Optional[FreeboxEndpoint]:
+        """Return the endpoint with this id."""
+        return self._by_id.get(endpoint_id)
+
+    def shown(self) -> Iterator[FreeboxEndpoint]:
+        """Iterate over the endpoints having a value."""
+        return iter(self._shown)
+
+    def set_value(self, endpoint_id, value) -> bool:
+        """Store a new value, return True if it changed."""
+        endpoint = self._by_id.get(endpoint_id)
+        if endpoint is None or endpoint.value == value:
+            return False
+        endpoint.value = value
+        return True
+
+    def update(self, node: Dict[str, Any]) -> Dict[int, Any]:
+        """Update the values in place from a node snapshot, return the changed ones."""
+        changes: Dict[int, Any] = {}
+        shown: List[FreeboxEndpoint] = []
+        previous = {endpoint.id for endpoint in self._shown}
+        for raw in node["show_endpoints"]:
+            endpoint = self._by_id.get(raw["id"])
+            value = raw.get("value", VALUE_NOT_SET)
+            if endpoint is None:
+                endpoint = self._add(FreeboxEndpoint(raw))
+                changes[endpoint.id] = value
+            elif endpoint.value != value or endpoint.id not in previous:
+                endpoint.value = value
+                changes[endpoint.id] = value
+            shown.append(endpoint)
+        self._shown = shown
+        return changes
+
+    def as_dict(self) -> Dict[str, Any]:
+        """The fields needed to build the index again, in the get_home_nodes() format."""
+        return {
+            "endpoints":        [endpoint.as_dict(False) for endpoint in self._by_id.values()],
+            "show_endpoints":   [endpoint.as_dict(True) for endpoint in self._shown],
+        }
+
+
+class FreeboxNode:
+    """One Freebox Home device."""
+    __slots__ = ("id", "label", "category", "status", "props", "inherit", "endpoints")
+
+    def __init__(self, node: Dict[str, Any]) -> None:
+        self.id         = node["id"]
+        self.label      = node.get("label", "")
+        self.category   = node["category"]
+        self.status     = node.get("status")
+        self.props      = node.get("props", {})
+        self.inherit    = node.get("type", {}).get("inherit")
+        self.endpoints  = EndpointIndex(node)
+
+    def __repr__(self) -> str:
+        return f"FreeboxNode({self.id}, {self.category}, {self.label!r})"
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Compact node in the get_home_nodes() format, FreeboxNode(node.as_dict()) gives the node back."""
+        endpoints = self.endpoints.as_dict()
+        return {
+            "id":               self.id,
+            "label":            self.label,
+            "category":         self.category,
+            "status":           self.status,
+            "props":            self.props,
+            "type":             {"inherit": self.inherit, "endpoints": endpoints["endpoints"]},
+            "show_endpoints":   endpoints["show_endpoints"],
+        }
+
+    def update(self, node: Dict[str, Any]) -> Dict[Any, Any]:
+        """Update the node in place from a snapshot and return what changed.
+
+        Endpoint values are keyed by endpoint id, node fields (label, status)
+        by their name. An empty dict means the node did not change.
+        """
+        changes: Dict[Any, Any] = self.endpoints.update(node)
+        label = node.get("label", "")
+        if label != self.label:
+            self.label = changes["label"] = label
+        status = node.get("status")
+        if status != self.status:
+            self.status = changes["status"] = status
+        props = node.get("props", {})
+        if props != self.props:
+            self.props = props
+        return changes
@@ -0,0 +1,46 @@
+"""Last nodes snapshot, saved so the entities can be created before the Freebox answers."""
+import logging
+
+from typing import Any, Dict, List, Optional
+
+from homeassistant.core import callback
+from homeassistant.helpers.storage import Store
+
+from .const import STORAGE_KEY, STORAGE_VERSION, NODES_SAVE_DELAY
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class FreeboxNodesCache:
+    """Compact nodes of the last snapshot and the MAC address of the Freebox.
+
+    The cache is loaded once at startup and saved NODES_SAVE_DELAY seconds
+    after the last snapshot which changed something, from the nodes the
+    router holds at that time.
+    """
+
+    def __init__(self, hass, entry) -> None:
+        self._store = Store(hass, STORAGE_VERSION, f"{STORAGE_KEY}.{entry.entry_id}.nodes")
+        self._router = None
+        self.mac: Optional[str] = None
+        self.nodes: List[Dict[str, Any]] = []
+
+    async def async_load(self) -> None:
+        data = await self._store.async_load()
+        if data is None or not data.get("mac"):
+            return
+        self.mac = data["mac"]
+        self.nodes = data.get("nodes", [])
+        _LOGGER.debug("Loaded %d cached nodes", len(self.nodes))
+
+    @callback
+    def async_save(self, router) -> None:
+        self._router = router
+        self._store.async_delay_save(self._data_to_save, NODES_SAVE_DELAY)
+
+    @callback
+    def _data_to_save(self) -> Dict[str, Any]:
+        return {
+            "mac":      self._router.mac,
+            "nodes":    [node.as_dict() for node in self._router.nodes.values()],
+        }
@@ -0,0 +1,243 @@
+"""Opt-in profiler of the callbacks and coroutines run by the integration.
+
+Wrapped functions are timed when the profiler is enabled for their config
+entry, with its profile option, or during a profile window: callbacks as a
+whole, coroutines step by step (each step runs without yielding to the
+loop, so a long step is time the loop was blocked). Steps longer than the
+threshold are logged. A profile window additionally samples the stack of
+the event loop thread and writes the samples touching the integration to
+a file, in the folded format read by flamegraph tools.
+"""
+import asyncio
+import functools
+import logging
+import os
+import sys
+import threading
+import time
+
+from collections import Counter
+from typing import Any, Callable, Dict, Optional, Set
+
+from homeassistant.core import callback, is_callback
+
+from .const import DATA_PROFILER, PROFILE_SLOW_THRESHOLD, PROFILE_SAMPLE_INTERVAL
+
+_LOGGER = logging.getLogger(__name__)
+
+PACKAGE_DIR = os.path.dirname(__file__)
+
+
+class CallStats:
+    """Timing of one wrapped function."""
+    __slots__ = ("calls", "total", "max_step", "slow")
+
+    def __init__(self) -> None:
+        self.calls      = 0
+        self.total      = 0.0
+        self.max_step   = 0.0
+        self.slow       = 0
+
+
+class _TimedCoroutine:
+    """Await a coroutine, timing each of its steps."""
+    __slots__ = ("_coro", "_name", "_profiler")
+
+    def __init__(self, coro, name: str, profiler: "FreeboxProfiler") -> None:
+        self._coro = coro
+        self._name = name
+        self._profiler = profiler
+
+    def __await__(self):
+        coro = self._coro
+        value, error = None, None
+        while True:
+            start = time.perf_counter()
+            try:
+                if error is None:
+                    future = coro.send(value)
+                else:
+                    future = coro.throw(error)
+            except StopIteration as stop:
+                self._profiler.record_step(self._name, time.perf_counter() - start)
+                return stop.value
+            except BaseException:
+                self._profiler.record_step(self._name, time.perf_counter() - start)
+                raise
+            self._profiler.record_step(self._name, time.perf_counter() - start)
+            try:
+                value, error = (yield future), None
+            except GeneratorExit:
+                coro.close()
+                raise
+            except BaseException as err:  # pylint: disable=broad-except
+                value, error = None, err
+
+
+class _StackSampler(threading.Thread):
+    """Sample the stack of a thread, keep the stacks going through the integration."""
+
+    def __init__(self, thread_id: int, interval: float) -> None:
+        super().__init__(name="freebox_home profiler", daemon=True)
+        self._thread_id = thread_id
+        self._interval = interval
+        self._stop_event = threading.Event()
+        self.stacks: Counter = Counter()
+        self.samples = 0
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self._interval):
+            frame = sys._current_frames().get(self._thread_id)  # pylint: disable=protected-access
+            self.samples += 1
+            stack = []
+            ours = False
+            while frame is not None:
+                code = frame.f_code
+                ours = ours or code.co_filename.startswith(PACKAGE_DIR)
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if ours:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.join()
+
+
+class FreeboxProfiler:
+    """Timing of the functions wrapped with wrap(), shared by all the routers.
+
+    Each router enables it for its own entry only, a function wrapped
+    without an entry (the services) is timed when any entry enables it.
+    """
+
+    def __init__(self, hass) -> None:
+        self._hass = hass
+        self.enabled_entries: Set[str] = set()
+        self.threshold = PROFILE_SLOW_THRESHOLD
+        self.stats: Dict[str, CallStats] = {}
+        self._window_running = False
+
+    def entry(self, entry_id: str) -> "EntryProfiler":
+        """Return the profiler of one config entry."""
+        return EntryProfiler(self, entry_id)
+
+    def is_enabled(self, entry_id: Optional[str] = None) -> bool:
+        if self._window_running:
+            return True
+        if entry_id is None:
+            return bool(self.enabled_entries)
+        return entry_id in self.enabled_entries
+
+    def wrap(self, func: Callable, name: Optional[str] = None, entry_id: Optional[str] = None) -> Callable:
+        """Return func timed while the profiler is enabled for entry_id, keeping its callback or coroutine type."""
+        name = name or getattr(func, "__qualname__", repr(func))
+        profiler = self
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if not profiler.is_enabled(entry_id):
+                    return await func(*args, **kwargs)
+                profiler._call(name)
+                return await _TimedCoroutine(func(*args, **kwargs), name, profiler)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not profiler.is_enabled(entry_id):
+                return func(*args, **kwargs)
+            profiler._call(name)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profiler.record_step(name, time.perf_counter() - start)
+
+        return callback(wrapper) if is_callback(func) else wrapper
+
+    def _call(self, name: str) -> None:
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = self.stats[name] = CallStats()
+        stats.calls += 1
+
+    def record_step(self, name: str, duration: float) -> None:
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = self.stats[name] = CallStats()
+        stats.total += duration
+        stats.max_step = max(stats.max_step, duration)
+        if duration > self.threshold:
+            stats.slow += 1
+            _LOGGER.warning("%s blocked the event loop for %.1f ms", name, duration * 1000)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            name: {"calls": stats.calls, "total_ms": round(stats.total * 1000, 1),
+                   "max_step_ms": round(stats.max_step * 1000, 1), "slow": stats.slow}
+            for name, stats in sorted(self.stats.items(), key=lambda item: -item[1].total)
+        }
+
+    async def async_profile(self, duration: float, threshold: Optional[float] = None) -> str:
+        """Time and sample the event loop for `duration` seconds, return the report file."""
+        if self._window_running:
+            raise RuntimeError("A profile is already running")
+        self._window_running = True
+        previous_threshold = self.threshold
+        if threshold is not None:
+            self.threshold = threshold
+        self.stats = {}
+        sampler = _StackSampler(threading.get_ident(), PROFILE_SAMPLE_INTERVAL)
+        sampler.start()
+        try:
+            await asyncio.sleep(duration)
+        finally:
+            await self._hass.async_add_executor_job(sampler.stop)
+            self.threshold = previous_threshold
+            self._window_running = False
+
+        path = self._hass.config.path(f"freebox_home_profile_{time.strftime('%Y%m%d_%H%M%S')}.txt")
+        await self._hass.async_add_executor_job(self._write_report, path, duration, sampler)
+        return path
+
+    def _write_report(self, path: str, duration: float, sampler: _StackSampler) -> None:
+        with open(path, "w") as report:
+            report.write(f"# freebox_home profile, {duration}s, {sampler.samples} samples of the event loop, "
+                         f"{sum(sampler.stacks.values())} in the integration\n")
+            report.write("# name calls total_ms max_step_ms slow\n")
+            for name, stats in self.summary().items():
+                report.write(f"# {name} {stats['calls']} {stats['total_ms']} {stats['max_step_ms']} {stats['slow']}\n")
+            for stack, count in sampler.stacks.most_common():
+                report.write(f"{stack} {count}\n")
+
+
+class EntryProfiler:
+    """The shared profiler seen from one config entry."""
+    __slots__ = ("_profiler", "_entry_id")
+
+    def __init__(self, profiler: FreeboxProfiler, entry_id: str) -> None:
+        self._profiler = profiler
+        self._entry_id = entry_id
+
+    @property
+    def enabled(self) -> bool:
+        return self._entry_id in self._profiler.enabled_entries
+
+    @enabled.setter
+    def enabled(self, enabled: bool) -> None:
+        if enabled:
+            self._profiler.enabled_entries.add(self._entry_id)
+        else:
+            self._profiler.enabled_entries.discard(self._entry_id)
+
+    def wrap(self, func: Callable, name: Optional[str] = None) -> Callable:
+        return self._profiler.wrap(func, name, self._entry_id)
+
+
+def get_profiler(hass) -> FreeboxProfiler:
+    """Return the profiler of the integration."""
+    profiler = hass.data.get(DATA_PROFILER)
+    if profiler is None:
+        profiler = hass.data[DATA_PROFILER] = FreeboxProfiler(hass)
+    return profiler
@@ -0,0 +1,115 @@
+"""Listen to the Freebox OS event websocket to get home endpoint values pushed."""
+import asyncio
+import logging
+
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import aiohttp
+
+from freebox_api.exceptions import AuthorizationError, HttpRequestError
+
+from .const import PUSH_EVENTS, PUSH_HEARTBEAT, PUSH_RETRY_DELAY, PUSH_RETRY_MAX
+from .log_throttle import ThrottledLog
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class FreeboxEventStream:
+    """Websocket client for the /ws/event API.
+
+    The stream registers to the home events, forwards every endpoint value
+    change to `on_value` and reports its connection state to `on_connection`.
+    When the socket drops, or the session cannot be opened, it waits
+    `retry_delay` seconds and reconnects, the delay doubling after each
+    attempt failing before the registration, up to `retry_max`.
+    """
+
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        url: str,
+        get_headers: Callable[[], Awaitable[Dict[str, str]]],
+        on_value: Callable[[int, int, Any], None],
+        on_connection: Callable[[bool], None],
+        throttled_log: Optional[ThrottledLog] = None,
+        retry_delay: float = PUSH_RETRY_DELAY,
+        retry_max: float = PUSH_RETRY_MAX,
+    ) -> None:
+        self._session = session
+        self._url = url
+        self._get_headers = get_headers
+        self._on_value = on_value
+        self._on_connection = on_connection
+        self._throttled_log = throttled_log if throttled_log is not None else ThrottledLog()
+        self._retry_delay = retry_delay
+        self._retry_max = retry_max
+        self._failures = 0
+        self._ws: Optional[aiohttp.ClientWebSocketResponse] = None
+        self._stopped = False
+        self.connected = False
+
+    async def async_run(self) -> None:
+        """Keep the websocket open until stop() is called."""
+        while not self._stopped:
+            try:
+                await self._async_listen()
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as error:
+                _LOGGER.debug("Freebox event stream error: %s", repr(error))
+            except (AuthorizationError, HttpRequestError) as error:
+                # The session could not be opened, the Freebox may be restarting
+                self._throttled_log.warning(_LOGGER, "Freebox event stream unable to log in: %s", repr(error))
+            finally:
+                if not self.connected:
+                    self._failures += 1
+                self._set_connected(False)
+            if self._stopped:
+                break
+            await asyncio.sleep(min(self._retry_max, self._retry_delay * 2 ** max(self._failures - 1, 0)))
+
+    async def async_stop(self) -> None:
+        """Close the websocket and stop reconnecting."""
+        self._stopped = True
+        if self._ws is not None:
+            await self._ws.close()
+
+    async def _async_listen(self) -> None:
+        headers = await self._get_headers()
+        async with self._session.ws_connect(self._url, headers=headers, heartbeat=PUSH_HEARTBEAT) as ws:
+            self._ws = ws
+            await ws.send_json({"action": "register", "events": PUSH_EVENTS})
+            async for msg in ws:
+                if msg.type == aiohttp.WSMsgType.TEXT:
+                    try:
+                        message = msg.json()
+                    except ValueError:
+                        _LOGGER.debug("Invalid event frame: %s", msg.data)
+                        continue
+                    if not isinstance(message, dict):
+                        _LOGGER.debug("Unexpected event frame: %s", message)
+                        continue
+                    self._handle_message(message)
+                elif msg.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                    break
+        self._ws = None
+
+    def _handle_message(self, message: Dict[str, Any]) -> None:
+        action = message.get("action")
+        if action == "register":
+            if not message.get("success", False):
+                raise ValueError(f"Event registration refused: {message}")
+            self._failures = 0
+            self._set_connected(True)
+        elif action == "notification" and message.get("source") == "home":
+            result = message.get("result") or {}
+            node_id = result.get("node_id")
+            endpoint_id = result.get("ep_id", result.get("id"))
+            if node_id is None or endpoint_id is None:
+                _LOGGER.debug("Unexpected home event: %s", message)
+                return
+            self._on_value(node_id, endpoint_id, result.get("value"))
+
+    def _set_connected(self, connected: bool) -> None:
+        if self.connected == connected:
+            return
+        self.connected = connected
+        self._on_connection(connected)
@@ -3,77 +3,729 @@ from datetime import datetime, timedelta
 import logging
 import os
 import asyncio
-import json
+import aiohttp
+from functools import partial
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
 
 from freebox_api import Freepybox
 from freebox_api.exceptions import AuthorizationError, HttpRequestError, InsufficientPermissionsError
 
 from homeassistant.const import CONF_HOST, CONF_PORT
-from homeassistant.exceptions import ConfigEntryNotReady
+from homeassistant.core import callback
+from homeassistant.exceptions import ConfigEntryAuthFailed, ConfigEntryNotReady, HomeAssistantError
+from homeassistant.helpers import device_registry as dr
 from homeassistant.helpers.dispatcher import async_dispatcher_send
 from homeassistant.helpers.event import async_track_time_interval
 from homeassistant.util import slugify
 from homeassistant.helpers.storage import Store
+from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, UpdateFailed
 
-from .const import APP_DESC, DOMAIN, STORAGE_KEY, STORAGE_VERSION, API_VERSION
+from .const import (APP_DESC, DOMAIN, STORAGE_KEY, STORAGE_VERSION, API_VERSION, VALUE_NOT_SET, POLL_TICK, POLL_MAX_CONCURRENT,
+    POLL_BACKOFF, POLL_BOOST_DURATION, POLL_MAX_READS, BATCH_MAX_CONCURRENT, BATCH_RETRIES, BATCH_RETRY_DELAY, SCAN_INTERVAL,
+    SIGNAL_NODE_UPDATE, SIGNAL_CAPABILITIES, SIGNAL_MOTION, SIGNAL_NODE_NEW, SIGNAL_NODE_REMOVED, SIGNAL_CONNECTION, NODE_REMOVAL_SNAPSHOTS,
+    CONF_CACHE_TTL, DEFAULT_CACHE_TTL, CONF_POLL_CEILING, DEFAULT_POLL_CEILING, CONF_SCAN_CEILING, DEFAULT_SCAN_CEILING, CONF_SNAPSHOT_MAX_AGE, DEFAULT_SNAPSHOT_MAX_AGE,
+    CONF_SNAPSHOT_REFRESH, DEFAULT_SNAPSHOT_REFRESH, CONF_CAMERA_WORKER, DEFAULT_CAMERA_WORKER, CONF_FRAME_BUFFER_DEPTH,
+    DEFAULT_FRAME_BUFFER_DEPTH, CONF_FRAME_BUFFER_SIZE, DEFAULT_FRAME_BUFFER_SIZE, CONF_PROFILE, DEFAULT_PROFILE,
+    CONF_FRAME_EXPORT_KEEP, DEFAULT_FRAME_EXPORT_KEEP, CONF_CAMERA_LINKS, LOG_SUMMARY_INTERVAL)
+from .connection import CONNECTION_ERRORS, FreeboxConnection, FreeboxUnavailableError
+from .executor import FreeboxRequestExecutor, async_open_session
+from .invert import FreeboxInvertFlags
+from .log_throttle import ThrottledLog
+from .model import FreeboxNode
+from .nodes_cache import FreeboxNodesCache
+from .profiler import get_profiler
+from .push import FreeboxEventStream
 
 _LOGGER = logging.getLogger(__name__)
-SCAN_INTERVAL = timedelta(seconds=30)
+
+# Alarm states during which the sensors are polled at their fastest interval
+ALARM_INACTIVE_STATES = ("idle", None, VALUE_NOT_SET)
+# Alarm states sent to the cameras as an event
+ALARM_ALERT_STATES = ("alert", "alarm1_alert_timer", "alarm2_alert_timer")
 
 class FreeboxRouter:
     """Representation of a Freebox router."""
 
-    def __init__(self, hass, entry, api, fbx_config) -> None:
+    def __init__(self, hass, entry, api, nodes_cache: Optional[FreeboxNodesCache] = None) -> None:
         """Initialize a Freebox router."""
         self.hass = hass
+        self._entry = entry
         self._host = entry.data[CONF_HOST]
         self._port = entry.data[CONF_PORT]
         self._api = api
+        self.profiler = get_profiler(hass).entry(entry.entry_id)
+        self.profiler.enabled = entry.options.get(CONF_PROFILE, DEFAULT_PROFILE)
+        self.connection = FreeboxConnection(api, self.profiler.wrap(self._handle_connection_change))
+        self.executor = FreeboxRequestExecutor(api, cache_ttl=entry.options.get(CONF_CACHE_TTL, DEFAULT_CACHE_TTL), connection=self.connection)
+
+        self.nodes: Dict[int, FreeboxNode] = {}
+        self.unsupported_nodes: Dict[str, List[Dict[str, Any]]] = {}   # nodes of the last snapshot by category
+        self.throttled_log = ThrottledLog()
+        self._unsub_log_summary = async_track_time_interval(hass, self.profiler.wrap(self._async_log_summary), timedelta(seconds=LOG_SUMMARY_INTERVAL))
+        self.covers: Dict[str, Any] = {}     # cover entities by entity_id, for the group commands
+        self.invert = FreeboxInvertFlags(hass, entry)
+        self.nodes_cache = nodes_cache if nodes_cache is not None else FreeboxNodesCache(hass, entry)
+        self._pending_changes: Dict[int, Dict[Any, Any]] = {}
+        self._new_nodes: Set[int] = set()
+        self._removed_nodes: Set[int] = set()
+        self._missing_nodes: Dict[int, int] = {}    # snapshots each known node was missing from
+
+        # Capabilities, kept up to date as snapshots and pushed values arrive
+        self.has_alarm2 = False
+        self._alarm2_nodes: Set[int] = set()
+        self.alarm_active = False
+        self._active_alarms: Set[int] = set()
+
+        # Polling, slower while nothing happens
+        self.poll_ceiling = timedelta(seconds=entry.options.get(CONF_POLL_CEILING, DEFAULT_POLL_CEILING))
+        self.scan_ceiling = timedelta(seconds=entry.options.get(CONF_SCAN_CEILING, DEFAULT_SCAN_CEILING))
+        self._scan_interval = SCAN_INTERVAL
 
-        self.nodes: Dict[str, Any] = {}
+        # Camera snapshots
+        self.snapshot_max_age = entry.options.get(CONF_SNAPSHOT_MAX_AGE, DEFAULT_SNAPSHOT_MAX_AGE)
+        self.snapshot_refresh = entry.options.get(CONF_SNAPSHOT_REFRESH, DEFAULT_SNAPSHOT_REFRESH)
+        self.camera_worker    = entry.options.get(CONF_CAMERA_WORKER, DEFAULT_CAMERA_WORKER)
+        self.frame_buffer_depth = entry.options.get(CONF_FRAME_BUFFER_DEPTH, DEFAULT_FRAME_BUFFER_DEPTH)
+        self.frame_buffer_size  = entry.options.get(CONF_FRAME_BUFFER_SIZE, DEFAULT_FRAME_BUFFER_SIZE) * 2**20
+        self.frame_export_keep  = entry.options.get(CONF_FRAME_EXPORT_KEEP, DEFAULT_FRAME_EXPORT_KEEP)
+        self.camera_links: Dict[int, Set[int]] = {
+            int(camera_id): set(node_ids) for camera_id, node_ids in entry.options.get(CONF_CAMERA_LINKS, {}).items()
+        }
         
-        # System
-        self.mac   = "FbxHome_" + fbx_config["mac"]
+        # System, known once async_setup() is done
+        self.mac   = None
 
         # Devices & sensors
-        self._unsub_dispatcher = async_track_time_interval(self.hass, self.update_all, SCAN_INTERVAL)
+        self.coordinator = DataUpdateCoordinator(
+            hass,
+            _LOGGER,
+            config_entry=entry,
+            name=DOMAIN,
+            update_method=self.profiler.wrap(self._async_fetch_nodes),
+            update_interval=SCAN_INTERVAL,
+        )
+        self._unsub_coordinator = self.coordinator.async_add_listener(self.profiler.wrap(self._handle_coordinator_update))
+        self.scheduler = FreeboxPollScheduler(hass, self)
 
+        # Event websocket
+        self._push: Optional[FreeboxEventStream] = None
+        self._push_task: Optional[asyncio.Task] = None
 
-    async def update_all(self, now: Optional[datetime] = None) -> None:
-        """Update all nodes"""
-        try:
-            fbx_nodes: Dict[str, Any] = await self._api.home.get_home_nodes()
+    async def async_setup(self, cached: bool = False) -> None:
+        """Fetch the Freebox configuration, the first snapshot and the stored flags concurrently
 
+        With `cached`, the nodes of the cache loaded by the caller are used
+        right away and async_reconcile() reads the first snapshot later.
+        """
+        if( cached ):
+            await self.invert.async_load()
+            self.mac = self.nodes_cache.mac
+            for fbx_node in self.nodes_cache.nodes:
+                self._apply_node(fbx_node)
+        else:
+            fbx_config, _, _ = await asyncio.gather(
+                self.executor.get_config(),
+                self.coordinator.async_config_entry_first_refresh(),
+                self.invert.async_load(),
+            )
+            self.mac   = "FbxHome_" + fbx_config["mac"]
+            self.nodes_cache.async_save(self)
 
-        except InsufficientPermissionsError as error:
-            _LOGGER.error("InsufficientPermissionsError: You need to browse http://mafreebox.freebox.fr/#Fbx.os.app.settings.Accounts and grant the access policy: \"Gestion de l'alarme et maison connectée\"")
+        # Files of the previous versions, named after the switch unique id
+        await self.invert.async_migrate([
+            (node_id, get_path(self.hass, f"{self.mac}-node_{node_id}_InvertSwitch_InvertSwitch"))
+            for node_id, node in self.nodes.items() if node.category in ("shutter", "opener")
+        ])
+
+    @callback
+    def _async_log_summary(self, now: Optional[datetime] = None) -> None:
+        self.throttled_log.summarize()
+
+    @callback
+    def async_reconcile(self) -> None:
+        """Read the first snapshot in the background, the entities built from the cache get its changes
+
+        The token is only checked by this first request: when the Freebox
+        refuses it, _async_fetch_nodes() raises ConfigEntryAuthFailed and the
+        coordinator starts the reauthentication of the entry.
+        """
+        self._entry.async_create_background_task(self.hass, self.coordinator.async_refresh(), "freebox_home first snapshot")
+
+    def signal_node_update(self, node_id) -> str:
+        """Dispatcher signal sent with the change set of a node"""
+        return SIGNAL_NODE_UPDATE.format(self._entry.entry_id, node_id)
+
+    @property
+    def device_info(self) -> Dict[str, Any]:
+        """Device of the entities describing the integration itself"""
+        return {
+            "identifiers": {(DOMAIN, self.mac)},
+            "name": "Freebox Home",
+            "manufacturer": "Free SAS",
+            "model": "Freebox Delta",
+        }
+
+    @property
+    def signal_node_new(self) -> str:
+        """Dispatcher signal sent with the ids of the nodes paired since the previous snapshot"""
+        return SIGNAL_NODE_NEW.format(self._entry.entry_id)
+
+    @property
+    def signal_node_removed(self) -> str:
+        """Dispatcher signal sent with the id of a node removed from the Freebox"""
+        return SIGNAL_NODE_REMOVED.format(self._entry.entry_id)
+
+    @property
+    def signal_connection(self) -> str:
+        """Dispatcher signal sent when the Freebox stops or starts answering"""
+        return SIGNAL_CONNECTION.format(self._entry.entry_id)
+
+    @property
+    def available(self) -> bool:
+        return self.connection.available
+
+    @property
+    def signal_capabilities(self) -> str:
+        """Dispatcher signal sent when a capability flag flipped"""
+        return SIGNAL_CAPABILITIES.format(self._entry.entry_id)
+
+    @property
+    def signal_motion(self) -> str:
+        """Dispatcher signal sent with the node id of a sensor or alarm detecting something"""
+        return SIGNAL_MOTION.format(self._entry.entry_id)
+
+    @callback
+    def fire_motion(self, node_id) -> None:
+        async_dispatcher_send(self.hass, self.signal_motion, node_id)
+
+    @property
+    def push_connected(self) -> bool:
+        """Return True when endpoint values are pushed by the Freebox"""
+        return self._push is not None and self._push.connected
+
+    async def async_get_home_endpoint_value(self, node_id, endpoint_id):
+        """Read the current value of one endpoint"""
+        if( self.push_connected ):
+            # The websocket keeps the nodes up to date, no need to ask the Freebox
+            node = self.nodes.get(node_id)
+            endpoint = node.endpoints.by_id(endpoint_id) if node is not None else None
+            if( endpoint is not None ):
+                return endpoint.value
+        return await self.executor.get_home_endpoint_value(node_id, endpoint_id)
+
+    async def async_get_home_endpoint_values(self, keys: List[Tuple[int, int]]) -> Dict[Tuple[int, int], Any]:
+        """Read the current value of several endpoints, with at most one request"""
+        values: Dict[Tuple[int, int], Any] = {}
+        missing = []
+        for node_id, endpoint_id in keys:
+            node = self.nodes.get(node_id) if self.push_connected else None
+            endpoint = node.endpoints.by_id(endpoint_id) if node is not None else None
+            if( endpoint is not None ):
+                values[(node_id, endpoint_id)] = endpoint.value
+            else:
+                missing.append((node_id, endpoint_id))
+        if( missing ):
+            values.update(await self.executor.get_home_endpoint_values(missing))
+        return values
+
+    async def async_set_home_endpoint_value(self, node_id, endpoint_id, value):
+        """Write a value to one endpoint"""
+        await self.executor.set_home_endpoint_value(node_id, endpoint_id, value)
+
+    async def async_batch_set(self, writes: List[Tuple[int, int, Any]]) -> List[Optional[Exception]]:
+        """Send (node_id, endpoint_id, value) writes concurrently, return the error of each write, None once it succeeded
+
+        Writes to an endpoint the node does not have (VALUE_NOT_SET) are not sent.
+        """
+        semaphore = asyncio.Semaphore(BATCH_MAX_CONCURRENT)
+
+        async def write(node_id, endpoint_id, value):
+            for attempt in range(BATCH_RETRIES + 1):
+                try:
+                    async with semaphore:
+                        await self.executor.set_home_endpoint_value(node_id, endpoint_id, {"value": value})
+                    return None
+                except InsufficientPermissionsError as error:
+                    return error
+                except (HttpRequestError, aiohttp.ClientError, asyncio.TimeoutError) as error:
+                    _LOGGER.debug("Write %s/%s failed (attempt %d): %s", node_id, endpoint_id, attempt + 1, repr(error))
+                    if( attempt == BATCH_RETRIES ):
+                        return error
+                    await asyncio.sleep(BATCH_RETRY_DELAY * (attempt + 1))
+
+        errors: List[Optional[Exception]] = [None] * len(writes)
+        sent = []
+        for index, item in enumerate(writes):
+            if( item[1] == VALUE_NOT_SET ):
+                errors[index] = HomeAssistantError(f"Endpoint not found on node {item[0]}")
+            else:
+                sent.append(index)
+        for index, error in zip(sent, await asyncio.gather(*[write(*writes[index]) for index in sent])):
+            errors[index] = error
+        for node_id in {writes[index][0] for index in sent}:
+            self.boost(node_id)
+        return errors
+
+    @callback
+    def boost(self, node_id) -> None:
+        """Something was asked to a node: poll it and the snapshot at the fastest pace again"""
+        self.scheduler.boost(node_id)
+        self._reset_scan_interval()
+
+    @callback
+    def _reset_scan_interval(self) -> None:
+        if( self._scan_interval != SCAN_INTERVAL ):
+            self._scan_interval = SCAN_INTERVAL
+            if( not self.push_connected ):
+                self.coordinator.update_interval = SCAN_INTERVAL
+                # Reschedule now, the pending refresh may be up to scan_ceiling away
+                self.hass.async_create_task(self.coordinator.async_request_refresh())
+
+
+    async def async_start_push(self) -> None:
+        """Open the event websocket, polling is used again while it is down"""
+        access = self._api._access
+        url = access.base_url.replace("https://", "wss://", 1) + "ws/event"
+
+        async def get_headers() -> Dict[str, str]:
+            if( access.session_token is None ):
+                await access._refresh_session_token()
+            return access._get_headers()
+
+        self._push = FreeboxEventStream(access.session, url, get_headers,
+            self.profiler.wrap(self._handle_pushed_value), self.profiler.wrap(self._handle_push_connection), self.throttled_log)
+        self._push_task = self._entry.async_create_background_task(self.hass, self._push.async_run(), "freebox_home event stream")
+
+    @callback
+    def _handle_pushed_value(self, node_id, endpoint_id, value) -> None:
+        self.executor.store(node_id, endpoint_id, value)
+        node = self.nodes.get(node_id)
+        if( node is not None and node.endpoints.set_value(endpoint_id, value) ):
+            self._update_capabilities(node_id, {endpoint_id})
+        self.scheduler.push(node_id, endpoint_id, value)
+        async_dispatcher_send(self.hass, self.signal_node_update(node_id), {endpoint_id: value})
+
+    @callback
+    def _handle_push_connection(self, connected: bool) -> None:
+        if( connected ):
+            # Nodes added, removed or renamed are not pushed, keep a slow snapshot for them
+            _LOGGER.debug("Freebox event stream connected, polling paused")
+            self.scheduler.pause()
+            self.coordinator.update_interval = self.scan_ceiling
+            return
+        _LOGGER.debug("Freebox event stream lost, polling resumed")
+        self.scheduler.resume()
+        self._scan_interval = SCAN_INTERVAL
+        self.coordinator.update_interval = SCAN_INTERVAL
+        # Events may have been missed while the socket was down
+        self.hass.async_create_task(self.coordinator.async_request_refresh())
+
+    @callback
+    def _handle_connection_change(self, available: bool) -> None:
+        """Let the entities follow the Freebox, the pollers skip their ticks while it is down"""
+        async_dispatcher_send(self.hass, self.signal_connection)
+        if( not available ):
             return
+        # Nothing was read while the Freebox was down
+        self._scan_interval = SCAN_INTERVAL
+        if( not self.push_connected ):
+            self.coordinator.update_interval = SCAN_INTERVAL
+        self.hass.async_create_task(self.coordinator.async_request_refresh())
+
+    async def update_all(self) -> None:
+        """Update all nodes"""
+        await self.coordinator.async_refresh()
 
+    async def _async_fetch_nodes(self) -> Dict[int, FreeboxNode]:
+        try:
+            fbx_nodes = await self.executor.get_home_nodes()
+        except AuthorizationError as error:
+            if( "invalid_token" in str(error) ):
+                # Revoked from Freebox OS, the reauthentication asks for a new token
+                _LOGGER.error("The Freebox revoked the application token, please authorize Freebox Home again")
+                await remove_config(self.hass, self._host)
+            # Starts the reauthentication of the entry
+            raise ConfigEntryAuthFailed(repr(error)) from error
+        except InsufficientPermissionsError as error:
+            raise ConfigEntryAuthFailed("InsufficientPermissionsError: You need to browse http://mafreebox.freebox.fr/#Fbx.os.app.settings.Accounts and grant the access policy: \"Gestion de l'alarme et maison connectée\"") from error
+        except HttpRequestError as error:
+            raise UpdateFailed(repr(error)) from error
+
+        # Apply the snapshot right away so the raw payload is not kept by the coordinator
+        changed = False
+        seen = set()
+        unsupported: Dict[str, List[Dict[str, Any]]] = {}
         for fbx_node in fbx_nodes:
             if( fbx_node["category"] not in ["pir","camera","alarm","dws","kfb","basic_shutter","shutter","opener"] ):
-                _LOGGER.warning("Node not supported: \n" +str(fbx_node))
+                unsupported.setdefault(fbx_node["category"], []).append({
+                    "id": fbx_node["id"],
+                    "label": fbx_node.get("label"),
+                    "inherit": fbx_node.get("type", {}).get("inherit"),
+                })
+                self.throttled_log.warning(_LOGGER, "Node not supported: %s (id %s, category %s)", fbx_node.get("label"), fbx_node["id"], fbx_node["category"])
+                _LOGGER.debug("Unsupported node: %s", fbx_node)
+                continue
+            seen.add(fbx_node["id"])
+            if( fbx_node["id"] not in self.nodes ):
+                self._new_nodes.add(fbx_node["id"])
+            changes = self._apply_node(fbx_node)
+            if( changes ):
+                changed = True
+                self._pending_changes.setdefault(fbx_node["id"], {}).update(changes)
+
+        self.unsupported_nodes = unsupported
+
+        # A node missing from a single snapshot may only be a glitch of the Freebox
+        for node_id in list(self.nodes):
+            if( node_id in seen ):
+                self._missing_nodes.pop(node_id, None)
                 continue
-            self.nodes[fbx_node["id"]] = fbx_node
+            self._missing_nodes[node_id] = self._missing_nodes.get(node_id, 0) + 1
+            if( self._missing_nodes[node_id] >= NODE_REMOVAL_SNAPSHOTS ):
+                self._remove_node(node_id)
+                changed = True
+
+        if( changed and self.mac is not None ):
+            self.nodes_cache.async_save(self)
+
+        # Set before the coordinator schedules the next refresh
+        if( changed or self.alarm_active ):
+            self._scan_interval = SCAN_INTERVAL
+        else:
+            self._scan_interval = min(self._scan_interval * POLL_BACKOFF, self.scan_ceiling)
+        self.coordinator.update_interval = self.scan_ceiling if self.push_connected else self._scan_interval
+        return self.nodes
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        """Send each changed node its change set"""
+        _LOGGER.debug("Request executor: %s", self.executor.stats)
+        pending, self._pending_changes = self._pending_changes, {}
+        new_nodes, self._new_nodes = self._new_nodes, set()
+        removed_nodes, self._removed_nodes = self._removed_nodes, set()
+
+        for node_id in removed_nodes:
+            _LOGGER.info("Node %s removed from the Freebox", node_id)
+            async_dispatcher_send(self.hass, self.signal_node_removed, node_id)
+            device = dr.async_get(self.hass).async_get_device(identifiers={(DOMAIN, node_id)})
+            if( device is not None ):
+                dr.async_get(self.hass).async_update_device(device.id, remove_config_entry_id=self._entry.entry_id)
+        if( new_nodes ):
+            _LOGGER.info("New nodes on the Freebox: %s", sorted(new_nodes))
+            async_dispatcher_send(self.hass, self.signal_node_new, new_nodes)
+        for node_id, changes in pending.items():
+            if( node_id not in new_nodes ):
+                async_dispatcher_send(self.hass, self.signal_node_update(node_id), changes)
+
+    def _apply_node(self, fbx_node: Dict[str, Any]) -> Dict[Any, Any]:
+        """Store a node snapshot and return what changed"""
+        node = self.nodes.get(fbx_node["id"])
+        if( node is None ):
+            self.nodes[fbx_node["id"]] = FreeboxNode(fbx_node)
+            self._update_capabilities(fbx_node["id"], None)
+            return {"label": fbx_node.get("label")}
+
+        changes = node.update(fbx_node)
+        if( changes ):
+            self._update_capabilities(fbx_node["id"], changes)
+        return changes
 
-        #fbx_node = json.loads('{"adapter":0,"area":29,"category":"shutter","group":{"label":"Chambre"},"id":25,"label":"Volet Chambre","name":"node_25","props":{"Address":5187680,"ArcId":9},"show_endpoints":[{"category":"","ep_type":"slot","id":0,"label":"Consigne d\'ouverture","name":"position_set","ui":{"access":"w","display":"slider","icon_url":"/resources/images/home/pictos/volet_3.png","range":[0,100],"unit":"%"},"value":0,"value_type":"int","visibility":"normal"},{"category":"","ep_type":"slot","id":1,"label":"Stop","name":"stop","ui":{"access":"w","display":"button"},"value":null,"value_type":"void","visibility":"normal"},{"category":"","ep_type":"slot","id":2,"label":"Toggle","name":"toggle","ui":{"access":"w","display":"button"},"value":null,"value_type":"void","visibility":"normal"},{"category":"","ep_type":"signal","id":4,"label":"Consigne d\'ouverture","name":"position_set","refresh":2000,"ui":{"access":"r","display":"slider","icon_url":"/resources/images/home/pictos/volet_3.png","range":[0,100],"unit":"%"},"value":0,"value_type":"int","visibility":"normal"},{"category":"","ep_type":"signal","id":5,"label":"État","name":"state","refresh":2000,"ui":{"access":"r","display":"text"},"value":"xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx","value_type":"string","visibility":"normal"}],"signal_links":[],"slot_links":[],"status":"active","type":{"abstract":false,"endpoints":[{"ep_type":"slot","id":0,"label":"Consigne d\'ouverture","name":"position_set","value_type":"int","visiblity":"normal"},{"ep_type":"slot","id":1,"label":"Stop","name":"stop","value_type":"void","visiblity":"normal"},{"ep_type":"slot","id":2,"label":"Toggle","name":"toggle","value_type":"void","visiblity":"normal"},{"ep_type":"slot","id":3,"label":"Consigne d\'ouverture","name":"position","value_type":"int","visiblity":"normal"},{"ep_type":"signal","id":4,"label":"Consigne d\'ouverture","name":"position_set","param_type":"void","value_type":"int","visiblity":"normal"},{"ep_type":"signal","id":5,"label":"État","name":"state","param_type":"void","value_type":"string","visiblity":"normal"}],"generic":false,"icon":"/resources/images/home/pictos/volet_3.png","inherit":"node::ios","label":"Volet roulant","name":"node::ios::2","params":{},"physical":true}}')
-        #self.nodes[fbx_node["id"]] = fbx_node
+    def _remove_node(self, node_id) -> None:
+        """Forget a node and the capabilities it provided"""
+        del self.nodes[node_id]
+        self._missing_nodes.pop(node_id, None)
+        self._pending_changes.pop(node_id, None)
+        self._new_nodes.discard(node_id)
+        self._removed_nodes.add(node_id)
+
+        self._active_alarms.discard(node_id)
+        alarm_active = len(self._active_alarms) > 0
+        if( alarm_active != self.alarm_active ):
+            self.alarm_active = alarm_active
+            self.scheduler.set_alert(alarm_active)
+
+        self._alarm2_nodes.discard(node_id)
+        has_alarm2 = len(self._alarm2_nodes) > 0
+        if( has_alarm2 != self.has_alarm2 ):
+            self.has_alarm2 = has_alarm2
+            async_dispatcher_send(self.hass, self.signal_capabilities)
+
+    @callback
+    def _handle_polled_value(self, node_id, endpoint_id, value) -> None:
+        """Keep the node up to date with the values read by the scheduler"""
+        node = self.nodes.get(node_id)
+        if( node is not None and node.endpoints.set_value(endpoint_id, value) ):
+            self._update_capabilities(node_id, {endpoint_id})
+
+    def _update_capabilities(self, node_id, changed) -> None:
+        """Refresh the capability flags for one node, changed=None means a new node"""
+        node = self.nodes[node_id]
+        state = node.endpoints.get("signal", "state") if node.category == "alarm" else None
+        if( state is not None and (changed is None or state.id in changed) ):
+            if( changed is not None and state.value in ALARM_ALERT_STATES ):
+                self.fire_motion(node_id)
+            if( state.value in ALARM_INACTIVE_STATES ):
+                self._active_alarms.discard(node_id)
+            else:
+                self._active_alarms.add(node_id)
+            alarm_active = len(self._active_alarms) > 0
+            if( alarm_active != self.alarm_active ):
+                self.alarm_active = alarm_active
+                self.scheduler.set_alert(alarm_active)
+                if( alarm_active ):
+                    self._reset_scan_interval()
+
+        alarm2 = node.endpoints.get("signal", "alarm2")
+        if( alarm2 is None or (changed is not None and alarm2.id not in changed) ):
+            return
+        if( alarm2.value == True ):
+            self._alarm2_nodes.add(node_id)
+        else:
+            self._alarm2_nodes.discard(node_id)
+
+        has_alarm2 = len(self._alarm2_nodes) > 0
+        if( has_alarm2 != self.has_alarm2 ):
+            self.has_alarm2 = has_alarm2
+            async_dispatcher_send(self.hass, self.signal_capabilities)
 
     async def close(self) -> None:
-        """Close the connection."""
-        if self._api is not None:
-            await self._api.close()
-            self._unsub_dispatcher()
-        self._api = None
+        """Stop everything sending requests, then log out."""
+        if self._api is None:
+            return
+        self.profiler.enabled = False
+        self._unsub_log_summary()
+        try:
+            self.scheduler.stop()
+            self._unsub_coordinator()
+            await self.coordinator.async_shutdown()
+            if self._push is not None:
+                await self._push.async_stop()
+                self._push_task.cancel()
+                self._push = None
+            await self.connection.async_stop()
+        finally:
+            self._api = None
+            await self.executor.close()
+
+
+class PollSubscription:
+    """One entity waiting for the value of an endpoint.
+
+    A subscription without max_interval is read every min_interval. Otherwise
+    its interval doubles after each read returning the same value, up to
+    max_interval, and drops back to min_interval for POLL_BOOST_DURATION
+    seconds when the value changes or the node is boosted. Subscriptions
+    following the alarm stay at min_interval while the alarm is active.
+    """
+    __slots__ = ("min_interval", "max_interval", "interval", "follow_alarm", "boost_until", "next_due", "listener")
+
+    def __init__(self, interval: float, max_interval: Optional[float], follow_alarm: bool, listener: Callable[[Any], None]) -> None:
+        self.min_interval   = interval
+        self.max_interval   = max(max_interval, interval) if max_interval is not None else interval
+        self.interval       = interval
+        self.follow_alarm   = follow_alarm
+        self.boost_until    = 0.0
+        self.next_due       = 0.0
+        self.listener       = listener
+
+    def boost(self, now: float) -> None:
+        self.interval       = self.min_interval
+        self.boost_until    = now + POLL_BOOST_DURATION
+
+    def reschedule(self, now: float, alert: bool) -> None:
+        if( now < self.boost_until or (alert and self.follow_alarm) ):
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * POLL_BACKOFF, self.max_interval)
+        self.next_due = now + self.interval
+
+
+class FreeboxPollScheduler:
+    """Group the endpoint reads of all the entities into one poll per tick.
+
+    Entities register the (node, endpoint) they want to watch with an interval.
+    On each tick, every endpoint that at least one subscriber is waiting for is
+    read once and the value is sent to all the subscribers of that endpoint.
+    The reads of a tick are sent as a single request. If the Freebox refuses
+    it, they are sent one by one, POLL_MAX_READS per tick with at most
+    POLL_MAX_CONCURRENT in flight, the others wait for the next ticks.
+    """
+
+    def __init__(self, hass, router: FreeboxRouter, max_concurrent: int = POLL_MAX_CONCURRENT) -> None:
+        self._hass = hass
+        self._router = router
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._subscriptions: Dict[Tuple[int, int], List[PollSubscription]] = {}
+        self._values: Dict[Tuple[int, int], Any] = {}
+        self._unsub_timer = None
+        self._running = False
+        self._paused = False
+        self._alert = False
+        self._batch = True      # cleared if the Freebox refuses the multiple endpoints read
+
+    def register(self, node_id, endpoint_id, interval: timedelta, listener: Callable[[Any], None],
+                 max_interval: Optional[timedelta] = None, follow_alarm: bool = False) -> Callable[[], None]:
+        """Watch an endpoint, return the function to call to stop watching it.
+
+        Give a max_interval to let the interval grow while the value does not
+        change, and follow_alarm to keep it at `interval` while the alarm is on.
+        """
+        key = (node_id, endpoint_id)
+        listener = self._router.profiler.wrap(listener)
+        subscription = PollSubscription(
+            interval.total_seconds(),
+            max_interval.total_seconds() if max_interval is not None else None,
+            follow_alarm,
+            listener,
+        )
+        self._subscriptions.setdefault(key, []).append(subscription)
+        if( self._unsub_timer is None ):
+            self._unsub_timer = async_track_time_interval(self._hass, self._router.profiler.wrap(self._async_tick), timedelta(seconds=POLL_TICK))
+
+        @callback
+        def unregister() -> None:
+            subscriptions = self._subscriptions.get(key)
+            if( subscriptions is None or subscription not in subscriptions ):
+                return
+            subscriptions.remove(subscription)
+            if( not subscriptions ):
+                del self._subscriptions[key]
+                self._values.pop(key, None)
+
+        return unregister
+
+    def stop(self) -> None:
+        """Stop the scheduler timer."""
+        if( self._unsub_timer is not None ):
+            self._unsub_timer()
+            self._unsub_timer = None
+
+    def pause(self) -> None:
+        """Stop reading endpoints, values are expected to be pushed."""
+        self._paused = True
+
+    def resume(self) -> None:
+        """Read endpoints again on each tick."""
+        self._paused = False
+
+    @callback
+    def boost(self, node_id) -> None:
+        """Read the endpoints of a node on the next tick and keep them fast for a while."""
+        now = self._hass.loop.time()
+        for (sub_node_id, _), subscriptions in self._subscriptions.items():
+            if( sub_node_id != node_id ):
+                continue
+            for subscription in subscriptions:
+                subscription.boost(now)
+                subscription.next_due = now
+
+    @callback
+    def set_alert(self, alert: bool) -> None:
+        """The alarm is arming, armed or ringing: read the alarm-following endpoints at their fastest interval."""
+        self._alert = alert
+        if( not alert ):
+            return
+        now = self._hass.loop.time()
+        for subscriptions in self._subscriptions.values():
+            for subscription in subscriptions:
+                if( subscription.follow_alarm ):
+                    subscription.interval = subscription.min_interval
+                    subscription.next_due = min(subscription.next_due, now)
+
+    @callback
+    def push(self, node_id, endpoint_id, value) -> None:
+        """Send a value received from the Freebox to the subscribers of the endpoint."""
+        key = (node_id, endpoint_id)
+        subscriptions = self._subscriptions.get(key)
+        if( not subscriptions ):
+            return
+        if( self._store_value(key, value) ):
+            now = self._hass.loop.time()
+            for subscription in subscriptions:
+                subscription.boost(now)
+        for subscription in list(subscriptions):
+            subscription.listener(value)
+
+    def _store_value(self, key: Tuple[int, int], value) -> bool:
+        """Remember the last value of an endpoint, return True if it changed."""
+        changed = key in self._values and self._values[key] != value
+        self._values[key] = value
+        return changed
+
+    async def _async_tick(self, now: Optional[datetime] = None) -> None:
+        if( self._paused or not self._router.available ):
+            return
+        if( self._running ):
+            _LOGGER.debug("Previous poll still running, tick skipped")
+            self._router.executor.metrics.poll_overruns += 1
+            return
+
+        # Half a tick of tolerance so a timer firing slightly early does not delay a read by a whole tick
+        deadline = self._hass.loop.time() + POLL_TICK / 2
+        due = {key: min(subscription.next_due for subscription in subscriptions)
+                for key, subscriptions in self._subscriptions.items()}
+        # Longest waiting first, for the reads postponed to the next tick
+        due = sorted((key for key, next_due in due.items() if next_due <= deadline), key=due.get)
+        if( not due ):
+            return
+
+        self._running = True
+        try:
+            if( not self._batch or not await self._async_poll_batch(due, deadline) ):
+                await asyncio.gather(*[self._async_poll(key, deadline) for key in due[:POLL_MAX_READS]])
+        finally:
+            self._running = False
+
+    async def _async_poll_batch(self, due: List[Tuple[int, int]], deadline: float) -> bool:
+        """Read all the due endpoints with one request, the request rate does not grow with the devices.
+
+        Return False when the Freebox cannot do it, the endpoints are then read one by one from now on.
+        """
+        try:
+            values = await self._router.async_get_home_endpoint_values(due)
+        except FreeboxUnavailableError:
+            return True
+        except CONNECTION_ERRORS as error:
+            _LOGGER.debug("Unable to poll %d endpoints: %s", len(due), repr(error))
+            return True
+        except Exception as error:
+            _LOGGER.info("The Freebox cannot read several endpoints at once (%s), reading %d endpoints per tick instead", repr(error), POLL_MAX_READS)
+            self._batch = False
+            return False
+        for key, value in values.items():
+            self._deliver(key, value, deadline)
+        return True
+
+    async def _async_poll(self, key: Tuple[int, int], deadline: float) -> None:
+        async with self._semaphore:
+            try:
+                value = await self._router.async_get_home_endpoint_value(*key)
+            except Exception as error:
+                _LOGGER.debug("Unable to poll endpoint %s/%s: %s", key[0], key[1], repr(error))
+                return
+        self._deliver(key, value, deadline)
+
+    def _deliver(self, key: Tuple[int, int], value, deadline: float) -> None:
+        subscriptions = self._subscriptions.get(key)
+        if( not subscriptions ):
+            return
+        now = self._hass.loop.time()
+        if( self._store_value(key, value) ):
+            for subscription in subscriptions:
+                subscription.boost(now)
+        self._router._handle_polled_value(*key, value)
+        for subscription in list(subscriptions):
+            if( subscription.next_due <= deadline ):
+                subscription.reschedule(now, self._alert)
+            subscription.listener(value)
 
 
 
 
 async def async_get_path(hass, name):
     freebox_path = Store(hass, STORAGE_VERSION, STORAGE_KEY).path
-    if not os.path.exists(freebox_path):
-        await hass.async_add_executor_job(os.makedirs, freebox_path)
+    await hass.async_add_executor_job(partial(os.makedirs, freebox_path, exist_ok=True))
     return Path(f"{freebox_path}/{slugify(name)}.conf")
 
 def get_path(hass, name):
@@ -81,14 +733,23 @@ def get_path(hass, name):
     return Path(f"{freebox_path}/{slugify(name)}.conf")
 
 
-async def get_api(hass, host: str, port, retry = 0):
-    """Get the Freebox API."""
+async def get_api(hass, host: str, port, retry = 0, login = True):
+    """Get the Freebox API.
+
+    Without `login` and with a stored app token no request is sent, the
+    session is opened by the first request.
+
+    The stored app token is only dropped when the Freebox says it is invalid
+    (revoked from Freebox OS), then a new one is asked once. Other errors are
+    raised as is: the token may be fine and the Freebox only restarting.
+    """
 
     path = await async_get_path(hass, host)
     api = Freepybox(APP_DESC, path, api_version="latest")
     
     try:
         await api.open(host, port) 
+        await async_open_session(api)
         #loop = asyncio.get_running_loop()
         #await loop.run_in_executor(None, async_func_wrapper, api, host, port)
         
@@ -97,14 +758,17 @@ async def get_api(hass, host: str, port, retry = 0):
         #results = await asyncio.gather(*fetches)
         #res = await asyncio.create_task(api.open(host, port))
         #result = await hass.async_add_executor_job(async_func_wrapper, api, host, port)
-        
-        await api.system.get_config()
+
+        # Log in now so an invalid token is detected here, the callers then run their requests concurrently
+        if( login ):
+            await api.get_permissions()
     except AuthorizationError as error:
-        _LOGGER.error("AuthorizationError: Please accept the application authorization on your Freebox screen")
-        if( retry != 0 ):
+        if( retry != 0 or "invalid_token" not in str(error) or not await hass.async_add_executor_job(path.exists) ):
+            _LOGGER.error("AuthorizationError: Please accept the application authorization on your Freebox screen")
             raise error
+        _LOGGER.error("The Freebox revoked the application token, please accept the new authorization on your Freebox screen")
         await remove_config(hass, host)
-        return await get_api(hass, host, port, 1)
+        return await get_api(hass, host, port, 1, login)
     except InsufficientPermissionsError as error:
         _LOGGER.error("InsufficientPermissionsError: You need to browse http://mafreebox.freebox.fr/#Fbx.os.app.settings.Accounts and grant the access policy: \"Gestion de l'alarme et maison connectée\"")
         raise error
@@ -115,5 +779,5 @@ async def get_api(hass, host: str, port, retry = 0):
 async def remove_config(hass, host: str):
     freebox_path = Store(hass, STORAGE_VERSION, STORAGE_KEY).path
     token_file = Path(f"{freebox_path}/{slugify(host)}.conf")
-    os.remove(token_file)
+    await hass.async_add_executor_job(partial(token_file.unlink, missing_ok=True))
 
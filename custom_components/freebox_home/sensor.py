@@ -1,18 +1,30 @@
-from homeassistant.const import PERCENTAGE
-from homeassistant.components.sensor import SensorDeviceClass
-from .base_class import FreeboxBaseClass
-from .const import DOMAIN
+from homeassistant.const import PERCENTAGE, UnitOfTime
+from homeassistant.components.sensor import SensorDeviceClass, SensorEntity, SensorStateClass
+from homeassistant.helpers.entity import EntityCategory
+from .base_class import FreeboxBaseClass, async_track_nodes
+from .const import DOMAIN, VALUE_NOT_SET
+
+# key, name, unit, value from the metrics summary
+METRIC_SENSORS = [
+    ("request_rate",    "Requests per minute",  "req/min",                  lambda summary: summary["all"]["rate_per_minute"]),
+    ("latency_p50",     "Request latency p50",  UnitOfTime.MILLISECONDS,    lambda summary: summary["all"]["p50_ms"]),
+    ("latency_p95",     "Request latency p95",  UnitOfTime.MILLISECONDS,    lambda summary: summary["all"]["p95_ms"]),
+    ("latency_p99",     "Request latency p99",  UnitOfTime.MILLISECONDS,    lambda summary: summary["all"]["p99_ms"]),
+    ("request_errors",  "Request errors",       None,                       lambda summary: sum(summary["all"]["errors"].values())),
+    ("poll_overruns",   "Poll overruns",        None,                       lambda summary: summary["poll_overruns"]),
+]
 
 async def async_setup_entry(hass, config_entry, async_add_entities):
     router = hass.data[DOMAIN][config_entry.unique_id]
-    entities = []
 
-    for nodeId, node in router.nodes.items():
-        battery_node = next(filter(lambda x: (x["name"]=="battery" and x["ep_type"]=="signal"), node["show_endpoints"]), None)
-        if( battery_node != None and battery_node.get("value", None) != None):
-            entities.append(FreeboxBatterySensor(hass, router, node, battery_node))
+    def build(node):
+        battery_node = node.endpoints.get("signal", "battery")
+        if( battery_node != None and battery_node.value not in (None, VALUE_NOT_SET) ):
+            return [FreeboxBatterySensor(hass, router, node, battery_node)]
+        return []
 
-    async_add_entities(entities, True)
+    async_track_nodes(hass, config_entry, router, async_add_entities, build)
+    async_add_entities([FreeboxMetricSensor(router, key, name, unit, value) for key, name, unit, value in METRIC_SENSORS], True)
 
 
 class FreeboxBatterySensor(FreeboxBaseClass):
@@ -20,6 +32,7 @@ class FreeboxBatterySensor(FreeboxBaseClass):
     def __init__(self, hass, router, node, sub_node) -> None:
         """Initialize a Pir"""
         super().__init__(hass, router, node, sub_node)
+        self._battery = sub_node
 
     @property
     def device_class(self):
@@ -29,9 +42,38 @@ class FreeboxBatterySensor(FreeboxBaseClass):
     @property
     def state(self):
         """Return the current state of the device."""
-        return self.get_node_value(self._router.nodes[self._id]["show_endpoints"],"signal","battery")
+        return self._battery.value
 
     @property
     def unit_of_measurement(self):
         """Return the unit_of_measurement of the device."""
-        return PERCENTAGE
\ No newline at end of file
+        return PERCENTAGE
+
+
+class FreeboxMetricSensor(SensorEntity):
+    """Diagnostic sensor computed from the request metrics, read every 30 seconds."""
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_state_class = SensorStateClass.MEASUREMENT
+
+    def __init__(self, router, key, name, unit, value) -> None:
+        self._router = router
+        self._value = value
+        self._attr_name = "Freebox Home " + name
+        self._attr_unique_id = f"{router.mac}-metrics-{key}"
+        self._attr_native_unit_of_measurement = unit
+        self._attr_device_info = router.device_info
+        if( unit is None ):
+            # Counters since the start
+            self._attr_state_class = SensorStateClass.TOTAL_INCREASING
+        self._summary = None
+
+    async def async_update(self) -> None:
+        self._summary = self._router.executor.metrics.summary()
+        self._attr_native_value = self._value(self._summary)
+
+    @property
+    def extra_state_attributes(self):
+        """Return the figures of each kind of request."""
+        if( self._summary is None ):
+            return None
+        return self._summary["operations"]
@@ -0,0 +1,126 @@
+"""Services acting on several Freebox Home devices at once."""
+import logging
+
+from typing import Dict, List
+
+import voluptuous as vol
+
+from homeassistant.const import ATTR_ENTITY_ID, CONF_HOST
+from homeassistant.core import HomeAssistant, ServiceCall
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers import config_validation as cv
+
+from .const import DOMAIN, SERVICE_BATCH_SET, SERVICE_MOVE_COVERS, SERVICE_PROFILE, PROFILE_DEFAULT_DURATION, PROFILE_SLOW_THRESHOLD
+from .profiler import get_profiler
+from .router import FreeboxRouter
+
+_LOGGER = logging.getLogger(__name__)
+
+ATTR_WRITES         = "writes"
+ATTR_NODE_ID        = "node_id"
+ATTR_ENDPOINT_ID    = "endpoint_id"
+ATTR_VALUE          = "value"
+ATTR_POSITION       = "position"
+ATTR_DURATION       = "duration"
+ATTR_THRESHOLD      = "threshold"
+
+BATCH_SET_SCHEMA = vol.Schema(
+    {
+        vol.Optional(CONF_HOST): cv.string,
+        vol.Required(ATTR_WRITES): vol.All(
+            cv.ensure_list,
+            [
+                vol.Schema(
+                    {
+                        vol.Required(ATTR_NODE_ID): vol.Coerce(int),
+                        vol.Required(ATTR_ENDPOINT_ID): vol.Coerce(int),
+                        vol.Optional(ATTR_VALUE): vol.Any(None, bool, int, float, str),
+                    }
+                )
+            ],
+        ),
+    }
+)
+
+MOVE_COVERS_SCHEMA = vol.Schema(
+    {
+        vol.Required(ATTR_ENTITY_ID): cv.entity_ids,
+        vol.Required(ATTR_POSITION): vol.All(vol.Coerce(int), vol.Range(min=0, max=100)),
+    }
+)
+
+
+PROFILE_SCHEMA = vol.Schema(
+    {
+        vol.Optional(ATTR_DURATION, default=PROFILE_DEFAULT_DURATION): vol.All(vol.Coerce(float), vol.Range(min=1, max=600)),
+        vol.Optional(ATTR_THRESHOLD, default=PROFILE_SLOW_THRESHOLD * 1000): vol.All(vol.Coerce(float), vol.Range(min=1)),
+    }
+)
+
+
+def _get_router(hass: HomeAssistant, host=None) -> FreeboxRouter:
+    routers = {
+        entry.data[CONF_HOST]: hass.data[DOMAIN][entry.unique_id]
+        for entry in hass.config_entries.async_entries(DOMAIN)
+        if entry.unique_id in hass.data.get(DOMAIN, {})
+    }
+    if host is not None:
+        if host not in routers:
+            raise HomeAssistantError(f"No Freebox set up for {host}")
+        return routers[host]
+    if len(routers) != 1:
+        raise HomeAssistantError("Several Freebox are set up, give the host to use")
+    return next(iter(routers.values()))
+
+
+def _raise_failures(failures) -> None:
+    if failures:
+        raise HomeAssistantError(
+            "Freebox writes failed: "
+            + ", ".join(f"{node_id}/{endpoint_id} ({error!r})" for (node_id, endpoint_id, _), error in failures)
+        )
+
+
+async def async_setup_services(hass: HomeAssistant) -> None:
+    """Register the domain services."""
+
+    async def async_batch_set(call: ServiceCall) -> None:
+        router = _get_router(hass, call.data.get(CONF_HOST))
+        writes = [(write[ATTR_NODE_ID], write[ATTR_ENDPOINT_ID], write.get(ATTR_VALUE)) for write in call.data[ATTR_WRITES]]
+        errors = await router.async_batch_set(writes)
+        _raise_failures([(write, error) for write, error in zip(writes, errors) if error is not None])
+
+    async def async_move_covers(call: ServiceCall) -> None:
+        position = call.data[ATTR_POSITION]
+        routers = [hass.data[DOMAIN][entry.unique_id] for entry in hass.config_entries.async_entries(DOMAIN)
+                   if entry.unique_id in hass.data.get(DOMAIN, {})]
+        groups: Dict[FreeboxRouter, List] = {}
+        for entity_id in call.data[ATTR_ENTITY_ID]:
+            router = next((router for router in routers if entity_id in router.covers), None)
+            if router is None:
+                _LOGGER.warning("%s is not a Freebox Home cover", entity_id)
+                continue
+            groups.setdefault(router, []).append(router.covers[entity_id])
+
+        failures = []
+        for router, covers in groups.items():
+            writes = [cover.position_write(position) for cover in covers]
+            errors = await router.async_batch_set(writes)
+            for cover, write, error in zip(covers, writes, errors):
+                if error is None:
+                    cover.start_motion(cover.motion_target(position))
+                else:
+                    failures.append((write, error))
+        _raise_failures(failures)
+
+    async def async_profile(call: ServiceCall) -> None:
+        try:
+            path = await profiler.async_profile(call.data[ATTR_DURATION], call.data[ATTR_THRESHOLD] / 1000)
+        except RuntimeError as error:
+            raise HomeAssistantError(str(error)) from error
+        _LOGGER.warning("Freebox Home profile written to %s", path)
+
+    profiler = get_profiler(hass)
+    hass.services.async_register(DOMAIN, SERVICE_BATCH_SET, profiler.wrap(async_batch_set, "service batch_set"), schema=BATCH_SET_SCHEMA)
+    hass.services.async_register(DOMAIN, SERVICE_MOVE_COVERS, profiler.wrap(async_move_covers, "service move_covers"), schema=MOVE_COVERS_SCHEMA)
+    hass.services.async_register(DOMAIN, SERVICE_PROFILE, async_profile, schema=PROFILE_SCHEMA)
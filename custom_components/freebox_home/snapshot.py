@@ -0,0 +1,89 @@
+"""Cache of the camera snapshots, so concurrent requests share one decode."""
+import asyncio
+import logging
+
+from datetime import timedelta
+from typing import Awaitable, Callable, Optional
+
+from homeassistant.core import callback
+from homeassistant.helpers.event import async_track_time_interval
+
+from .const import SNAPSHOT_VIEWER_LEASE
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class SnapshotCache:
+    """Latest JPEG of a camera, reused for `max_age` seconds.
+
+    Requests arriving while a snapshot is being taken wait for that one
+    instead of starting another decoder. With `refresh` enabled, each request
+    also renews a viewer lease of SNAPSHOT_VIEWER_LEASE: while it runs the
+    snapshot is taken again every `max_age` seconds in the background, so
+    viewers are served from the cache without waiting for the decoder.
+    """
+
+    def __init__(self, hass, fetch: Callable[[], Awaitable[Optional[bytes]]], max_age: float, refresh: bool = False) -> None:
+        self._hass = hass
+        self._fetch = fetch
+        self.max_age = max_age
+        self.refresh = refresh and max_age > 0
+        self._image: Optional[bytes] = None
+        self._taken = 0.0
+        self._task: Optional[asyncio.Future] = None
+        self._last_request = 0.0
+        self._unsub_refresh = None
+
+        self.requests = 0
+        self.decodes = 0
+
+    @property
+    def image(self) -> Optional[bytes]:
+        """Last snapshot, whatever its age."""
+        return self._image
+
+    async def async_get(self) -> Optional[bytes]:
+        """Return a snapshot younger than max_age, taking a new one if needed."""
+        now = self._hass.loop.time()
+        self.requests += 1
+        self._last_request = now
+        if self.refresh and self._unsub_refresh is None:
+            self._unsub_refresh = async_track_time_interval(self._hass, self._async_refresh, timedelta(seconds=self.max_age))
+
+        if self._image is not None and now - self._taken < self.max_age:
+            return self._image
+        return await self._async_take()
+
+    async def _async_take(self) -> Optional[bytes]:
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._async_decode())
+            self._task.add_done_callback(self._task_done)
+        return await asyncio.shield(self._task)
+
+    @callback
+    def _task_done(self, task: asyncio.Future) -> None:
+        self._task = None
+
+    async def _async_decode(self) -> Optional[bytes]:
+        self.decodes += 1
+        image = await self._fetch()
+        if image is not None:
+            self._image = image
+            self._taken = self._hass.loop.time()
+        return image
+
+    async def _async_refresh(self, now=None) -> None:
+        if self._hass.loop.time() - self._last_request > SNAPSHOT_VIEWER_LEASE.total_seconds():
+            _LOGGER.debug("No more viewers, snapshot refresh stopped")
+            self.stop()
+            return
+        try:
+            await self._async_take()
+        except Exception as error:  # pylint: disable=broad-except
+            _LOGGER.debug("Unable to refresh the snapshot: %s", repr(error))
+
+    def stop(self) -> None:
+        """Stop the background refresh."""
+        if self._unsub_refresh is not None:
+            self._unsub_refresh()
+            self._unsub_refresh = None
@@ -4,14 +4,14 @@ from typing import Any
 import os
 
 from .const import DOMAIN
-from .base_class import FreeboxBaseClass
+from .base_class import FreeboxBaseClass, async_track_nodes
 
 from homeassistant.util import slugify
 from homeassistant.core import callback
+from homeassistant.helpers.dispatcher import async_dispatcher_send
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.components.switch import SwitchEntityDescription, SwitchEntity
 
-from .router import (get_path)
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -22,16 +22,16 @@ async def async_setup_entry(hass, entry: ConfigEntry, async_add_entities) -> Non
 
     router = hass.data[DOMAIN][entry.unique_id]
 
-    entities = []
-    for nodeId, node in router.nodes.items():
-        #if node["category"]=="basic_shutter":
-        #    entities.append(FreeboxShutterInvertSwitchEntity(hass, router, node))
-        if node["category"]=="shutter":
-            entities.append(FreeboxShutterInvertSwitchEntity(hass, router, node))
-        elif node["category"]=="opener":
-            entities.append(FreeboxShutterInvertSwitchEntity(hass, router, node))
-        
-    async_add_entities(entities, True)
+    def build(node):
+        #if node.category=="basic_shutter":
+        #    return [FreeboxShutterInvertSwitchEntity(hass, router, node)]
+        if node.category=="shutter":
+            return [FreeboxShutterInvertSwitchEntity(hass, router, node)]
+        elif node.category=="opener":
+            return [FreeboxShutterInvertSwitchEntity(hass, router, node)]
+        return []
+
+    async_track_nodes(hass, entry, router, async_add_entities, build)
 
 
 
@@ -46,17 +46,6 @@ class FreeboxShutterInvertSwitchEntity(FreeboxBaseClass, SwitchEntity):
         self._attr_icon = "mdi:directions-fork"
         self._name = "Inverser commandes"
 
-        self._state = False
-        self._path  = get_path(hass, self._unique_id + '_InvertSwitch')
-        
-        try:
-            value = self._path.read_text()
-            if( value == "1"):
-                self._state = True
-        except OSError as e:
-            return
-
-
     @property
     def translation_key(self):
         return "invert_switch"
@@ -64,15 +53,19 @@ class FreeboxShutterInvertSwitchEntity(FreeboxBaseClass, SwitchEntity):
     @property
     def is_on(self) -> bool | None:
         """Return True if entity is on."""
-        return self._state
+        return self._router.invert.get(self._id)
 
     async def async_turn_on(self, **kwargs: Any) -> None:
-        self._path.write_text('1')
-        self._state = True
+        self.set_invert(True)
 
     async def async_turn_off(self, **kwargs: Any) -> None:
-        self._path.write_text('0')
-        self._state = False
+        self.set_invert(False)
+
+    def set_invert(self, value: bool) -> None:
+        self._router.invert.set(self._id, value)
+        self.async_write_ha_state()
+        # Let the shutter of the node recompute its position
+        async_dispatcher_send(self.hass, self._router.signal_node_update(self._id), {"invert": value})
 
     @property
     def available(self) -> bool:
@@ -0,0 +1,25 @@
+"""Make the integration importable by the tests.
+
+The tested modules (push, camera_worker, ...) do not depend on Home
+Assistant. When it is not installed, the package is registered without
+running its __init__, which sets up the Home Assistant side.
+"""
+import sys
+import types
+
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+try:
+    import homeassistant  # noqa: F401
+except ImportError:
+    for name, path in (
+        ("custom_components", ROOT / "custom_components"),
+        ("custom_components.freebox_home", ROOT / "custom_components" / "freebox_home"),
+    ):
+        if name not in sys.modules:
+            package = types.ModuleType(name)
+            package.__path__ = [str(path)]
+            sys.modules[name] = package
@@ -0,0 +1,135 @@
+"""FfmpegFrameWorker on a small MJPEG file."""
+import asyncio
+import shutil
+import stat
+import sys
+
+import pytest
+
+from custom_components.freebox_home.camera_worker import FfmpegFrameWorker, split_jpegs
+
+FRAMES = [b"\xff\xd8" + bytes([index]) * 200 + b"\xff\xd9" for index in range(5)]
+
+# Stands in for ffmpeg: streams the MJPEG file given with -i, looped, at about 20 frames per second
+FAKE_FFMPEG = """#!{python}
+import sys, time
+data = open(sys.argv[sys.argv.index("-i") + 1], "rb").read()
+frames = [b"\\xff\\xd8" + part for part in data.split(b"\\xff\\xd8") if part]
+while True:
+    for frame in frames:
+        sys.stdout.buffer.write(frame)
+        sys.stdout.buffer.flush()
+        time.sleep(0.05)
+"""
+
+
+@pytest.fixture
+def mjpeg_file(tmp_path):
+    path = tmp_path / "sample.mjpeg"
+    path.write_bytes(b"".join(FRAMES))
+    return path
+
+
+@pytest.fixture
+def fake_ffmpeg(tmp_path):
+    path = tmp_path / "ffmpeg"
+    path.write_text(FAKE_FFMPEG.format(python=sys.executable))
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    return str(path)
+
+
+def test_split_jpegs_keeps_incomplete_frames():
+    buffer = bytearray(b"garbage" + FRAMES[0] + FRAMES[1][:50])
+    assert split_jpegs(buffer) == [FRAMES[0]]
+    buffer.extend(FRAMES[1][50:] + b"\xff")
+    assert split_jpegs(buffer) == [FRAMES[1]]
+    assert buffer == bytearray(b"\xff")
+
+
+def test_frames_from_a_file(fake_ffmpeg, mjpeg_file):
+    async def run():
+        worker = FfmpegFrameWorker(fake_ffmpeg, str(mjpeg_file), idle_timeout=5, start_timeout=5)
+        received = []
+        worker.add_listener(received.append)
+        try:
+            first = await worker.async_get_frame()
+            assert first in FRAMES
+            await asyncio.sleep(0.3)
+            assert worker.running
+            assert worker.starts == 1
+            assert len(received) >= 3
+            assert all(frame in FRAMES for frame in received)
+            assert await worker.async_get_frame() == received[-1]
+        finally:
+            await worker.async_stop()
+        assert not worker.running
+
+    asyncio.run(run())
+
+
+def test_stops_when_idle_and_restarts(fake_ffmpeg, mjpeg_file):
+    async def run():
+        worker = FfmpegFrameWorker(fake_ffmpeg, str(mjpeg_file), idle_timeout=0.3, start_timeout=5)
+        try:
+            assert await worker.async_get_frame() is not None
+            await asyncio.sleep(0.8)
+            assert not worker.running
+            assert await worker.async_get_frame() is not None
+            assert worker.starts == 2
+        finally:
+            await worker.async_stop()
+
+    asyncio.run(run())
+
+
+def test_missing_stream_returns_no_frame(tmp_path, fake_ffmpeg):
+    async def run():
+        worker = FfmpegFrameWorker(fake_ffmpeg, str(tmp_path / "missing.mjpeg"), idle_timeout=5, start_timeout=0.5)
+        try:
+            assert await worker.async_get_frame() is None
+        finally:
+            await worker.async_stop()
+
+    asyncio.run(run())
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg is not installed")
+def test_real_ffmpeg_test_source():
+    async def run():
+        worker = FfmpegFrameWorker(shutil.which("ffmpeg"), "testsrc=size=64x48:rate=5", fps=5,
+                                   idle_timeout=5, start_timeout=10, input_args=["-f", "lavfi"])
+        try:
+            frame = await worker.async_get_frame()
+            assert frame is not None and frame.startswith(b"\xff\xd8") and frame.endswith(b"\xff\xd9")
+        finally:
+            await worker.async_stop()
+
+    asyncio.run(run())
+
+
+def test_kept_running_past_the_idle_timeout(fake_ffmpeg, mjpeg_file):
+    """The camera touches the worker from the event loop every half idle timeout to keep its buffer filled."""
+    async def run():
+        loop = asyncio.get_running_loop()
+        worker = FfmpegFrameWorker(fake_ffmpeg, str(mjpeg_file), idle_timeout=0.4, start_timeout=5)
+        received = []
+        worker.add_listener(received.append)
+
+        def keep_alive():
+            worker.touch()
+            handle[0] = loop.call_later(worker.idle_timeout / 2, keep_alive)
+
+        handle = [None]
+        keep_alive()
+        try:
+            await asyncio.sleep(worker.idle_timeout * 3)
+            assert worker.running
+            assert worker.starts == 1
+            count = len(received)
+            await asyncio.sleep(0.2)
+            assert len(received) > count
+        finally:
+            handle[0].cancel()
+            await worker.async_stop()
+
+    asyncio.run(run())
@@ -0,0 +1,74 @@
+"""FreeboxRequestExecutor reading several endpoints with one request."""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from custom_components.freebox_home.executor import FreeboxReplyError, FreeboxRequestExecutor
+
+
+class FakeHome:
+    def __init__(self, values, with_ids=True):
+        self.values = values
+        self.with_ids = with_ids
+        self.requests = []
+
+    async def get_home_endpoint_values(self, endpoint_list):
+        self.requests.append(endpoint_list)
+        if self.with_ids:
+            return [{"node_id": item["node_id"], "ep_id": item["ep_id"],
+                     "value": self.values[(item["node_id"], item["ep_id"])]} for item in endpoint_list]
+        return [{"value": self.values[(item["node_id"], item["ep_id"])]} for item in endpoint_list]
+
+
+def make_executor(home):
+    return FreeboxRequestExecutor(SimpleNamespace(home=home), cache_ttl=10)
+
+
+def test_due_reads_are_sent_as_one_request():
+    home = FakeHome({(1, 2): True, (3, 4): 42, (5, 6): "open"})
+
+    async def run():
+        executor = make_executor(home)
+        values = await executor.get_home_endpoint_values([(1, 2), (3, 4), (5, 6)])
+        assert values == {(1, 2): True, (3, 4): 42, (5, 6): "open"}
+        assert len(home.requests) == 1
+        assert executor.requests == 1
+
+        # Cached values are not asked again
+        executor.invalidate(3)
+        assert await executor.get_home_endpoint_values([(1, 2), (3, 4)]) == {(1, 2): True, (3, 4): 42}
+        assert home.requests[1] == [{"node_id": 3, "ep_id": 4}]
+        assert await executor.get_home_endpoint_value(5, 6) == "open"
+        assert len(home.requests) == 2
+
+    asyncio.run(run())
+
+
+def test_values_without_ids_are_matched_by_position():
+    home = FakeHome({(1, 2): 10, (1, 3): 20}, with_ids=False)
+
+    async def run():
+        executor = make_executor(home)
+        assert await executor.get_home_endpoint_values([(1, 3), (1, 2)]) == {(1, 3): 20, (1, 2): 10}
+
+    asyncio.run(run())
+
+
+class FakeResponse:
+    """What Access returns for a reply which is not JSON."""
+
+
+def test_unexpected_replies_raise():
+    async def run():
+        for reply in ({"node_id": 1, "ep_id": 2, "value": 3}, FakeResponse()):
+            home = FakeHome({})
+
+            async def get_home_endpoint_values(endpoint_list, reply=reply):
+                return reply
+
+            home.get_home_endpoint_values = get_home_endpoint_values
+            with pytest.raises(FreeboxReplyError):
+                await make_executor(home).get_home_endpoint_values([(1, 2)])
+
+    asyncio.run(run())
@@ -0,0 +1,19 @@
+"""Frame ring buffer and export retention."""
+from custom_components.freebox_home.frame_buffer import FrameRingBuffer, export_frames, prune_exports
+
+
+def test_buffer_drops_the_oldest_frames():
+    frames = FrameRingBuffer(depth=3, max_bytes=25)
+    for index in range(5):
+        frames.append(bytes([index]) * 10)
+    assert [frame for _, frame in frames.freeze()] == [bytes([3]) * 10, bytes([4]) * 10]
+    assert frames.size == 20
+
+
+def test_exports_beyond_the_retention_are_deleted(tmp_path):
+    for name in ("20240101_120000", "20240101_120500", "20240102_080000", "20240103_090000"):
+        export_frames([(0.0, b"\xff\xd8\xff\xd9")], str(tmp_path / name))
+    assert prune_exports(str(tmp_path), 2) == 2
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["20240102_080000", "20240103_090000"]
+    assert prune_exports(str(tmp_path), 2) == 0
+    assert prune_exports(str(tmp_path / "missing"), 2) == 0
@@ -0,0 +1,31 @@
+"""ThrottledLog windows and summaries."""
+import logging
+
+from custom_components.freebox_home.log_throttle import ThrottledLog
+
+
+def test_repeats_are_summarized_and_logged_again(caplog):
+    caplog.set_level(logging.DEBUG)
+    sensors = logging.getLogger("test.sensors")
+    push = logging.getLogger("test.push")
+    throttled = ThrottledLog(summary_interval=3600)
+
+    for _ in range(3):
+        throttled.warning(sensors, "No value for %s", 12)
+    throttled.log(push, logging.ERROR, "Unable to log in")
+    throttled.log(push, logging.ERROR, "Unable to log in")
+    assert [record.getMessage() for record in caplog.records] == ["No value for 12", "Unable to log in"]
+
+    caplog.clear()
+    throttled.summarize()
+    summaries = {(record.name, record.levelno): record.getMessage() for record in caplog.records}
+    assert summaries[("test.sensors", logging.WARNING)].startswith("2 repeated messages")
+    assert "No value for 12 (x2)" in summaries[("test.sensors", logging.WARNING)]
+    assert summaries[("test.push", logging.ERROR)].startswith("1 repeated messages")
+
+    # A new window: the message is logged again, nothing to summarize without repeats
+    caplog.clear()
+    throttled.warning(sensors, "No value for %s", 12)
+    throttled.summarize()
+    assert [record.getMessage() for record in caplog.records] == ["No value for 12"]
+    assert throttled.counts == {"No value for 12": 4, "Unable to log in": 2}
@@ -0,0 +1,38 @@
+"""FreeboxMetrics rates and merged summary."""
+from custom_components.freebox_home import metrics as metrics_module
+from custom_components.freebox_home.const import METRICS_SAMPLES, METRICS_WINDOW
+from custom_components.freebox_home.metrics import FreeboxMetrics, OperationMetrics
+
+
+def test_rate_is_not_capped_by_the_kept_latencies():
+    operation = OperationMetrics()
+    requests = METRICS_SAMPLES * 2
+    for index in range(requests):
+        operation.record(1000 + index * (METRICS_WINDOW / 2) / requests, 0.01)
+    summary = operation.summary(1000 + METRICS_WINDOW / 2)
+    assert summary["rate_per_minute"] == round(requests * 60 / METRICS_WINDOW, 1)
+    assert summary["count"] == requests
+
+
+def test_old_requests_leave_the_rate():
+    operation = OperationMetrics()
+    for second in range(10):
+        operation.record(1000 + second, 0.01)
+    assert operation.requests(1009) == 10
+    assert operation.requests(1000 + METRICS_WINDOW + 4.5) == 5
+    assert operation.requests(1000 + METRICS_WINDOW * 2) == 0
+
+
+def test_all_sums_every_operation(monkeypatch):
+    monkeypatch.setattr(metrics_module.time, "monotonic", lambda: 2000.0)
+    metrics = FreeboxMetrics()
+    for index in range(METRICS_SAMPLES):
+        metrics.record("get_home_endpoint_value", 1900 + index / METRICS_SAMPLES, 0.01)
+    for index in range(30):
+        metrics.record("set_home_endpoint_value", 1950 + index, 1.0, ValueError())
+    summary = metrics.summary()
+    assert summary["all"]["count"] == METRICS_SAMPLES + 30
+    assert summary["all"]["errors"] == {"ValueError": 30}
+    assert summary["all"]["rate_per_minute"] == round((METRICS_SAMPLES + 30) * 60 / METRICS_WINDOW, 1)
+    assert summary["all"]["p99_ms"] == 1000.0
+    assert summary["operations"]["set_home_endpoint_value"]["p50_ms"] == 1000.0
@@ -0,0 +1,155 @@
+"""FreeboxEventStream against a local websocket server."""
+import asyncio
+
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from freebox_api.exceptions import AuthorizationError, HttpRequestError
+
+from custom_components.freebox_home.push import FreeboxEventStream
+
+
+def notification(node_id, endpoint_id, value):
+    return {"action": "notification", "source": "home", "success": True,
+            "result": {"node_id": node_id, "ep_id": endpoint_id, "value": value}}
+
+
+class FakeEventServer:
+    """Websocket playing one script per connection, the last one is repeated."""
+
+    def __init__(self, scripts):
+        self.scripts = scripts
+        self.connections = 0
+        self.registrations = []
+
+    async def handler(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        script = self.scripts[min(self.connections, len(self.scripts) - 1)]
+        self.connections += 1
+        self.registrations.append(await ws.receive_json())
+        for frame in script:
+            if frame == "close":
+                await ws.close()
+                return ws
+            if isinstance(frame, str):
+                await ws.send_str(frame)
+            else:
+                await ws.send_json(frame)
+        # Keep the socket open until the client leaves
+        async for _ in ws:
+            pass
+        return ws
+
+
+async def wait_for(predicate, timeout=3):
+    async def poll():
+        while not predicate():
+            await asyncio.sleep(0.01)
+    await asyncio.wait_for(poll(), timeout)
+
+
+async def run_stream(scripts, check, get_headers=None):
+    fake = FakeEventServer(scripts)
+    app = web.Application()
+    app.router.add_get("/ws/event", fake.handler)
+    server = TestServer(app)
+    await server.start_server()
+    values, states = [], []
+
+    async def default_headers():
+        return {"X-Fbx-App-Auth": "token"}
+
+    async with aiohttp.ClientSession() as session:
+        stream = FreeboxEventStream(
+            session, str(server.make_url("/ws/event")), get_headers or default_headers,
+            lambda *value: values.append(value), states.append, retry_delay=0.01, retry_max=0.05,
+        )
+        task = asyncio.ensure_future(stream.async_run())
+        try:
+            await check(fake, stream, values, states)
+            assert not task.done()
+        finally:
+            await stream.async_stop()
+            await asyncio.wait_for(task, 3)
+    await server.close()
+
+
+REGISTERED = {"action": "register", "success": True}
+
+
+def test_values_are_forwarded():
+    async def check(fake, stream, values, states):
+        await wait_for(lambda: len(values) == 2)
+        assert values == [(12, 4, True), (12, 5, 42)]
+        assert states == [True]
+        assert stream.connected
+        assert fake.registrations[0]["action"] == "register"
+
+    asyncio.run(run_stream([[REGISTERED, notification(12, 4, True), notification(12, 5, 42)]], check))
+
+
+def test_bad_frames_are_ignored():
+    frames = [
+        REGISTERED,
+        "not json",
+        "[1, 2]",
+        {"action": "notification", "source": "home", "result": {"value": 1}},
+        {"action": "notification", "source": "lan", "result": {"node_id": 1, "ep_id": 1}},
+        notification(3, 7, "open"),
+    ]
+
+    async def check(fake, stream, values, states):
+        await wait_for(lambda: len(values) == 1)
+        assert values == [(3, 7, "open")]
+        assert fake.connections == 1
+        assert stream.connected
+
+    asyncio.run(run_stream([frames], check))
+
+
+def test_reconnects_after_the_socket_closes():
+    scripts = [
+        [REGISTERED, notification(1, 2, 3), "close"],
+        [REGISTERED, notification(1, 2, 4)],
+    ]
+
+    async def check(fake, stream, values, states):
+        await wait_for(lambda: len(values) == 2)
+        assert values == [(1, 2, 3), (1, 2, 4)]
+        assert states == [True, False, True]
+        assert fake.connections == 2
+
+    asyncio.run(run_stream(scripts, check))
+
+
+def test_refused_registration_is_retried():
+    scripts = [
+        [{"action": "register", "success": False}],
+        [{"action": "register", "success": False}],
+        [REGISTERED, notification(8, 1, False)],
+    ]
+
+    async def check(fake, stream, values, states):
+        await wait_for(lambda: values)
+        assert fake.connections == 3
+        assert states == [True]
+
+    asyncio.run(run_stream(scripts, check))
+
+
+def test_login_errors_do_not_stop_the_stream():
+    errors = [AuthorizationError("Getting challenge failed"), HttpRequestError("Request failed")]
+
+    async def get_headers():
+        if errors:
+            raise errors.pop(0)
+        return {"X-Fbx-App-Auth": "token"}
+
+    async def check(fake, stream, values, states):
+        await wait_for(lambda: values)
+        assert not errors
+        assert fake.connections == 1
+        assert values == [(5, 6, 7)]
+
+    asyncio.run(run_stream([[REGISTERED, notification(5, 6, 7)]], check, get_headers))
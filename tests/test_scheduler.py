@@ -0,0 +1,68 @@
+"""FreeboxPollScheduler falling back to single reads."""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("homeassistant")
+
+from custom_components.freebox_home.executor import FreeboxRequestExecutor  # noqa: E402
+from custom_components.freebox_home.router import FreeboxPollScheduler, PollSubscription  # noqa: E402
+
+
+class FakeResponse:
+    """What Access returns for a reply which is not JSON."""
+
+
+class FakeHome:
+    def __init__(self, reply):
+        self.reply = reply
+        self.batch_reads = 0
+        self.single_reads = 0
+
+    async def get_home_endpoint_values(self, endpoint_list):
+        self.batch_reads += 1
+        return self.reply
+
+    async def get_home_endpoint_value(self, node_id, endpoint_id):
+        self.single_reads += 1
+        return {"value": node_id * 10 + endpoint_id}
+
+
+class FakeRouter:
+    available = True
+
+    def __init__(self, home):
+        self.executor = FreeboxRequestExecutor(SimpleNamespace(home=home), cache_ttl=0)
+
+    async def async_get_home_endpoint_values(self, keys):
+        return await self.executor.get_home_endpoint_values(keys)
+
+    async def async_get_home_endpoint_value(self, node_id, endpoint_id):
+        return await self.executor.get_home_endpoint_value(node_id, endpoint_id)
+
+    def _handle_polled_value(self, node_id, endpoint_id, value):
+        pass
+
+
+@pytest.mark.parametrize("reply", [{"result": "not a list"}, FakeResponse()])
+def test_unexpected_reply_falls_back_to_single_reads(reply):
+    async def run():
+        home = FakeHome(reply)
+        scheduler = FreeboxPollScheduler(SimpleNamespace(loop=asyncio.get_running_loop()), FakeRouter(home))
+        received = []
+        for key in ((1, 2), (3, 4)):
+            scheduler._subscriptions[key] = [PollSubscription(1, None, False, received.append)]
+
+        await scheduler._async_tick()
+        assert home.batch_reads == 1
+        assert sorted(received) == [12, 34]
+
+        # The batch read is not tried again
+        for subscriptions in scheduler._subscriptions.values():
+            subscriptions[0].next_due = 0
+        await scheduler._async_tick()
+        assert home.batch_reads == 1
+        assert home.single_reads == 4
+
+    asyncio.run(run())